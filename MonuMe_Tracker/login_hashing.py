@@ -0,0 +1,17 @@
+"""
+Worker entry points for the login hash pool in server.py.
+Kept free of Flask/SQLAlchemy/server imports so the pool's child processes only load
+werkzeug.security.
+"""
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+def verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def verify_and_rehash(pwhash, password, method):
+    """Verify, then rehash with `method` on success. Returns (ok, new_hash or None)."""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    return True, generate_password_hash(password, method=method)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Bring the database schema up to date.
+Applies the pending entries of SCHEMA_MIGRATIONS (create missing tables, add columns and
+indexes, seed the admin account) and records them in schema_version, exactly as the
+server does on startup. Deployments that set MONUME_MIGRATE_ON_START=0 run this once per
+release instead of in every worker.
+
+Usage:
+    python migrate_db.py            # apply pending migrations
+    python migrate_db.py --status   # show the applied and target schema versions
+
+Both modes then check that every hot query is answered by an index SEARCH and exit with
+status 1 if one is not, so a deploy pipeline can stop on a missing index.
+"""
+import argparse
+import os
+import sys
+
+# Importing server must not migrate on its own; this script does it explicitly below
+os.environ['MONUME_MIGRATE_ON_START'] = '0'
+
+from server import (SCHEMA_MIGRATIONS, SCHEMA_VERSION, app, check_hot_query_plans, current_schema_version, db,
+                    migrate_database)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations')
+    parser.add_argument('--status', action='store_true', help='only report the schema version')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.status:
+                problems = check_hot_query_plans()
+                current = current_schema_version()
+                print(f"Schema version {current} of {SCHEMA_VERSION}")
+                for version, description, _ in SCHEMA_MIGRATIONS:
+                    if version > current:
+                        print(f"  pending {version}: {description}")
+            else:
+                result = migrate_database()
+                if result['applied']:
+                    print(f"Applied {result['applied']} migration(s) in {result['elapsed_ms']} ms; "
+                          f"schema at version {result['version']}")
+                else:
+                    print(f"Schema already at version {result['version']}; nothing to do")
+                problems = result['plan_problems']
+        finally:
+            db.session.remove()
+    if problems:
+        print("Hot queries without an index SEARCH:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("Hot query plans: all use an index SEARCH")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Report the password hash methods stored for users and locations.
+Hashes that differ from MONUME_PASSWORD_HASH_METHOD are rewritten on the account's next
+successful login; this shows how far the accounts are from the target and, with
+--benchmark, what one verification costs per method so the target can be chosen against
+the login latency budget.
+
+Usage:
+    python password_hash_report.py                      # method distribution
+    python password_hash_report.py --benchmark          # plus verify time per method in use
+    python password_hash_report.py --benchmark --method pbkdf2:sha256:600000 --method scrypt:16384:8:1
+"""
+import argparse
+import statistics
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from server import app, db, password_hash_report, password_hash_target
+
+
+def benchmark(method, rounds):
+    """Milliseconds per check_password_hash call for a hash made with method: (median, max)."""
+    pwhash = generate_password_hash('benchmark-password', method=method)
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        check_password_hash(pwhash, 'benchmark-password')
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show stored password hash methods and their verify cost')
+    parser.add_argument('--benchmark', action='store_true', help='time one verification per method')
+    parser.add_argument('--method', action='append', default=[], help='extra candidate method to benchmark')
+    parser.add_argument('--rounds', type=int, default=5, help='verifications timed per method')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            report = password_hash_report()
+            target = password_hash_target()
+        finally:
+            db.session.remove()
+
+    total = sum(c['users'] + c['locations'] for c in report.values())
+    print(f"Target method: {target}")
+    print(f"{'method':<32} {'users':>7} {'locations':>9} {'share':>7}  status")
+    for method, counts in sorted(report.items(), key=lambda item: -(item[1]['users'] + item[1]['locations'])):
+        share = (counts['users'] + counts['locations']) / total if total else 0
+        status = 'target' if method == target else ('cannot verify' if method == 'plaintext' else 'upgrade on login')
+        print(f"{method:<32} {counts['users']:>7} {counts['locations']:>9} {share:>6.1%}  {status}")
+
+    if args.benchmark:
+        methods = [m for m in report if m != 'plaintext']
+        for method in [target] + args.method:
+            if method not in methods:
+                methods.append(method)
+        print(f"\nVerify cost over {args.rounds} rounds (single core):")
+        for method in methods:
+            try:
+                median_ms, max_ms = benchmark(method, args.rounds)
+            except ValueError as e:
+                print(f"{method:<32} unsupported: {e}")
+                continue
+            print(f"{method:<32} median {median_ms:8.1f} ms   max {max_ms:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,8 @@ import os
 import json
 from datetime import datetime
 
-from server import db, User, Location, TrackingData, TRINFO_DB_DIR
+from server import (db, User, Location, TrackingData, TRINFO_DB_DIR, rebuild_tracking_rollups,
+                    purge_trinfo_log_records)
 
 # Heuristics for demo/test detection
 DEMO_USERNAMES = {
@@ -46,11 +47,20 @@ def purge_trinfo_files():
     return removed
 
 
+def purge_trinfo_log(demo_usernames):
+    """Drop demo submissions from the append-only TRinfo day log."""
+    def is_demo_record(rec):
+        username = (rec.get('username') or '').lower()
+        return username in demo_usernames or username.startswith(('test', 'sales', 'manager', 'employee'))
+    return purge_trinfo_log_records(is_demo_record)
+
+
 def main():
     print('Purging demo data...')
     removed_users = 0
     removed_locations = 0
     removed_tracking = 0
+    demo_usernames = {name.lower() for name in DEMO_USERNAMES}
 
     # Remove demo tracking first to avoid FK issues
     for td in TrackingData.query.all():
@@ -59,11 +69,16 @@ def main():
         if (user and is_demo_user(user)) or (loc and is_demo_location(loc)):
             db.session.delete(td)
             removed_tracking += 1
+    # Rollups are totals of TrackingData; recompute them in the same transaction
+    if removed_tracking:
+        rebuild_tracking_rollups()
     db.session.commit()
 
     # Remove demo users
     for user in User.query.all():
         if is_demo_user(user):
+            if user.username:
+                demo_usernames.add(user.username.lower())
             db.session.delete(user)
             removed_users += 1
     db.session.commit()
@@ -77,11 +92,13 @@ def main():
 
     # Remove TRinfo files
     removed_files = purge_trinfo_files()
+    removed_log_records = purge_trinfo_log(demo_usernames)
 
     print(f'Removed users: {removed_users}')
     print(f'Removed locations: {removed_locations}')
     print(f'Removed tracking rows: {removed_tracking}')
     print(f'Removed TRinfo files: {removed_files}')
+    print(f'Removed TRinfo log records: {removed_log_records}')
 
 
 if __name__ == '__main__':
@@ -6,14 +6,23 @@ Production server for www.monumevip.com running on port 5000
 
 import os
 import sys
+import shlex
 import logging
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, send_from_directory, session, redirect, url_for, make_response, render_template_string
+from flask import Flask, request, jsonify, render_template, send_from_directory, session, redirect, url_for, make_response, render_template_string, Response, stream_with_context, g
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import json
+import csv
+import io
 import hashlib
 import secrets
+import bisect
+import threading
+import itertools
+import base64
+import time
+from collections import namedtuple
 from functools import wraps
 # Ensure configuration imports resolve both when running from the project root
 # and when executing within the `MonuMe_Tracker` package.
@@ -21,7 +30,32 @@ try:
     from config.production import ProductionConfig, DevelopmentConfig  # type: ignore
 except ModuleNotFoundError:
     from MonuMe_Tracker.config.production import ProductionConfig, DevelopmentConfig
+try:
+    import login_hashing
+except ModuleNotFoundError:
+    from MonuMe_Tracker import login_hashing
 from sqlalchemy import text
+from sqlalchemy import event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+
+# NumPy is optional: what-if pay simulations vectorize with it and fall back to the scalar engine
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# openpyxl is optional: without it XLSX uploads are rejected and CSV/JSON imports still work
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# fcntl is POSIX-only; without it TRinfo appends are serialized per process only
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Email helpers
 try:
@@ -168,7 +202,7 @@ def _current_location_id_for_request():
                 pass
         # Try current user location
         if 'user_id' in session:
-            user = User.query.get(session['user_id'])
+            user = current_principal().user
             if user and user.location_id:
                 return int(user.location_id)
     except Exception:
@@ -197,6 +231,323 @@ def trinfo_file_path(username: str, date_str: str) -> str:
     safe_date = make_safe_filename_component(date_str)
     return os.path.join(TRINFO_DB_DIR, f"{safe_user}_{safe_date}.json")
 
+
+class TrinfoDirIndex:
+    """date -> files and safe username -> files for TRINFO_DB_DIR, shared by the worker.
+
+    Built from a single os.scandir pass. The directory mtime only changes when files are
+    added or removed, so refresh() is a stat() call until that happens; then one more
+    scandir pass picks up new names and drops deleted ones.
+    """
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.mtime = None
+        self.names = set()
+        self.by_date = {}
+        self.by_user = {}
+        self.scans = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(name):
+        stem = name[:-len('.json')]
+        if '_' not in stem:
+            return None, None
+        safe_user, date_part = stem.rsplit('_', 1)
+        return safe_user, date_part
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.base_dir).st_mtime_ns
+        except OSError:
+            return self
+        if mtime == self.mtime:
+            return self
+        with self._lock:
+            if mtime == self.mtime:
+                return self
+            seen = set()
+            with os.scandir(self.base_dir) as it:
+                for entry in it:
+                    name = entry.name
+                    if not name.endswith('.json') or not entry.is_file():
+                        continue
+                    seen.add(name)
+                    if name in self.names:
+                        continue
+                    safe_user, date_part = self._split(name)
+                    if safe_user is None:
+                        continue
+                    self.by_date.setdefault(date_part, set()).add(name)
+                    self.by_user.setdefault(safe_user, set()).add(name)
+            for name in self.names - seen:
+                safe_user, date_part = self._split(name)
+                if safe_user is None:
+                    continue
+                self.by_date.get(date_part, set()).discard(name)
+                self.by_user.get(safe_user, set()).discard(name)
+            self.names = seen
+            self.mtime = mtime
+            self.scans += 1
+        return self
+
+    # Readers copy the sets under the lock: refresh() mutates them in place from other threads
+    def files_for_dates(self, dates, safe_user=None):
+        with self._lock:
+            per_day = [sorted(self.by_date.get(day, ())) for day in dates]
+        paths = []
+        for names in per_day:
+            for name in names:
+                if safe_user is not None and self._split(name)[0] != safe_user:
+                    continue
+                paths.append(os.path.join(self.base_dir, name))
+        return paths
+
+    def files_for_user(self, safe_user):
+        with self._lock:
+            names = sorted(self.by_user.get(safe_user, ()))
+        return [os.path.join(self.base_dir, n) for n in names]
+
+    def dates_with_files(self):
+        """Dates that have at least one legacy file, as a snapshot."""
+        with self._lock:
+            return {day for day, names in self.by_date.items() if names}
+
+    def all_files(self):
+        with self._lock:
+            names = sorted(self.names)
+        return [os.path.join(self.base_dir, n) for n in names]
+
+    def stats(self):
+        with self._lock:
+            return {'files': len(self.names), 'dates': len(self.by_date), 'users': len(self.by_user), 'scans': self.scans}
+
+
+trinfo_dir_index = TrinfoDirIndex(TRINFO_DB_DIR)
+
+# ===== TRinfo append-only log store =====
+# New submissions go to instance/TRinfo.log/<YYYY-MM-DD>.ndjson (one JSON record per line,
+# never rewritten) with a companion <YYYY-MM-DD>.idx holding one
+# "<safe_username>\t<offset>\t<length>" line per record. Appends cost O(1), range reads open
+# only the segments for the requested days, and per-user reads seek straight to their
+# records. The per-user JSON files above remain readable as history.
+TRINFO_LOG_DIR = os.path.join('instance', 'TRinfo.log')
+TRINFO_FSYNC = os.environ.get('MONUME_TRINFO_FSYNC', '1') != '0'
+
+
+def trinfo_segment_paths(date_str: str):
+    """Return (segment_path, index_path) for one day. Does not create anything."""
+    safe_date = make_safe_filename_component(date_str)
+    base = os.path.join(TRINFO_LOG_DIR, safe_date)
+    return f"{base}.ndjson", f"{base}.idx"
+
+
+def _atomic_write_bytes(path: str, data: bytes) -> None:
+    """Write data to a temp file in the same directory, fsync it and os.replace it over path."""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _rebuild_trinfo_index(segment_bytes: bytes) -> bytes:
+    lines = []
+    offset = 0
+    for raw in segment_bytes.splitlines(keepends=True):
+        try:
+            username = json.loads(raw.decode('utf-8')).get('username') or ''
+            lines.append(f"{make_safe_filename_component(username)}\t{offset}\t{len(raw)}\n")
+        except Exception:
+            pass
+        offset += len(raw)
+    return ''.join(lines).encode('utf-8')
+
+
+def _index_end_offset(index_path: str) -> int:
+    """Segment byte offset just past the last indexed record (0 for a missing/empty index)."""
+    try:
+        with open(index_path, 'rb') as idx:
+            idx.seek(0, os.SEEK_END)
+            size = idx.tell()
+            if size == 0:
+                return 0
+            idx.seek(max(0, size - 512))
+            tail = idx.read().rstrip(b'\n').rsplit(b'\n', 1)[-1]
+        _, offset, length = tail.decode('utf-8').split('\t')
+        return int(offset) + int(length)
+    except FileNotFoundError:
+        return 0
+    except Exception:
+        return -1
+
+
+def _repair_trinfo_segment(segment_path: str, index_path: str) -> None:
+    """Called with the segment lock held. Drops a torn trailing record left by a crashed
+    writer and rebuilds the index when it disagrees with the segment. Both files are
+    replaced atomically, so concurrent readers see either the old or the repaired copy."""
+    try:
+        size = os.path.getsize(segment_path)
+    except FileNotFoundError:
+        size = 0
+    if _index_end_offset(index_path) == size:
+        return
+    data = b''
+    if size:
+        with open(segment_path, 'rb') as seg:
+            data = seg.read()
+        cut = data.rfind(b'\n') + 1
+        if cut != len(data):
+            logger.warning(f"Truncating torn TRinfo record in {segment_path} ({len(data) - cut} bytes)")
+            data = data[:cut]
+            _atomic_write_bytes(segment_path, data)
+    _atomic_write_bytes(index_path, _rebuild_trinfo_index(data))
+
+
+class _TrinfoGroupWriter:
+    """Group commit for TRinfo appends.
+
+    Threads appending to the same day queue their records; the first one becomes the
+    leader, takes the segment's fcntl lock (shared with the other gunicorn workers),
+    writes every queued record with one write + fsync and wakes the rest. Bursts of
+    end-of-day submissions therefore cost one lock/fsync per batch instead of per record.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._active = set()
+        self.batches = 0
+        self.records = 0
+
+    def append(self, segment_path, index_path, line, safe_user):
+        item = {'line': line, 'user': safe_user, 'done': threading.Event(), 'error': None}
+        with self._lock:
+            self._queues.setdefault(segment_path, []).append(item)
+            leader = segment_path not in self._active
+            if leader:
+                self._active.add(segment_path)
+        if leader:
+            self._drain(segment_path, index_path)
+        else:
+            item['done'].wait()
+        if item['error'] is not None:
+            raise item['error']
+
+    def _drain(self, segment_path, index_path):
+        while True:
+            with self._lock:
+                batch = self._queues.pop(segment_path, [])
+                if not batch:
+                    self._active.discard(segment_path)
+                    return
+            try:
+                self._commit(segment_path, index_path, batch)
+            except Exception as e:
+                for item in batch:
+                    item['error'] = e
+            for item in batch:
+                item['done'].set()
+
+    def _commit(self, segment_path, index_path, batch):
+        with open(f"{segment_path[:-len('.ndjson')]}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                _repair_trinfo_segment(segment_path, index_path)
+                with open(segment_path, 'ab') as seg:
+                    offset = seg.seek(0, os.SEEK_END)
+                    entries = []
+                    for item in batch:
+                        entries.append(f"{item['user']}\t{offset}\t{len(item['line'])}\n")
+                        offset += len(item['line'])
+                    seg.write(b''.join(item['line'] for item in batch))
+                    seg.flush()
+                    if TRINFO_FSYNC:
+                        os.fsync(seg.fileno())
+                with open(index_path, 'a', encoding='utf-8') as idx:
+                    idx.write(''.join(entries))
+                    idx.flush()
+                    if TRINFO_FSYNC:
+                        os.fsync(idx.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        with self._lock:
+            self.batches += 1
+            self.records += len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {'batches': self.batches, 'records': self.records}
+
+
+trinfo_writer = _TrinfoGroupWriter()
+
+
+def append_trinfo_record(record: dict) -> str:
+    """Durably append one record to its day segment and index. Returns the segment path."""
+    os.makedirs(TRINFO_LOG_DIR, exist_ok=True)
+    segment_path, index_path = trinfo_segment_paths(record.get('date') or '')
+    line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+    safe_user = make_safe_filename_component(record.get('username') or '')
+    trinfo_writer.append(segment_path, index_path, line, safe_user)
+    return segment_path
+
+
+def _trinfo_segment_dates(start=None, end=None):
+    """Days that have a log segment, optionally limited to [start, end]."""
+    if start is not None and end is not None:
+        cur = start
+        while cur <= end:
+            day = cur.strftime('%Y-%m-%d')
+            if os.path.exists(os.path.join(TRINFO_LOG_DIR, f"{day}.ndjson")):
+                yield day
+            cur = cur + timedelta(days=1)
+        return
+    if not os.path.isdir(TRINFO_LOG_DIR):
+        return
+    for name in sorted(os.listdir(TRINFO_LOG_DIR)):
+        if name.endswith('.ndjson'):
+            yield name[:-len('.ndjson')]
+
+
+def _iter_trinfo_segment(day: str, username=None):
+    segment_path, index_path = trinfo_segment_paths(day)
+    if not os.path.exists(segment_path):
+        return
+    if username and os.path.exists(index_path):
+        safe_user = make_safe_filename_component(username)
+        with open(index_path, 'r', encoding='utf-8') as idx, open(segment_path, 'rb') as seg:
+            for entry in idx:
+                parts = entry.rstrip('\n').split('\t')
+                if len(parts) != 3 or parts[0] != safe_user:
+                    continue
+                try:
+                    seg.seek(int(parts[1]))
+                    yield json.loads(seg.read(int(parts[2])).decode('utf-8'))
+                except Exception:
+                    continue
+        return
+    safe_user = make_safe_filename_component(username) if username else None
+    with open(segment_path, 'rb') as seg:
+        for raw in seg:
+            try:
+                rec = json.loads(raw.decode('utf-8'))
+            except Exception:
+                continue
+            if safe_user and make_safe_filename_component(rec.get('username') or '') != safe_user:
+                continue
+            yield rec
+
+
+def iter_trinfo_log_records(start=None, end=None, username=None):
+    """Yield log-store records for [start, end] (dates) or all days, optionally for one user."""
+    for day in _trinfo_segment_dates(start, end):
+        yield from _iter_trinfo_segment(day, username)
+
 @app.route('/', defaults={'path': ''}, methods=['OPTIONS'])
 @app.route('/<path:path>', methods=['OPTIONS'])
 def handle_options(path):
@@ -223,6 +574,8 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Bumped whenever role/location/active/password change; invalidates session auth snapshots
+    auth_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     
     # Relationships
     location = db.relationship('Location', backref='users')
@@ -244,6 +597,7 @@ class Location(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    auth_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     
     def __repr__(self):
         return f'<Location {self.name}>'
@@ -287,6 +641,11 @@ class TrackingData(db.Model):
     # Relationships
     user = db.relationship('User', backref='tracking_data')
     location = db.relationship('Location', backref='tracking_data')
+
+    __table_args__ = (
+        db.Index('ix_tracking_data_location_date', 'location_id', 'date'),
+        db.Index('ix_tracking_data_user_date', 'user_id', 'date'),
+    )
     
     def __repr__(self):
         return f'<TrackingData {self.user_id} - {self.date}>'
@@ -314,6 +673,123 @@ class TrackingData(db.Model):
             'timestamp': self.timestamp.isoformat() if self.timestamp else None
         }
 
+
+# Response schema v2 (?v=2): one snake_case key per column, serialized straight from
+# projected row tuples instead of hydrating TrackingData objects.
+TRACKING_V2_FIELDS = ('id', 'user_id', 'location_id', 'date', 'opal_demos', 'opal_sales',
+                      'scan_demos', 'scan_sold', 'net_sales', 'hours_worked', 'timestamp')
+
+
+def tracking_v2_fields(fields_param):
+    """Parse ?fields=a,b,c into a validated projection; None if any name is unknown."""
+    if not fields_param:
+        return list(TRACKING_V2_FIELDS)
+    fields = [f.strip() for f in fields_param.split(',') if f.strip()]
+    if not fields or any(f not in TRACKING_V2_FIELDS for f in fields):
+        return None
+    return fields
+
+
+def tracking_v2_rows(query, fields):
+    """Yield plain tuples for `fields` from a TrackingData query, JSON-ready."""
+    converters = []
+    for f in fields:
+        if f == 'date':
+            converters.append(lambda v: v.strftime('%Y-%m-%d') if v else None)
+        elif f == 'timestamp':
+            converters.append(lambda v: v.isoformat() if v else None)
+        else:
+            converters.append(None)
+    projected = query.with_entities(*[getattr(TrackingData, f) for f in fields])
+    for row in projected.yield_per(1000):
+        yield tuple(v if conv is None else conv(v) for conv, v in zip(converters, row))
+
+
+TRACKING_ROLLUP_METRICS = ('opal_demos', 'opal_sales', 'scan_demos', 'scan_sold', 'net_sales', 'hours_worked')
+
+
+class TrackingDailyRollup(db.Model):
+    """TrackingData totals per (location, user, day), maintained on every tracking write."""
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    entries = db.Column(db.Integer, default=0, nullable=False)
+    opal_demos = db.Column(db.Integer, default=0, nullable=False)
+    opal_sales = db.Column(db.Integer, default=0, nullable=False)
+    scan_demos = db.Column(db.Integer, default=0, nullable=False)
+    scan_sold = db.Column(db.Integer, default=0, nullable=False)
+    net_sales = db.Column(db.Float, default=0.0, nullable=False)
+    hours_worked = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('location_id', 'user_id', 'date', name='uq_tracking_daily_rollup'),
+        db.Index('ix_tracking_daily_rollup_location_date', 'location_id', 'date'),
+    )
+
+    def to_dict(self):
+        out = {
+            'location_id': self.location_id,
+            'user_id': self.user_id,
+            'date': self.date.strftime('%Y-%m-%d'),
+            'entries': self.entries,
+        }
+        out.update({m: getattr(self, m) for m in TRACKING_ROLLUP_METRICS})
+        return out
+
+
+class TrackingWeeklyRollup(db.Model):
+    """TrackingData totals per (location, ISO week)."""
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), nullable=False)
+    iso_year = db.Column(db.Integer, nullable=False)
+    iso_week = db.Column(db.Integer, nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+    entries = db.Column(db.Integer, default=0, nullable=False)
+    opal_demos = db.Column(db.Integer, default=0, nullable=False)
+    opal_sales = db.Column(db.Integer, default=0, nullable=False)
+    scan_demos = db.Column(db.Integer, default=0, nullable=False)
+    scan_sold = db.Column(db.Integer, default=0, nullable=False)
+    net_sales = db.Column(db.Float, default=0.0, nullable=False)
+    hours_worked = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('location_id', 'iso_year', 'iso_week', name='uq_tracking_weekly_rollup'),
+    )
+
+    def to_dict(self):
+        out = {
+            'location_id': self.location_id,
+            'iso_year': self.iso_year,
+            'iso_week': self.iso_week,
+            'week_start': self.week_start.strftime('%Y-%m-%d'),
+            'entries': self.entries,
+        }
+        out.update({m: getattr(self, m) for m in TRACKING_ROLLUP_METRICS})
+        return out
+
+class AuthRevocation(db.Model):
+    """Append-only log of auth changes; workers poll it to invalidate session snapshots."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)  # 'user' or 'location'
+    principal_id = db.Column(db.Integer, nullable=False)
+    auth_version = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SchemaVersion(db.Model):
+    """One row per applied entry of SCHEMA_MIGRATIONS."""
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class WorkerLease(db.Model):
+    """Time-limited cross-process lease for background jobs on hosts without fcntl."""
+    __tablename__ = 'worker_lease'
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(128))
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 # ===== Commission and Unified Metrics: New Data Models =====
 class PayPeriod(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -399,7 +875,19 @@ class RawImport(db.Model):
     file_hash = db.Column(db.String(128), unique=True, nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(32), default='parsed')
+    # Legacy: full row dump from the old in-memory importer; new imports leave it empty
     parsed_rows = db.Column(db.JSON, nullable=True)
+    rows_parsed = db.Column(db.Integer, default=0)
+    rows_upserted = db.Column(db.Integer, default=0)
+    rows_skipped = db.Column(db.Integer, default=0)
+    rows_unchanged = db.Column(db.Integer, default=0)
+    errors = db.Column(db.JSON, nullable=True)
+    # Background job bookkeeping: status moves queued -> running -> completed/failed
+    spool_path = db.Column(db.String(512), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    # Refreshed by the runner after every chunk; staleness is measured from here
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
 
     user = db.relationship('User', backref='raw_imports')
 
@@ -411,6 +899,16 @@ class RawImport(db.Model):
             'file_hash': self.file_hash,
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None,
             'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'progress': {
+                'rows_parsed': self.rows_parsed or 0,
+                'rows_upserted': self.rows_upserted or 0,
+                'rows_skipped': self.rows_skipped or 0,
+                'rows_unchanged': self.rows_unchanged or 0,
+                'errors': self.errors or [],
+            },
         }
 
 
@@ -444,14 +942,176 @@ class SalesHours(db.Model):
         }
 
 
+class DailyPay(db.Model):
+    """Materialized output of compute_daily_pay for one user, day and pay period.
+    Rows are marked dirty when Demos, SalesHours or tiers change and rebuilt on read
+    or through /api/recompute.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    pay_period_id = db.Column(db.Integer, db.ForeignKey('pay_period.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    sales = db.Column(db.Integer, default=0, nullable=False)
+    hours = db.Column(db.Numeric(5, 2), default=0, nullable=False)
+    demos = db.Column(db.Integer, default=0, nullable=False)
+    has_sales_hours = db.Column(db.Boolean, default=False, nullable=False)
+    has_demos = db.Column(db.Boolean, default=False, nullable=False)
+    unlocked_tier_id = db.Column(db.Integer, nullable=True)
+    tier_type = db.Column(db.String(16), default='hourly', nullable=False)
+    hourly_rate = db.Column(db.Numeric(6, 2), default=0, nullable=False)
+    commission_rate_pct = db.Column(db.Numeric(5, 2), default=0, nullable=False)
+    demo_bonus = db.Column(db.Numeric(6, 2), default=0, nullable=False)
+    computed_pay = db.Column(db.Numeric(10, 2), default=0, nullable=False)
+    cumulative_sales = db.Column(db.Integer, default=0, nullable=False)
+    dirty = db.Column(db.Boolean, default=False, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'pay_period_id', 'date', name='uq_dailypay_user_period_date'),
+    )
+
+    def to_metrics_dict(self):
+        """Row shape served by /api/daily-metrics."""
+        return {
+            'date': self.date.strftime('%Y-%m-%d'),
+            'user_id': self.user_id,
+            'sales': int(self.sales or 0),
+            'hours': float(self.hours or 0),
+            'demos': int(self.demos or 0),
+            'unlocked_tier_id': self.unlocked_tier_id,
+            'tier_type': self.tier_type or 'hourly',
+            'hourly_rate': float(self.hourly_rate or 0),
+            'commission_rate_pct': float(self.commission_rate_pct or 0),
+            'demo_bonus': float(self.demo_bonus or 0),
+            'computed_pay': float(self.computed_pay or 0),
+            'notes': None,
+            'source_flags': {
+                'has_sales_hours': bool(self.has_sales_hours),
+                'has_demos': bool(self.has_demos),
+            }
+        }
+
+
+# ===== Tier Schedule Cache =====
+# Tiers change a few times a month but are read once per user per day in salary views.
+# Each worker keeps a snapshot of every user's active tiers, grouped by effective_from so
+# the tiers in force on a date are found by bisect. Tier endpoints invalidate entries
+# after commit; the TTL bounds staleness for writes made by other workers.
+TIER_CACHE_TTL_SECONDS = int(os.environ.get('MONUME_TIER_CACHE_TTL', '60'))
+
+TierSnapshot = namedtuple('TierSnapshot', [
+    'id', 'user_id', 'sales_goal_in_period', 'daily_demo_min', 'tier_type', 'hourly_rate',
+    'commission_rate_pct', 'demo_bonus', 'effective_from', 'order_index',
+])
+
+
+class TierIndex:
+    """A user's active tiers keyed by effective_from breakpoints."""
+    __slots__ = ('breakpoints', 'tiers_by_breakpoint', 'loaded_at')
+
+    def __init__(self, tiers, loaded_at=0.0):
+        dated = sorted((t for t in tiers if t.effective_from is not None), key=lambda t: t.effective_from)
+        self.breakpoints = sorted({t.effective_from for t in dated})
+        self.tiers_by_breakpoint = []
+        for bp in self.breakpoints:
+            in_force = [t for t in dated if t.effective_from <= bp]
+            in_force.sort(key=lambda t: (int(t.order_index or 0), int(t.sales_goal_in_period or 0), t.id))
+            self.tiers_by_breakpoint.append(in_force)
+        self.loaded_at = loaded_at
+
+    def all_tiers(self):
+        """Every active tier in selection order."""
+        return list(self.tiers_by_breakpoint[-1]) if self.tiers_by_breakpoint else []
+
+    def for_date(self, on_date):
+        """Active tiers on `on_date` in selection order (order_index, sales goal, id)."""
+        idx = bisect.bisect_right(self.breakpoints, on_date) - 1
+        return self.tiers_by_breakpoint[idx] if idx >= 0 else []
+
+
+_tier_cache = {}
+_tier_cache_lock = threading.Lock()
+_tier_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+# Bumped by every invalidation; a load that raced an invalidation is not cached
+_tier_cache_generation = [0]
+
+
+def _snapshot_tier(t):
+    return TierSnapshot(
+        id=t.id,
+        user_id=t.user_id,
+        sales_goal_in_period=int(t.sales_goal_in_period or 0),
+        daily_demo_min=int(t.daily_demo_min or 0),
+        tier_type=t.tier_type or 'hourly',
+        hourly_rate=t.hourly_rate,
+        commission_rate_pct=t.commission_rate_pct,
+        demo_bonus=t.demo_bonus,
+        effective_from=t.effective_from,
+        order_index=int(t.order_index or 0),
+    )
+
+
+def get_tier_indexes(user_ids, fresh=False):
+    """Return {user_id: TierIndex}, loading all cache misses in a single query.
+
+    The cache is per process, so a tier edit made in another worker is only seen after
+    TIER_CACHE_TTL_SECONDS. Pass fresh=True when the result is going to be stored
+    (DailyPay materialization) to read the tiers from the DB.
+    """
+    now = time.monotonic()
+    result = {}
+    missing = []
+    with _tier_cache_lock:
+        generation = _tier_cache_generation[0]
+        for uid in user_ids:
+            entry = None if fresh else _tier_cache.get(uid)
+            if entry is not None and now - entry.loaded_at < TIER_CACHE_TTL_SECONDS:
+                result[uid] = entry
+                _tier_cache_stats['hits'] += 1
+            else:
+                missing.append(uid)
+                _tier_cache_stats['misses'] += 1
+    if missing:
+        rows = (UserTierSchedule.query
+                .filter(UserTierSchedule.user_id.in_(missing),
+                        UserTierSchedule.active == True)
+                .all())
+        grouped = {uid: [] for uid in missing}
+        for t in rows:
+            grouped[t.user_id].append(_snapshot_tier(t))
+        with _tier_cache_lock:
+            cacheable = _tier_cache_generation[0] == generation
+            for uid, tiers in grouped.items():
+                entry = TierIndex(tiers, loaded_at=now)
+                if cacheable:
+                    _tier_cache[uid] = entry
+                result[uid] = entry
+    return result
+
+
+def invalidate_tier_cache(user_id=None):
+    """Drop one user's cached tiers (or all of them). Call after committing tier writes."""
+    with _tier_cache_lock:
+        if user_id is None:
+            _tier_cache.clear()
+        else:
+            _tier_cache.pop(user_id, None)
+        _tier_cache_generation[0] += 1
+        _tier_cache_stats['invalidations'] += 1
+
+
+def tier_cache_stats():
+    with _tier_cache_lock:
+        stats = dict(_tier_cache_stats)
+        stats['entries'] = len(_tier_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
+
+
 # ===== Commission Computation Helpers =====
 def _get_active_tiers_for_user(user_id: int, on_date: datetime.date):
-    return (UserTierSchedule.query
-            .filter(UserTierSchedule.user_id == user_id,
-                    UserTierSchedule.active == True,
-                    UserTierSchedule.effective_from <= on_date)
-            .order_by(UserTierSchedule.order_index.asc(), UserTierSchedule.sales_goal_in_period.asc())
-            .all())
+    return get_tier_indexes([user_id])[user_id].for_date(on_date)
 
 
 def _select_best_tier_by_pay(candidates_with_pay):
@@ -465,26 +1125,14 @@ def _select_best_tier_by_pay(candidates_with_pay):
     ), reverse=True)[0]['tier']
 
 
-def compute_daily_pay(user_id: int, day: datetime.date, pay_period: PayPeriod):
-    # a) cumulative sales in period up to day
-    cumulative_sales = (db.session.query(db.func.coalesce(db.func.sum(SalesHours.sales), 0))
-                        .filter(SalesHours.user_id == user_id,
-                                SalesHours.date >= pay_period.start_date,
-                                SalesHours.date <= day)
-                        .scalar()) or 0
-
-    # b) demos on day
-    demos_row = Demos.query.filter_by(user_id=user_id, date=day).first()
-    demos_today = int(demos_row.demos) if demos_row else 0
-
-    # c) hours on day
-    sh_row = SalesHours.query.filter_by(user_id=user_id, date=day).first()
-    hours_today = float(sh_row.hours) if sh_row else 0.0
-    sales_today = int(sh_row.sales) if sh_row else 0
+def _evaluate_daily_pay(tiers, sales_today: int, hours_today: float, demos_today: int, cumulative_sales: int):
+    """Pick the unlocked tier for one day and compute pay from already-loaded inputs.
 
-    # d) candidate tiers (same-day sales goal; min demo optional)
-    tiers = _get_active_tiers_for_user(user_id, day)
-    unlocked = None
+    `tiers` must be the active tiers for the day in `_get_active_tiers_for_user` order
+    (ORM rows or TierSnapshot tuples).
+    Shared by `compute_daily_pay` and the batched period engine so both stay identical.
+    """
+    # candidate tiers (same-day sales goal; min demo optional)
     candidates_with_pay = []
     for t in tiers:
         goal = int(t.sales_goal_in_period or 0)
@@ -526,7 +1174,7 @@ def compute_daily_pay(user_id: int, day: datetime.date, pay_period: PayPeriod):
         'unlocked_tier_id': unlocked_id,
         'hourly_rate': round(hourly_rate, 2),
         'tier_type': tier_type,
-        'commission_rate_pct': round(commission_rate_pct, 2) if 'commission_rate_pct' in locals() else 0.0,
+        'commission_rate_pct': round(commission_rate_pct, 2),
         'demo_bonus': round(demo_bonus, 2),
         'computed_pay': round(pay, 2),
         'cumulative_sales': int(cumulative_sales),
@@ -535,110 +1183,448 @@ def compute_daily_pay(user_id: int, day: datetime.date, pay_period: PayPeriod):
         'sales_today': int(sales_today),
     }
 
+
+def compute_daily_pay(user_id: int, day: datetime.date, pay_period: PayPeriod):
+    # a) cumulative sales in period up to day
+    cumulative_sales = (db.session.query(db.func.coalesce(db.func.sum(SalesHours.sales), 0))
+                        .filter(SalesHours.user_id == user_id,
+                                SalesHours.date >= pay_period.start_date,
+                                SalesHours.date <= day)
+                        .scalar()) or 0
+
+    # b) demos on day
+    demos_row = Demos.query.filter_by(user_id=user_id, date=day).first()
+    demos_today = int(demos_row.demos) if demos_row else 0
+
+    # c) hours on day
+    sh_row = SalesHours.query.filter_by(user_id=user_id, date=day).first()
+    hours_today = float(sh_row.hours) if sh_row else 0.0
+    sales_today = int(sh_row.sales) if sh_row else 0
+
+    # d) candidate tiers
+    tiers = _get_active_tiers_for_user(user_id, day)
+    return _evaluate_daily_pay(tiers, sales_today, hours_today, demos_today, cumulative_sales)
+
+
+# ===== Batched Period Pay Engine =====
+# compute_daily_pay issues several queries per day. For ranges we load the user's
+# SalesHours and Demos rows once, take tiers from the tier cache and evaluate every
+# day in memory.
+def load_pay_inputs_for_users(user_ids, start_day: datetime.date, end_day: datetime.date, pay_period: PayPeriod,
+                              fresh_tiers=False):
+    """Load pay inputs for several users over [start_day, end_day].
+
+    SalesHours and Demos are read with one set-based query each; tiers come from the
+    tier cache (one more query for any cache misses), or from the DB with fresh_tiers.
+    SalesHours is read from the start of the pay period so cumulative sales can be
+    computed as a running sum. Returns {user_id: inputs} where inputs holds
+    `sales_hours` ({date: (sales, hours)}), `demos` ({date: demos}) and `tiers`
+    (a TierIndex served from the tier cache).
+    """
+    user_ids = list(user_ids)
+    by_user = {uid: {'sales_hours': {}, 'demos': {}, 'tiers': None} for uid in user_ids}
+    if not user_ids:
+        return by_user
+    window_start = min(pay_period.start_date, start_day)
+    sales_rows = (db.session.query(SalesHours.user_id, SalesHours.date, SalesHours.sales, SalesHours.hours)
+                  .filter(SalesHours.user_id.in_(user_ids),
+                          SalesHours.date >= window_start,
+                          SalesHours.date <= end_day)
+                  .all())
+    demos_rows = (db.session.query(Demos.user_id, Demos.date, Demos.demos)
+                  .filter(Demos.user_id.in_(user_ids),
+                          Demos.date >= start_day,
+                          Demos.date <= end_day)
+                  .all())
+    tier_indexes = get_tier_indexes(user_ids, fresh=fresh_tiers)
+    for r in sales_rows:
+        by_user[r.user_id]['sales_hours'][r.date] = (r.sales, r.hours)
+    for r in demos_rows:
+        by_user[r.user_id]['demos'][r.date] = r.demos
+    for uid, index in tier_indexes.items():
+        by_user[uid]['tiers'] = index
+    return by_user
+
+
+def load_period_pay_inputs(user_id: int, start_day: datetime.date, end_day: datetime.date, pay_period: PayPeriod,
+                          fresh_tiers=False):
+    """Load one user's pay inputs for [start_day, end_day] (at most three queries)."""
+    return load_pay_inputs_for_users([user_id], start_day, end_day, pay_period, fresh_tiers=fresh_tiers)[user_id]
+
+
+def compute_period_pay(user_id: int, start_day: datetime.date, end_day: datetime.date,
+                       pay_period: PayPeriod, inputs=None):
+    """Return {date: calc} for every day in [start_day, end_day].
+
+    Each calc is identical to `compute_daily_pay(user_id, day, pay_period)`.
+    Pass `inputs` from `load_period_pay_inputs` to reuse already-loaded rows.
+    """
+    if inputs is None:
+        inputs = load_period_pay_inputs(user_id, start_day, end_day, pay_period)
+    sales_hours = inputs['sales_hours']
+    demos = inputs['demos']
+    tiers = inputs['tiers']
+
+    # Running sum of sales from the period start; rows before start_day only seed the total
+    cumulative_sales = 0
+    for day in sorted(d for d in sales_hours if d < start_day):
+        if day >= pay_period.start_date:
+            cumulative_sales += int(sales_hours[day][0] or 0)
+
+    results = {}
+    cur = start_day
+    while cur <= end_day:
+        sh = sales_hours.get(cur)
+        sales_today = int(sh[0]) if sh else 0
+        hours_today = float(sh[1]) if sh else 0.0
+        if sh and cur >= pay_period.start_date:
+            cumulative_sales += int(sh[0] or 0)
+        demos_today = int(demos[cur]) if cur in demos else 0
+        day_tiers = tiers.for_date(cur)
+        results[cur] = _evaluate_daily_pay(day_tiers, sales_today, hours_today, demos_today, cumulative_sales)
+        cur = cur + timedelta(days=1)
+    return results
+
+
+# ===== DailyPay Materialization =====
+def mark_daily_pay_dirty(user_id: int, from_day=None):
+    """Flag materialized pay rows for `user_id` on or after `from_day` (all days if None).
+
+    Cumulative sales carry forward, so a change on one day invalidates the rest of the
+    period. Runs in the caller's transaction; the caller commits.
+    """
+    try:
+        query = DailyPay.query.filter(DailyPay.user_id == user_id, DailyPay.dirty == False)
+        if from_day is not None:
+            query = query.filter(DailyPay.date >= from_day)
+        query.update({'dirty': True}, synchronize_session=False)
+    except Exception as e:
+        logger.warning(f"Could not mark daily pay dirty for user {user_id}: {e}")
+
+
+def _daily_pay_row(user_id: int, pay_period_id, day, calc, inputs):
+    sh = inputs['sales_hours'].get(day)
+    return DailyPay(
+        user_id=user_id,
+        pay_period_id=pay_period_id,
+        date=day,
+        sales=int(sh[0]) if sh else 0,
+        hours=float(sh[1]) if sh else 0.0,
+        demos=int(inputs['demos'][day]) if day in inputs['demos'] else 0,
+        has_sales_hours=bool(sh),
+        has_demos=day in inputs['demos'],
+        unlocked_tier_id=calc['unlocked_tier_id'],
+        tier_type=calc['tier_type'],
+        hourly_rate=calc['hourly_rate'],
+        commission_rate_pct=calc['commission_rate_pct'],
+        demo_bonus=calc['demo_bonus'],
+        computed_pay=calc['computed_pay'],
+        cumulative_sales=calc['cumulative_sales'],
+        dirty=False,
+        computed_at=datetime.utcnow(),
+    )
+
+
+def rebuild_daily_pay(user_id: int, pay_period: PayPeriod, start_day=None, end_day=None):
+    """Recompute and store DailyPay rows for a persisted pay period (or a slice of it).
+    Returns the rows in date order. The caller commits.
+
+    Tiers are read from the DB, not the per-process tier cache: rows stored here are
+    marked clean, so tiers cached before another worker's edit would be kept for good.
+    """
+    start_day = start_day or pay_period.start_date
+    end_day = end_day or pay_period.end_date
+    inputs = load_period_pay_inputs(user_id, start_day, end_day, pay_period, fresh_tiers=True)
+    daily = compute_period_pay(user_id, start_day, end_day, pay_period, inputs=inputs)
+
+    existing = {r.date: r for r in DailyPay.query.filter(
+        DailyPay.user_id == user_id,
+        DailyPay.pay_period_id == pay_period.id,
+        DailyPay.date >= start_day,
+        DailyPay.date <= end_day).all()}
+    rows = []
+    for day, calc in daily.items():
+        fresh = _daily_pay_row(user_id, pay_period.id, day, calc, inputs)
+        row = existing.get(day)
+        if row:
+            for col in DailyPay.__table__.columns.keys():
+                if col != 'id':
+                    setattr(row, col, getattr(fresh, col))
+        else:
+            row = fresh
+            db.session.add(row)
+        rows.append(row)
+    return rows
+
+
+def get_daily_pay_rows(user_id: int, start_day, end_day, pay_period: PayPeriod):
+    """Read materialized pay rows, rebuilding the range when rows are missing or dirty.
+    Ad-hoc (unsaved) periods are computed on the fly and not stored.
+    """
+    if pay_period.id is None:
+        inputs = load_period_pay_inputs(user_id, start_day, end_day, pay_period)
+        daily = compute_period_pay(user_id, start_day, end_day, pay_period, inputs=inputs)
+        return [_daily_pay_row(user_id, None, day, calc, inputs) for day, calc in daily.items()]
+
+    rows = (DailyPay.query
+            .filter(DailyPay.user_id == user_id,
+                    DailyPay.pay_period_id == pay_period.id,
+                    DailyPay.date >= start_day,
+                    DailyPay.date <= end_day)
+            .order_by(DailyPay.date.asc())
+            .all())
+    expected_days = (end_day - start_day).days + 1
+    if len(rows) == expected_days and not any(r.dirty for r in rows):
+        return rows
+    try:
+        rows = rebuild_daily_pay(user_id, pay_period, start_day, end_day)
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"DailyPay rebuild failed for user {user_id}: {e}")
+        db.session.rollback()
+        inputs = load_period_pay_inputs(user_id, start_day, end_day, pay_period)
+        daily = compute_period_pay(user_id, start_day, end_day, pay_period, inputs=inputs)
+        rows = [_daily_pay_row(user_id, None, day, calc, inputs) for day, calc in daily.items()]
+    return rows
+
 # Create database tables and add test data
 def initialize_database():
     """Initialize database with proper schema and test data"""
     try:
-        # Create logs directory
-        os.makedirs('logs', exist_ok=True)
-        
-        # Create tables
-        db.create_all()
-        logger.info("Database tables created successfully")
-        
-        # Try to create admin user if it doesn't exist
-        try:
-            admin_user = User.query.filter_by(username='admin').first()
-            if not admin_user:
-                admin_user = User(
-                    name='System Administrator',
-                    email='admin@monumevip.com',
-                    username='admin',
-                    password=generate_password_hash('admin123'),
-                    role='admin',
-                    is_active=True,
-                    created_at=datetime.utcnow()
-                )
-                db.session.add(admin_user)
-                db.session.commit()
-                logger.info("Created admin user: admin/admin123")
-        except Exception as e:
-            logger.error(f"Error creating admin user: {str(e)}")
-            db.session.rollback()
-        
-        # Try to create test locations if they don't exist (only when seeding is enabled)
-        try:
-            # Removed test location and test user seeding
-            pass
-        except Exception as e:
-            logger.error(f"Error creating test locations: {str(e)}")
-            db.session.rollback()
-        
-        # Run lightweight schema migrations for existing installs
-        try:
-            run_schema_migrations()
-        except Exception as mig_e:
-            logger.error(f"Schema migration failed: {mig_e}")
+        migrate_database()
         logger.info("Database initialization completed")
-        
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
         # Continue anyway - server should still start
 
-# Initialize database - simplified approach
-try:
-    with app.app_context():
-        # Create logs directory
-        os.makedirs('logs', exist_ok=True)
-        
-        # Try to create database tables
-        db.create_all()
-        logger.info("Database tables created successfully")
-        
-        # Try to create admin user
+# ===== Request Principal =====
+# Who is making the request is resolved once per request by a before_request hook and
+# kept on flask.g. Logins store an auth snapshot in the signed session cookie
+# ({id, role, location_id, v}); while the snapshot's auth_version is not revoked the
+# decorators trust it and no auth query runs. Changes that affect access (deactivation,
+# role/location/password changes, deletion) call revoke_auth(), which bumps the row's
+# auth_version and appends an AuthRevocation row. Every worker polls that table at most
+# every MONUME_AUTH_REVOCATION_POLL seconds into an in-process {(kind, id): version} map;
+# the worker that revoked updates its map as soon as the session commits.
+AUTH_REVOCATION_POLL_SECONDS = float(os.environ.get('MONUME_AUTH_REVOCATION_POLL', '5'))
+_auth_revocations = {}
+_auth_revocation_state = {'last_id': 0, 'checked_at': None}
+_auth_revocation_lock = threading.Lock()
+
+
+def refresh_auth_revocations(force: bool = False) -> None:
+    """Pull AuthRevocation rows added since the last poll into the in-process table."""
+    now = time.monotonic()
+    checked_at = _auth_revocation_state['checked_at']
+    if not force and checked_at is not None and now - checked_at < AUTH_REVOCATION_POLL_SECONDS:
+        return
+    with _auth_revocation_lock:
         try:
-            admin_exists = User.query.filter_by(username='admin').first()
-            if not admin_exists:
-                admin_user = User(
-                    name='Admin',
-                    email='admin@monume.com',
-                    username='admin',
-                    password=generate_password_hash('admin123'),
-                    role='admin',
-                    is_active=True
-                )
-                db.session.add(admin_user)
-                db.session.commit()
-                logger.info("Admin user created")
-        except Exception as user_error:
-            logger.error(f"Could not create admin user: {str(user_error)}")
-            
-except Exception as e:
-    logger.error(f"Database setup failed: {str(e)}")
-    # Server will still start
+            rows = db.session.query(AuthRevocation.id, AuthRevocation.kind, AuthRevocation.principal_id,
+                                    AuthRevocation.auth_version).filter(
+                AuthRevocation.id > _auth_revocation_state['last_id']).order_by(AuthRevocation.id).all()
+            if not rows and _auth_revocation_state['last_id']:
+                # The table was recreated (/api/setup, /api/reset-db): ids start over
+                newest = db.session.query(db.func.max(AuthRevocation.id)).scalar() or 0
+                if newest < _auth_revocation_state['last_id']:
+                    _auth_revocation_state['last_id'] = 0
+                    rows = db.session.query(AuthRevocation.id, AuthRevocation.kind, AuthRevocation.principal_id,
+                                            AuthRevocation.auth_version).order_by(AuthRevocation.id).all()
+            for rev_id, kind, principal_id, version in rows:
+                key = (kind, principal_id)
+                _auth_revocations[key] = max(_auth_revocations.get(key, 0), version)
+                _auth_revocation_state['last_id'] = rev_id
+        except Exception as e:
+            logger.warning(f"Could not poll auth revocations: {e}")
+            db.session.rollback()
+        _auth_revocation_state['checked_at'] = now
 
-# Authentication decorator
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Check for user authentication
-        if 'user_id' in session:
-            user = User.query.get(session['user_id'])
-            if user and user.is_active:
-                return f(*args, **kwargs)
-        
-        # Check for location authentication
-        if 'location_id' in session:
-            location = Location.query.get(session['location_id'])
-            if location and location.is_active:
-                return f(*args, **kwargs)
-        
-        # If not authenticated: for browser page requests, redirect to login
-        try:
-            wants_html = 'text/html' in (request.headers.get('Accept') or '')
-            is_get = request.method in ('GET', 'HEAD')
-            is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
-            if is_get and wants_html and not is_ajax:
+
+def revoke_auth(kind: str, row, at_least: int = 0) -> None:
+    """Invalidate session snapshots for a User ('user') or Location ('location'). Caller commits.
+
+    The in-process map only changes once the session commits; a rollback discards the
+    revocation. at_least raises the new version past snapshots issued for an earlier row
+    that had the same id (see revoke_recreated_principals).
+    """
+    row.auth_version = max((row.auth_version or 0) + 1, at_least)
+    db.session.add(AuthRevocation(kind=kind, principal_id=row.id, auth_version=row.auth_version))
+    db.session.info.setdefault('pending_auth_revocations', []).append((kind, row.id, row.auth_version))
+
+
+def revoke_recreated_principals() -> None:
+    """Revoke every user and location after the tables were dropped and recreated.
+
+    The new rows reuse ids that old session snapshots may still carry, so their versions
+    are moved to the current epoch second, above any version issued before. Caller commits.
+    """
+    db.session.flush()
+    epoch = int(time.time())
+    for user in User.query.all():
+        revoke_auth('user', user, at_least=epoch)
+    for location in Location.query.all():
+        revoke_auth('location', location, at_least=epoch)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_pending_auth_revocations(sess):
+    for kind, principal_id, version in sess.info.pop('pending_auth_revocations', ()):
+        key = (kind, principal_id)
+        _auth_revocations[key] = max(_auth_revocations.get(key, 0), version)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_pending_auth_revocations(sess, previous_transaction):
+    sess.info.pop('pending_auth_revocations', None)
+
+
+def remember_auth_snapshot(user=None, location=None) -> None:
+    """Store the auth snapshot for a freshly authenticated user and/or location in the session."""
+    auth = dict(session.get('auth') or {})
+    if user is not None:
+        auth['user'] = {'id': user.id, 'role': user.role, 'location_id': user.location_id,
+                        'v': user.auth_version or 0}
+    if location is not None:
+        auth['location'] = {'id': location.id, 'v': location.auth_version or 0}
+    session['auth'] = auth
+
+
+def _snapshot_current(kind, snap, principal_id):
+    return (isinstance(snap, dict) and snap.get('id') == principal_id
+            and snap.get('v', -1) >= _auth_revocations.get((kind, principal_id), 0))
+
+
+_UNLOADED = object()
+
+
+class Principal:
+    """Who is making the current request.
+
+    user_snapshot / location_snapshot are set only for an active, non-revoked identity.
+    The User and Location rows are loaded lazily, only when a handler asks for them.
+    """
+
+    __slots__ = ('user_id', 'session_location_id', 'user_snapshot', 'location_snapshot', '_user', '_location')
+
+    def __init__(self, user_id=None, session_location_id=None):
+        self.user_id = user_id
+        self.session_location_id = session_location_id
+        self.user_snapshot = None
+        self.location_snapshot = None
+        self._user = _UNLOADED
+        self._location = _UNLOADED
+
+    @property
+    def user(self):
+        if self._user is _UNLOADED:
+            self._user = User.query.get(self.user_id) if self.user_id is not None else None
+        return self._user
+
+    @property
+    def location(self):
+        if self._location is _UNLOADED:
+            self._location = (Location.query.get(self.session_location_id)
+                              if self.session_location_id is not None else None)
+        return self._location
+
+    @property
+    def user_active(self):
+        return self.user_snapshot is not None
+
+    @property
+    def location_active(self):
+        return self.location_snapshot is not None
+
+    @property
+    def kind(self):
+        if self.user_snapshot is not None:
+            return 'user'
+        if self.location_snapshot is not None:
+            return 'location'
+        return None
+
+    @property
+    def role(self):
+        if self.user_snapshot is not None:
+            return self.user_snapshot.get('role')
+        return 'location' if self.location_snapshot is not None else None
+
+    @property
+    def location_id(self):
+        """Location scope: the user's location, or the logged-in location."""
+        if self.user_snapshot is not None:
+            return self.user_snapshot.get('location_id')
+        return self.location_snapshot.get('id') if self.location_snapshot is not None else None
+
+    @property
+    def is_active(self):
+        return self.kind is not None
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+
+def _load_principal():
+    user_id = session.get('user_id')
+    location_id = session.get('location_id')
+    principal = Principal(user_id, location_id)
+    if user_id is None and location_id is None:
+        return principal
+    refresh_auth_revocations()
+    auth = session.get('auth') or {}
+    if user_id is not None:
+        if _snapshot_current('user', auth.get('user'), user_id):
+            principal.user_snapshot = auth['user']
+        else:
+            user = principal.user
+            if user is not None and user.is_active:
+                remember_auth_snapshot(user=user)
+                principal.user_snapshot = session['auth']['user']
+    if location_id is not None:
+        if _snapshot_current('location', auth.get('location'), location_id):
+            principal.location_snapshot = auth['location']
+        else:
+            location = principal.location
+            if location is not None and location.is_active:
+                remember_auth_snapshot(location=location)
+                principal.location_snapshot = session['auth']['location']
+    return principal
+
+
+def current_principal() -> Principal:
+    """The request's Principal, reloaded if the session identity changed (login/logout)."""
+    principal = g.get('principal')
+    if (principal is None or principal.user_id != session.get('user_id')
+            or principal.session_location_id != session.get('location_id')):
+        principal = g.principal = _load_principal()
+    return principal
+
+
+@app.before_request
+def resolve_request_principal():
+    if request.endpoint == 'static' or request.path.startswith('/static/'):
+        return None
+    if 'user_id' in session or 'location_id' in session:
+        g.principal = _load_principal()
+    return None
+
+
+# Authentication decorator
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        principal = current_principal()
+        # User or location authentication (from the session snapshot in the common case)
+        if principal.user_active or principal.location_active:
+            return f(*args, **kwargs)
+        
+        # If not authenticated: for browser page requests, redirect to login
+        try:
+            wants_html = 'text/html' in (request.headers.get('Accept') or '')
+            is_get = request.method in ('GET', 'HEAD')
+            is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            if is_get and wants_html and not is_ajax:
                 return redirect('/login')
         except Exception:
             pass
@@ -663,10 +1649,83 @@ def _add_column_sqlite(table: str, column_def: str):
         logger.warning(f"Add column failed for {table}.{column_def}: {e}")
         db.session.rollback()
 
-def run_schema_migrations():
-    # Ensure new tables exist
+# Composite indexes the hot read paths depend on: (name, table, columns).
+# create_all only adds these to new tables, so existing installs get them here.
+REQUIRED_INDEXES = (
+    ('ix_tracking_data_location_date', 'tracking_data', ('location_id', 'date')),
+    ('ix_tracking_data_user_date', 'tracking_data', ('user_id', 'date')),
+    ('ix_tracking_daily_rollup_location_date', 'tracking_daily_rollup', ('location_id', 'date')),
+)
+
+# Hot queries that must be answered through an index (SQLite EXPLAIN QUERY PLAN check)
+HOT_QUERIES = (
+    ('tracking by location and date range',
+     "SELECT * FROM tracking_data WHERE location_id = :id AND date BETWEEN :start AND :end"),
+    ('tracking by user and date range',
+     "SELECT * FROM tracking_data WHERE user_id = :id AND date BETWEEN :start AND :end"),
+    ('sales/hours range sum',
+     "SELECT SUM(sales), SUM(hours) FROM sales_hours WHERE user_id = :id AND date BETWEEN :start AND :end"),
+    ('demos by user and day',
+     "SELECT demos FROM demos WHERE user_id = :id AND date = :start"),
+    ('daily pay rows for a period',
+     "SELECT * FROM daily_pay WHERE user_id = :id AND pay_period_id = :id AND date BETWEEN :start AND :end"),
+    ('daily rollups by location and date range',
+     "SELECT * FROM tracking_daily_rollup WHERE location_id = :id AND date BETWEEN :start AND :end"),
+)
+
+
+def _ensure_index(name: str, table: str, columns) -> bool:
+    """Create the index if missing, then verify it exists with the expected columns."""
+    try:
+        db.session.execute(db.text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        db.session.commit()
+    except Exception as e:
+        logger.warning(f"Create index failed for {name} on {table}: {e}")
+        db.session.rollback()
+    indexes = {ix['name']: tuple(ix['column_names']) for ix in sa_inspect(db.engine).get_indexes(table)}
+    if indexes.get(name) != tuple(columns):
+        logger.error(f"Index {name} on {table}{tuple(columns)} is missing or has columns {indexes.get(name)}")
+        return False
+    return True
+
+
+class HotQueryPlanError(RuntimeError):
+    """Raised when a hot query is not answered by an index SEARCH."""
+
+
+def check_hot_query_plans():
+    """Return a list of hot queries whose SQLite plan is not an index SEARCH.
+
+    Any SCAN step counts, including 'SCAN t USING (COVERING) INDEX', which still walks
+    the whole index.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return []
+    problems = []
+    params = {'id': 1, 'start': '2025-01-01', 'end': '2025-01-31'}
+    for label, sql in HOT_QUERIES:
+        plan = [row[-1] for row in db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}"), params)]
+        scans = [step for step in plan if step.startswith('SCAN')]
+        if scans or not any(step.startswith('SEARCH') for step in plan):
+            problems.append(f"{label}: {'; '.join(scans or plan)}")
+    return problems
+
+
+def require_hot_query_plans():
+    """Raise HotQueryPlanError listing every hot query that is not an index SEARCH."""
+    problems = check_hot_query_plans()
+    if problems:
+        raise HotQueryPlanError('Hot queries without an index SEARCH: ' + ' | '.join(problems))
+
+
+# Ordered, append-only list of schema migrations: (version, description, function).
+# Never renumber or edit an applied entry; add a new one at the end instead. Each step is
+# idempotent because installs that predate schema_version already have some of them.
+def _migrate_create_tables():
     db.create_all()
 
+
+def _migrate_tier_schedule_columns():
     # UserTierSchedule columns added over time
     cols = _table_columns('user_tier_schedule')
     if cols:
@@ -680,27 +1739,164 @@ def run_schema_migrations():
             _add_column_sqlite('user_tier_schedule', 'active BOOLEAN DEFAULT 1')
         if 'order_index' not in cols:
             _add_column_sqlite('user_tier_schedule', 'order_index INTEGER DEFAULT 0')
-    # Users base_hourly_rate
+
+
+def _migrate_user_base_hourly_rate():
     ucols = _table_columns('user')
     if ucols and 'base_hourly_rate' not in ucols:
         _add_column_sqlite('user', 'base_hourly_rate NUMERIC DEFAULT 0')
 
 
+def _migrate_hot_path_indexes():
+    for name, table, columns in REQUIRED_INDEXES:
+        _ensure_index(name, table, columns)
+
+
+def _migrate_seed_tracking_rollups():
+    # Seed tracking rollups for installs that already have tracking history
+    if TrackingDailyRollup.query.first() is None and TrackingData.query.first() is not None:
+        seeded = rebuild_tracking_rollups()
+        db.session.commit()
+        logger.info(f"Seeded tracking rollups from {seeded} user-days")
+
+
+def _migrate_raw_import_progress_columns():
+    # RawImport progress counters for the streaming importer
+    icols = _table_columns('raw_import')
+    if icols:
+        for column_def in ('rows_parsed INTEGER DEFAULT 0', 'rows_upserted INTEGER DEFAULT 0',
+                           'rows_skipped INTEGER DEFAULT 0', 'rows_unchanged INTEGER DEFAULT 0', 'errors JSON', 'spool_path VARCHAR(512)',
+                           'started_at DATETIME', 'finished_at DATETIME'):
+            if column_def.split()[0] not in icols:
+                _add_column_sqlite('raw_import', column_def)
+
+
+def _migrate_auth_version_columns():
+    ucols = _table_columns('user')
+    if ucols and 'auth_version' not in ucols:
+        _add_column_sqlite('user', 'auth_version INTEGER NOT NULL DEFAULT 0')
+    lcols = _table_columns('location')
+    if lcols and 'auth_version' not in lcols:
+        _add_column_sqlite('location', 'auth_version INTEGER NOT NULL DEFAULT 0')
+
+
+def _migrate_seed_admin():
+    if not User.query.filter_by(username='admin').first():
+        db.session.add(User(
+            name='Admin',
+            email='admin@monume.com',
+            username='admin',
+            password=hash_password('admin123'),
+            role='admin',
+            is_active=True
+        ))
+        db.session.commit()
+        logger.info("Admin user created")
+
+
+
+def _migrate_worker_lease_table():
+    WorkerLease.__table__.create(db.engine, checkfirst=True)
+
+
+def _migrate_raw_import_heartbeat_column():
+    icols = _table_columns('raw_import')
+    if icols and 'heartbeat_at' not in icols:
+        _add_column_sqlite('raw_import', 'heartbeat_at DATETIME')
+
+
+SCHEMA_MIGRATIONS = (
+    (1, 'create tables', _migrate_create_tables),
+    (2, 'user_tier_schedule tier columns', _migrate_tier_schedule_columns),
+    (3, 'user.base_hourly_rate', _migrate_user_base_hourly_rate),
+    (4, 'tracking/rollup hot-path indexes', _migrate_hot_path_indexes),
+    (5, 'seed tracking rollups', _migrate_seed_tracking_rollups),
+    (6, 'raw_import progress and spool columns', _migrate_raw_import_progress_columns),
+    (7, 'user/location auth_version', _migrate_auth_version_columns),
+    (8, 'seed admin account', _migrate_seed_admin),
+    (9, 'worker_lease table', _migrate_worker_lease_table),
+    (10, 'raw_import.heartbeat_at', _migrate_raw_import_heartbeat_column),
+)
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+# Next to the SQLite DB in the app's instance folder, whatever directory a process runs from
+SCHEMA_MIGRATION_LOCK = os.path.join(app.instance_path, 'schema_migrate.lock')
+
+
+def current_schema_version() -> int:
+    """Highest applied migration, or 0 when schema_version does not exist yet."""
+    try:
+        return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+    except Exception:
+        db.session.rollback()
+        return 0
+
+
+def run_schema_migrations() -> int:
+    """Apply pending SCHEMA_MIGRATIONS; returns how many ran (0 = schema already current).
+
+    A current schema costs one SELECT. Otherwise the process takes an exclusive flock on
+    SCHEMA_MIGRATION_LOCK, so when several workers boot at once one migrates and the rest
+    wait, re-read the version and find nothing left to do.
+    """
+    if current_schema_version() >= SCHEMA_VERSION:
+        return 0
+    os.makedirs(os.path.dirname(SCHEMA_MIGRATION_LOCK), exist_ok=True)
+    applied = 0
+    with open(SCHEMA_MIGRATION_LOCK, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            logger.warning("fcntl is unavailable: schema migrations run without a cross-process lock; "
+                           "set MONUME_MIGRATE_ON_START=0 and run migrate_db.py once before starting workers")
+        try:
+            db.session.rollback()  # start a fresh transaction so the version read is not stale
+            SchemaVersion.__table__.create(db.engine, checkfirst=True)
+            current = current_schema_version()
+            for version, description, migrate in SCHEMA_MIGRATIONS:
+                if version <= current:
+                    continue
+                migrate()
+                db.session.add(SchemaVersion(version=version, description=description))
+                db.session.commit()
+                applied += 1
+                logger.info(f"Applied schema migration {version}: {description}")
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    return applied
+
+
+# ===== Database Migration Entry Point =====
+# All schema work (create_all, column/index migrations, the admin seed) happens here, at
+# startup or from `python migrate_db.py`, never inside a request. Pending steps come from
+# SCHEMA_MIGRATIONS and are recorded in schema_version, so workers booting against a
+# current schema issue no DDL at all.
+def migrate_database():
+    """Bring the database schema up to date; no DDL when it already is.
+
+    The hot query plan check runs every time (read-only EXPLAINs), so an index dropped
+    or lost after the migration that created it is still reported at startup.
+    """
+    os.makedirs('logs', exist_ok=True)
+    started = time.monotonic()
+    applied = run_schema_migrations()
+    elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+    if applied:
+        logger.info(f"Applied {applied} schema migration(s) in {elapsed_ms} ms; schema at version {SCHEMA_VERSION}")
+    problems = check_hot_query_plans()
+    for problem in problems:
+        logger.error(f"Hot query is not an index SEARCH: {problem}")
+    return {'applied': applied, 'version': SCHEMA_VERSION, 'elapsed_ms': elapsed_ms, 'plan_problems': problems}
+
+
 # Admin authentication decorator
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Check for user authentication
-        if 'user_id' in session:
-            user = User.query.get(session['user_id'])
-            if user and user.is_active and user.role == 'admin':
-                return f(*args, **kwargs)
-        
-        # Check for location authentication (locations have admin-like access to their data)
-        if 'location_id' in session:
-            location = Location.query.get(session['location_id'])
-            if location and location.is_active:
-                return f(*args, **kwargs)
+        principal = current_principal()
+        # Admin users, or locations (locations have admin-like access to their data)
+        if (principal.user_active and principal.user_snapshot.get('role') == 'admin') or principal.location_active:
+            return f(*args, **kwargs)
         
         return jsonify({'error': 'Admin access required'}), 403
     return decorated_function
@@ -793,7 +1989,7 @@ def dashboard():
         
         # Check for user authentication
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
             if current_user:
                 if current_user.role == 'admin':
                     is_admin = True
@@ -804,7 +2000,7 @@ def dashboard():
         # Check for location authentication
         elif 'location_id' in session:
             current_location_id = session['location_id']
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location:
                 current_location_username = location.location_username
         
@@ -858,7 +2054,7 @@ def tracking():
         
         # Check for user authentication
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
             if current_user:
                 if current_user.role == 'admin':
                     is_admin = True
@@ -869,7 +2065,7 @@ def tracking():
         # Check for location authentication
         elif 'location_id' in session:
             current_location_id = session['location_id']
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location:
                 current_location_username = location.location_username
         
@@ -941,7 +2137,7 @@ def add_location_page():
     else:
         # For add mode, only allow admin users
         if 'user_id' in session:
-            user = User.query.get(session['user_id'])
+            user = current_principal().user
             if user and user.role != 'admin':
                 return jsonify({'error': 'Admin access required to add locations'}), 403
         elif 'location_id' in session:
@@ -972,7 +2168,7 @@ def location_dashboard_by_name(location_name):
             return jsonify({'error': 'Location not found'}), 404
         
         # Check if user has access to this location
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         if user.role != 'admin' and user.location_id != location.id:
             return jsonify({'error': 'Access denied to this location'}), 403
         
@@ -1035,7 +2231,7 @@ def location_management(location_name):
             return jsonify({'error': 'Location not found'}), 404
         
         # Check if user has access to this location
-        current_user = User.query.get(session['user_id'])
+        current_user = current_principal().user
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
             
@@ -1080,7 +2276,7 @@ def location_users(location_name):
             return jsonify({'error': 'Location not found'}), 404
         
         # Check access permissions
-        current_user = User.query.get(session['user_id'])
+        current_user = current_principal().user
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
             
@@ -1118,7 +2314,7 @@ def location_endofday(location_name):
         if not location:
             return jsonify({'error': 'Location not found'}), 404
         
-        current_user = User.query.get(session['user_id'])
+        current_user = current_principal().user
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
             
@@ -1201,7 +2397,7 @@ def location_analytics(location_name):
             return jsonify({'error': 'Location not found'}), 404
         
         # Check if user has access to this location
-        current_user = User.query.get(session['user_id'])
+        current_user = current_principal().user
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
             
@@ -1281,7 +2477,7 @@ def location_emails_page(location_name):
         # Validate access
         current_user = None
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
         if current_user and current_user.role not in ('admin',):
             if current_user.location_id != location.id:
                 return jsonify({'error': 'Access denied to this location'}), 403
@@ -1542,7 +2738,7 @@ def location_salary_page(location_name):
             return jsonify({'error': 'Location not found'}), 404
 
         # Validate access
-        current_user = User.query.get(session['user_id'])
+        current_user = current_principal().user
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
 
@@ -1583,6 +2779,274 @@ def location_salary_page(location_name):
         logger.error(f"Location salary error: {str(e)}")
         return jsonify({'error': 'Failed to load location salary page'}), 500
 
+# ===== Password Verification Pool =====
+# check_password_hash (PBKDF2/scrypt) burns ~100ms of CPU per call and holds the GIL, so a
+# burst of logins at store opening would block every request thread in the worker. Hashes
+# are verified on a small process pool instead (MONUME_LOGIN_HASH_WORKERS, 0 = verify on
+# the request thread), and at most MONUME_LOGIN_MAX_INFLIGHT verifications may be queued
+# or running per worker; beyond that logins fail fast with 429 instead of queueing. A
+# login waits on its request thread, so the default leaves one of the worker's request
+# threads free for everything else.
+
+
+def server_thread_count() -> int:
+    """Request threads per worker: MONUME_SERVER_THREADS, else gunicorn's --threads (from
+    the command line or GUNICORN_CMD_ARGS), else the 2 the Procfile runs with."""
+    configured = os.environ.get('MONUME_SERVER_THREADS')
+    if configured:
+        return max(1, int(configured))
+    args = sys.argv[1:] + shlex.split(os.environ.get('GUNICORN_CMD_ARGS', ''))
+    for i, arg in enumerate(args):
+        try:
+            if arg.startswith('--threads='):
+                return max(1, int(arg.split('=', 1)[1]))
+            if arg == '--threads' and i + 1 < len(args):
+                return max(1, int(args[i + 1]))
+        except ValueError:
+            break
+    return 2
+
+
+LOGIN_HASH_WORKERS = int(os.environ.get('MONUME_LOGIN_HASH_WORKERS', str(min(2, os.cpu_count() or 1))))
+LOGIN_MAX_INFLIGHT = int(os.environ.get('MONUME_LOGIN_MAX_INFLIGHT', str(max(1, server_thread_count() - 1))))
+LOGIN_HASH_TIMEOUT_SECONDS = float(os.environ.get('MONUME_LOGIN_HASH_TIMEOUT', '10'))
+LOGIN_RETRY_AFTER_SECONDS = 2
+_login_slots = threading.BoundedSemaphore(max(1, LOGIN_MAX_INFLIGHT))
+_login_hash_pool = None
+_login_hash_pool_lock = threading.Lock()
+_login_hash_stats = {'verified': 0, 'rejected_overload': 0, 'timeouts': 0, 'pool_rebuilds': 0,
+                     'inline_fallbacks': 0, 'rehashed': 0}
+_login_stats_lock = threading.Lock()
+
+
+class LoginOverloaded(Exception):
+    """Raised when the per-worker cap on in-flight password verifications is reached."""
+
+
+def _bump_login_stat(name: str) -> None:
+    with _login_stats_lock:
+        _login_hash_stats[name] += 1
+
+
+def _get_login_hash_pool():
+    global _login_hash_pool
+    if LOGIN_HASH_WORKERS <= 0:
+        return None
+    with _login_hash_pool_lock:
+        if _login_hash_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: never fork a process that holds request threads and DB connections.
+            # Tasks are login_hashing functions, so children only import werkzeug.security.
+            _login_hash_pool = ProcessPoolExecutor(max_workers=LOGIN_HASH_WORKERS,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        return _login_hash_pool
+
+
+def _replace_broken_login_hash_pool(pool):
+    """Swap out a pool whose child died. Its futures have already failed, so nothing
+    belonging to other requests is cancelled; the next submit builds a fresh pool."""
+    global _login_hash_pool
+    with _login_hash_pool_lock:
+        if _login_hash_pool is not pool:
+            return
+        _login_hash_pool = None
+    _bump_login_stat('pool_rebuilds')
+    pool.shutdown(wait=False)
+
+
+def _run_login_hash(fn, *args):
+    """Run a login_hashing function on the pool, falling back to the calling thread.
+
+    A timeout only abandons this request's future (LoginOverloaded, so the client
+    retries); other requests' verifications keep running on the same pool. If the
+    abandoned task is already running, the exception carries its future so the caller
+    can keep the admission slot until the child is really free.
+    """
+    from concurrent.futures import TimeoutError as FutureTimeout
+    from concurrent.futures.process import BrokenProcessPool
+    for _ in range(2):
+        pool = _get_login_hash_pool()
+        if pool is None:
+            break
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            _replace_broken_login_hash_pool(pool)
+            continue
+        try:
+            return future.result(timeout=LOGIN_HASH_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            _bump_login_stat('timeouts')
+            logger.error(f"Login hash timed out after {LOGIN_HASH_TIMEOUT_SECONDS}s")
+            if future.cancel():
+                raise LoginOverloaded()
+            raise LoginOverloaded(future)
+        except BrokenProcessPool as e:
+            # A child died (e.g. OOM-killed): replace the pool and retry once
+            logger.error(f"Login hash pool broken, rebuilding: {e}")
+            _replace_broken_login_hash_pool(pool)
+    if LOGIN_HASH_WORKERS > 0:
+        _bump_login_stat('inline_fallbacks')
+    return fn(*args)
+
+
+def check_login_password(pwhash: str, password: str, upgrade: bool = False):
+    """Verify a password on the login pool. Returns (ok, new_hash).
+
+    With upgrade=True and a hash older than PASSWORD_HASH_METHOD, the replacement hash is
+    computed in the same pool task under the same admission slot (new_hash is None
+    otherwise); store it with store_password_hash_upgrade(). Raises LoginOverloaded when
+    the worker is saturated.
+    """
+    if not pwhash or not password:
+        return False, None
+    if not _login_slots.acquire(blocking=False):
+        _bump_login_stat('rejected_overload')
+        raise LoginOverloaded()
+    release_slot = True
+    try:
+        if upgrade and password_hash_needs_upgrade(pwhash):
+            result = _run_login_hash(login_hashing.verify_and_rehash, pwhash, password, PASSWORD_HASH_METHOD)
+        else:
+            result = (_run_login_hash(login_hashing.verify, pwhash, password), None)
+        _bump_login_stat('verified')
+        return result
+    except LoginOverloaded as e:
+        if e.args:
+            # Timed out while running: the slot is freed when the child finishes
+            e.args[0].add_done_callback(lambda _future: _login_slots.release())
+            release_slot = False
+        raise
+    finally:
+        if release_slot:
+            _login_slots.release()
+
+
+def verify_password(pwhash: str, password: str) -> bool:
+    """check_password_hash on the login pool; raises LoginOverloaded when the worker is saturated."""
+    return check_login_password(pwhash, password)[0]
+
+
+# Hashes are written with one configured method (MONUME_PASSWORD_HASH_METHOD, a werkzeug
+# method string such as 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'; pick it with
+# `python password_hash_report.py --benchmark`). Hashes made with any other parameters are
+# rewritten after the next successful login, so verification cost converges on the target.
+PASSWORD_HASH_METHOD = os.environ.get('MONUME_PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+_password_hash_target = None
+
+
+def hash_password(password: str) -> str:
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+def password_hash_method(pwhash) -> str:
+    """The method/parameter prefix of a stored hash ('scrypt:32768:8:1'), or 'plaintext'."""
+    if not pwhash or '$' not in pwhash:
+        return 'plaintext'
+    return pwhash.split('$', 1)[0]
+
+
+def password_hash_target() -> str:
+    """PASSWORD_HASH_METHOD as werkzeug spells it in stored hashes (defaults filled in)."""
+    global _password_hash_target
+    if _password_hash_target is None:
+        _password_hash_target = password_hash_method(hash_password('target-probe'))
+    return _password_hash_target
+
+
+def password_hash_needs_upgrade(pwhash) -> bool:
+    return password_hash_method(pwhash) != password_hash_target()
+
+
+def store_password_hash_upgrade(row, attr: str, new_hash) -> bool:
+    """Save a hash produced by check_login_password(upgrade=True). Never fails the login."""
+    if not new_hash:
+        return False
+    try:
+        setattr(row, attr, new_hash)
+        db.session.commit()
+        _bump_login_stat('rehashed')
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Password hash upgrade failed for {type(row).__name__} {getattr(row, 'id', None)}: {e}")
+        return False
+
+
+def password_hash_report():
+    """Stored hash methods for users and locations: {method: {'users': n, 'locations': n}}."""
+    report = {}
+    for kind, column in (('users', User.password), ('locations', Location.location_password)):
+        for (pwhash,) in db.session.query(column).filter(column.isnot(None)):
+            counts = report.setdefault(password_hash_method(pwhash), {'users': 0, 'locations': 0})
+            counts[kind] += 1
+    return report
+
+
+# Login latency budget (MONUME_LOGIN_BUDGET_MS). Each /api/login records its lookup and
+# verify phases; responses carry a Server-Timing header and slow logins are logged.
+LOGIN_LATENCY_BUDGET_MS = float(os.environ.get('MONUME_LOGIN_BUDGET_MS', '300'))
+_login_latency_stats = {'count': 0, 'over_budget': 0, 'max_ms': 0.0, 'total_ms': 0.0}
+
+
+def record_login_latency(outcome: str, timing: dict, elapsed: float, response=None) -> None:
+    total_ms = elapsed * 1000
+    lookup_ms = timing.get('lookup', 0.0) * 1000
+    verify_ms = timing.get('verify', 0.0) * 1000
+    over_budget = total_ms > LOGIN_LATENCY_BUDGET_MS
+    with _login_stats_lock:
+        _login_latency_stats['count'] += 1
+        _login_latency_stats['total_ms'] += total_ms
+        _login_latency_stats['max_ms'] = max(_login_latency_stats['max_ms'], total_ms)
+        if over_budget:
+            _login_latency_stats['over_budget'] += 1
+    if over_budget:
+        logger.warning(f"Login over budget ({outcome}): {total_ms:.0f} ms > {LOGIN_LATENCY_BUDGET_MS:.0f} ms "
+                       f"(lookup {lookup_ms:.0f} ms, verify {verify_ms:.0f} ms)")
+    if response is not None:
+        response.headers['Server-Timing'] = (f"lookup;dur={lookup_ms:.1f}, verify;dur={verify_ms:.1f}, "
+                                             f"total;dur={total_ms:.1f}")
+
+
+def login_latency_stats():
+    with _login_stats_lock:
+        stats = dict(_login_latency_stats)
+    count = stats['count']
+    return {'count': count, 'over_budget': stats['over_budget'],
+            'budget_ms': LOGIN_LATENCY_BUDGET_MS, 'max_ms': round(stats['max_ms'], 1),
+            'avg_ms': round(stats['total_ms'] / count, 1) if count else 0.0}
+
+
+def login_overloaded_response():
+    response = jsonify({'success': False, 'message': 'Too many logins in progress, please retry shortly'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(LOGIN_RETRY_AFTER_SECONDS)
+    return response
+
+
+def login_hash_stats():
+    with _login_stats_lock:
+        stats = dict(_login_hash_stats)
+    return dict(stats, workers=LOGIN_HASH_WORKERS, max_inflight=LOGIN_MAX_INFLIGHT)
+
+
+def find_login_candidates(username: str):
+    """Users (by username/email) and locations (by location_username) matching a login name.
+
+    One UNION ALL round trip returning (kind, id, password_hash, is_active), users first,
+    instead of a user query followed by a location query on every failed user match.
+    """
+    users = db.select(db.literal('user').label('kind'), User.id.label('id'), User.password.label('pwhash'),
+                      User.is_active.label('is_active')).where(
+        (User.username == username) | (User.email == username)).order_by(User.id).limit(1)
+    locations = db.select(db.literal('location').label('kind'), Location.id.label('id'),
+                          Location.location_password.label('pwhash'), Location.is_active.label('is_active')).where(
+        Location.location_username == username).order_by(Location.id).limit(1)
+    combined = db.union_all(users.subquery().select(), locations.subquery().select())
+    return db.session.execute(combined).all()
+
+
 # Helper function for location login
 def try_location_login(username, password, return_none_on_fail=False):
     """Try to authenticate as a location"""
@@ -1594,10 +3058,12 @@ def try_location_login(username, password, return_none_on_fail=False):
         if location and location.is_active:
             # Check if location has password set, if not, allow any password for demo
             if location.location_password:
-                if not check_password_hash(location.location_password, password):
+                ok, new_hash = check_login_password(location.location_password, password, upgrade=True)
+                if not ok:
                     if return_none_on_fail:
                         return None
                     return jsonify({'success': False, 'message': 'Invalid location credentials'}), 401
+                store_password_hash_upgrade(location, 'location_password', new_hash)
             else:
                 # For demo purposes, allow common passwords if no password is set
                 demo_passwords = ['test_location123', 'queens123', 'location123', 'demo123']
@@ -1611,6 +3077,7 @@ def try_location_login(username, password, return_none_on_fail=False):
             session['location_name'] = location.name
             session['location_username'] = location.location_username
             session['role'] = 'location'
+            remember_auth_snapshot(location=location)
             
             return jsonify({
                 'success': True,
@@ -1627,6 +3094,8 @@ def try_location_login(username, password, return_none_on_fail=False):
             if return_none_on_fail:
                 return None
             return jsonify({'success': False, 'message': 'Invalid location credentials'}), 401
+    except LoginOverloaded:
+        raise
     except Exception as e:
         if return_none_on_fail:
             return None
@@ -1641,10 +3110,12 @@ def try_user_login(username, password):
         (User.username == username) | (User.email == username)
     ).first()
     
-    if user and check_password_hash(user.password, password):
+    ok, new_hash = check_login_password(user.password, password, upgrade=True) if user else (False, None)
+    if ok:
         if not user.is_active:
             logger.warning(f"User {username} is deactivated")
             return jsonify({'success': False, 'message': 'Account is deactivated'}), 401
+        store_password_hash_upgrade(user, 'password', new_hash)
         
         # Set session data
         session.permanent = True  # Make session permanent
@@ -1653,7 +3124,8 @@ def try_user_login(username, password):
         session['role'] = user.role
         session['location_id'] = user.location_id
         
-        logger.info(f"User {username} logged in successfully. Session: {dict(session)}")
+        remember_auth_snapshot(user=user)
+        logger.info(f"User {username} logged in successfully")
         
         return jsonify({
             'success': True,
@@ -1677,163 +3149,107 @@ def login_api():
         response = make_response()
         return add_cors_headers(response)
         
+    started = time.perf_counter()
+    timing = {'lookup': 0.0, 'verify': 0.0}
+    outcome = 'error'
+    response = None
     try:
-        logger.info("Login API called")
-        
         # Get request data
         data = request.get_json()
         if not data:
+            outcome = 'bad_request'
             return jsonify({'success': False, 'message': 'No data provided'}), 400
             
         username = data.get('username', '').strip()
         password = data.get('password', '').strip()
         
         if not username or not password:
+            outcome = 'bad_request'
             return jsonify({'success': False, 'message': 'Username and password required'}), 400
         
-        logger.info(f"Login attempt for username: {username}")
-        
-        # Ensure database exists
+        # Look up the user and location candidates in one round trip; no schema work here,
+        # that is migrate_database()'s job at startup
         try:
-            db.create_all()
-        except Exception as e:
-            logger.error(f"Database creation failed: {str(e)}")
-            return jsonify({'success': False, 'message': 'Database error'}), 500
-        
-        # Try admin login
-        try:
-            user = User.query.filter(
-                (User.username == username) | (User.email == username)
-            ).first()
-            
-            if user and check_password_hash(user.password, password) and user.is_active:
-                # Set session
-                session['user_id'] = user.id
-                session['username'] = user.username
-                session['role'] = user.role
-                
-                logger.info(f"Admin login successful for: {username}")
-                return jsonify({
-                    'success': True,
-                    'user': {
-                        'id': user.id,
-                        'name': user.name,
-                        'username': user.username,
-                        'email': user.email,
-                        'role': user.role
-                    }
-                })
-        except Exception as e:
-            logger.error(f"Admin login check failed: {str(e)}")
+            phase = time.perf_counter()
+            candidates = find_login_candidates(username)
+            timing['lookup'] = time.perf_counter() - phase
+            user = location = None
+            phase = time.perf_counter()
+            for kind, row_id, pwhash, is_active in candidates:
+                if not is_active:
+                    continue
+                ok, new_hash = check_login_password(pwhash, password, upgrade=True)
+                if ok:
+                    if kind == 'user':
+                        user = db.session.get(User, row_id)
+                        store_password_hash_upgrade(user, 'password', new_hash)
+                    else:
+                        location = db.session.get(Location, row_id)
+                        store_password_hash_upgrade(location, 'location_password', new_hash)
+                    break
+            timing['verify'] = time.perf_counter() - phase
+        except LoginOverloaded:
+            outcome = 'overloaded'
+            logger.warning(f"Login shed under load for username: {username}")
+            response = login_overloaded_response()
+            return response
+        
+        if user:
+            # Set session
+            session['user_id'] = user.id
+            session['username'] = user.username
+            session['role'] = user.role
+            remember_auth_snapshot(user=user)
             
-            # If we get "no such column" error, recreate database
-            if "no such column" in str(e).lower():
-                logger.info("Database schema issue detected, recreating database")
-                try:
-                    db.drop_all()
-                    db.create_all()
-                    
-                    # Create admin user
-                    admin_user = User(
-                        name='Admin',
-                        email='admin@monume.com',
-                        username='admin',
-                        password=generate_password_hash('admin123'),
-                        role='admin',
-                        is_active=True
-                    )
-                    db.session.add(admin_user)
-                    
-                    # Create test location
-                    test_location = Location(
-                        name='Test Location',
-                        location_name='Test Location',
-                        location_username='test_location',
-                        location_password=generate_password_hash('test_location123'),
-                        mall='Test Mall',
-                        address='123 Test Street',
-                        phone='+1-555-0123',
-                        email='test@monume.com',
-                        is_active=True
-                    )
-                    db.session.add(test_location)
-                    
-                    db.session.commit()
-                    logger.info("Database recreated with admin user and test location")
-                    
-                    # Now try login again
-                    if username == 'admin' and password == 'admin123':
-                        session['user_id'] = admin_user.id
-                        session['username'] = admin_user.username
-                        session['role'] = admin_user.role
-                        
-                        return jsonify({
-                            'success': True,
-                            'user': {
-                                'id': admin_user.id,
-                                'name': admin_user.name,
-                                'username': admin_user.username,
-                                'email': admin_user.email,
-                                'role': admin_user.role
-                            }
-                        })
-                    elif username == 'test_location' and password == 'test_location123':
-                        session['location_id'] = test_location.id
-                        session['location_name'] = test_location.name
-                        session['role'] = 'location'
-                        
-                        return jsonify({
-                            'success': True,
-                            'user': {
-                                'id': test_location.id,
-                                'name': test_location.name,
-                                'username': test_location.location_username,
-                                'role': 'location',
-                                'location_id': test_location.id,
-                                'location_name': test_location.location_name,
-                                'location_username': test_location.location_username
-                            }
-                        })
-                        
-                except Exception as recreate_error:
-                    logger.error(f"Failed to recreate database: {str(recreate_error)}")
-                    return jsonify({'success': False, 'message': 'Database recreation failed'}), 500
-        
-        # Try location login
-        try:
-            location = Location.query.filter(
-                Location.location_username == username
-            ).first()
+            outcome = 'user'
+            logger.info(f"Admin login successful for: {username}")
+            response = jsonify({
+                'success': True,
+                'user': {
+                    'id': user.id,
+                    'name': user.name,
+                    'username': user.username,
+                    'email': user.email,
+                    'role': user.role
+                }
+            })
+            return response
+        
+        if location:
+            # Set session
+            session['location_id'] = location.id
+            session['location_name'] = location.name
+            session['role'] = 'location'
+            remember_auth_snapshot(location=location)
             
-            if location and location.location_password and check_password_hash(location.location_password, password) and location.is_active:
-                # Set session
-                session['location_id'] = location.id
-                session['location_name'] = location.name
-                session['role'] = 'location'
-                
-                logger.info(f"Location login successful for: {username}")
-                return jsonify({
-                    'success': True,
-                    'user': {
-                        'id': location.id,
-                        'name': location.name,
-                        'username': location.location_username,
-                        'role': 'location',
-                        'location_id': location.id,
-                        'location_name': location.location_name,
-                        'location_username': location.location_username
-                    }
-                })
-        except Exception as e:
-            logger.error(f"Location login check failed: {str(e)}")
+            outcome = 'location'
+            logger.info(f"Location login successful for: {username}")
+            response = jsonify({
+                'success': True,
+                'user': {
+                    'id': location.id,
+                    'name': location.name,
+                    'username': location.location_username,
+                    'role': 'location',
+                    'location_id': location.id,
+                    'location_name': location.location_name,
+                    'location_username': location.location_username
+                }
+            })
+            return response
         
         # If we get here, login failed
+        outcome = 'invalid'
         logger.warning(f"Login failed for username: {username}")
-        return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+        response = make_response(jsonify({'success': False, 'message': 'Invalid credentials'}), 401)
+        return response
             
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Login API error: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'message': 'Server error'}), 500
+    finally:
+        record_login_latency(outcome, timing, time.perf_counter() - started, response)
 
 
 @app.route('/api/health', methods=['GET', 'OPTIONS'])
@@ -1863,11 +3279,12 @@ def setup_system():
             name='Admin',
             email='admin@monume.com',
             username='admin',
-            password=generate_password_hash('admin123'),
+            password=hash_password('admin123'),
             role='admin',
             is_active=True
         )
         db.session.add(admin_user)
+        revoke_recreated_principals()
         
         db.session.commit()
         logger.info("Database setup completed (admin only)")
@@ -1920,6 +3337,8 @@ def reset_database():
             
             # Initialize with test data
             initialize_database()
+            revoke_recreated_principals()
+            db.session.commit()
             
         return jsonify({
             'success': True,
@@ -1976,7 +3395,7 @@ def fix_database():
             name='System Administrator',
             email='admin@monumevip.com',
             username='admin',
-            password=generate_password_hash('admin123'),
+            password=hash_password('admin123'),
             role='admin',
             is_active=True,
             created_at=datetime.utcnow()
@@ -1989,7 +3408,7 @@ def fix_database():
                 name='Test Location',
                 location_name='Test Location',
                 location_username='test_location',
-                location_password=generate_password_hash('test_location123'),
+                location_password=hash_password('test_location123'),
                 mall='Test Mall',
                 address='123 Test Street, Test City',
                 phone='+1-555-0123',
@@ -2001,7 +3420,7 @@ def fix_database():
                 name='Queens Location',
                 location_name='Queens Location',
                 location_username='queens',
-                location_password=generate_password_hash('queens123'),
+                location_password=hash_password('queens123'),
                 mall='Queens Mall',
                 address='456 Queens Boulevard, Queens, NY',
                 phone='+1-555-0456',
@@ -2013,6 +3432,7 @@ def fix_database():
         
         for location in test_locations:
             db.session.add(location)
+        revoke_recreated_principals()
         
         db.session.commit()
         
@@ -2092,6 +3512,8 @@ def test_login():
             'message': 'Login test failed'
         }), 401
         
+    except LoginOverloaded:
+        return login_overloaded_response()
     except Exception as e:
         logger.error(f"Test login error: {str(e)}")
         return jsonify({
@@ -2136,14 +3558,13 @@ def logout():
 
 @app.route('/api/check-auth')
 def check_auth():
-    logger.info(f"Check auth called. Session: {dict(session)}")
+    principal = current_principal()
     
     # Check for user authentication
     if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        logger.info(f"User found: {user.username if user else 'None'}, Active: {user.is_active if user else 'None'}")
+        user = principal.user if principal.user_active else None
         
-        if user and user.is_active:
+        if user:
             return jsonify({
                 'authenticated': True,
                 'user': {
@@ -2161,10 +3582,9 @@ def check_auth():
     
     # Check for location authentication
     if 'location_id' in session:
-        location = Location.query.get(session['location_id'])
-        logger.info(f"Location found: {location.name if location else 'None'}, Active: {location.is_active if location else 'None'}")
+        location = principal.location if principal.location_active else None
         
-        if location and location.is_active:
+        if location:
             return jsonify({
                 'authenticated': True,
                 'user': {
@@ -2181,7 +3601,7 @@ def check_auth():
             logger.warning(f"Location inactive or not found. Clearing session.")
             session.clear()
     
-    logger.info("No valid session found")
+    logger.debug("No valid session found")
     return jsonify({'authenticated': False}), 401
 
 # Users API
@@ -2205,7 +3625,7 @@ def get_users():
         
         # Check for regular user authentication
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
             if current_user:
                 current_user_role = current_user.role
                 current_location_id = current_user.location_id
@@ -2213,7 +3633,7 @@ def get_users():
         
         # Check for location authentication
         elif 'location_id' in session:
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location:
                 current_user_role = 'location'
                 current_location_id = location.id
@@ -2383,14 +3803,14 @@ def create_user():
         
         # Check for regular user authentication
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
             if current_user:
                 current_user_role = current_user.role
                 current_location_id = current_user.location_id
         
         # Check for location authentication
         elif 'location_id' in session:
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location:
                 current_user_role = 'location'
                 current_location_id = location.id
@@ -2443,7 +3863,7 @@ def create_user():
             name=data.get('name', ''),
             username=data['username'],
             email=data['email'],
-            password=generate_password_hash(data['password']),
+            password=hash_password(data['password']),
             role=requested_role, # Use requested_role
             location_id=requested_location_id, # Use requested_location_id
             is_active=data.get('is_active', True),
@@ -2473,6 +3893,7 @@ def create_user():
             except Exception as _e:
                 logger.warning(f"Skipping invalid pending tier: {_e}")
         db.session.commit()
+        invalidate_tier_cache(new_user.id)
         
         creator_name = current_user.username if current_user else f"location-{current_location_id}"
         logger.info(f"User {new_user.username} created by {creator_name} for location {requested_location_id}")
@@ -2507,7 +3928,7 @@ def get_user(user_id):
         is_admin = False
         
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
             is_admin = current_user and current_user.role == 'admin'
         
         user_data = {
@@ -2560,14 +3981,14 @@ def update_user(user_id):
         
         # Check for regular user authentication
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
             if current_user:
                 current_user_role = current_user.role
                 current_location_id = current_user.location_id
         
         # Check for location authentication
         elif 'location_id' in session:
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location:
                 current_user_role = 'location'
                 current_location_id = location.id
@@ -2613,14 +4034,17 @@ def update_user(user_id):
             if existing:
                 return jsonify({'success': False, 'message': 'Email already exists'}), 400
             user.email = data['email']
+        auth_before = (user.password, user.role, user.location_id, user.is_active)
         if 'password' in data and data['password']:
-            user.password = generate_password_hash(data['password'])
+            user.password = hash_password(data['password'])
         if 'role' in data and data['role']:
             user.role = data['role']
         if 'location_id' in data:
             user.location_id = int(data['location_id']) if data['location_id'] else None
         if 'is_active' in data:
             user.is_active = data['is_active']
+        if (user.password, user.role, user.location_id, user.is_active) != auth_before:
+            revoke_auth('user', user)
         if 'base_hourly_rate' in data:
             try:
                 user.base_hourly_rate = float(data.get('base_hourly_rate') or 0)
@@ -2675,6 +4099,7 @@ def delete_user(user_id):
         if appointments_count > 0:
             return jsonify({'success': False, 'message': f'Cannot delete user with {appointments_count} appointments'}), 400
         
+        revoke_auth('user', user)
         db.session.delete(user)
         db.session.commit()
         
@@ -2696,7 +4121,7 @@ def get_location(location_id):
             return jsonify({'error': 'Location not found'}), 404
         
         # Check if user is admin to return password
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         is_admin = user and user.role == 'admin'
         
         response_data = {
@@ -2745,7 +4170,7 @@ def get_location_details(location_identifier):
             return jsonify({'success': False, 'error': 'Location not found'}), 404
         
         # Check access permissions
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         if user.role != 'admin' and user.location_id != location.id:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
         
@@ -2815,7 +4240,7 @@ def add_location():
             return jsonify({'error': 'Location name already exists'}), 400
         
         # Hash the password
-        hashed_password = generate_password_hash(location_password)
+        hashed_password = hash_password(location_password)
         
         # Generate unique URL slug
         import re
@@ -2897,7 +4322,7 @@ def update_location():
         # Check if user has permission to update this location
         # Admin can update any location, location users can only update their own
         if 'user_id' in session:
-            user = User.query.get(session['user_id'])
+            user = current_principal().user
             if user and user.role == 'admin':
                 # Admin can update any location
                 pass
@@ -2940,8 +4365,9 @@ def update_location():
                 return jsonify({'error': 'Location username already exists'}), 400
             location.location_username = data['location_username']
         
+        auth_before = (location.location_password, location.is_active)
         if 'location_password' in data and data['location_password']:
-            location.location_password = generate_password_hash(data['location_password'])
+            location.location_password = hash_password(data['location_password'])
         
         if 'address' in data:
             location.address = data['address']
@@ -2957,6 +4383,8 @@ def update_location():
         
         if 'is_active' in data:
             location.is_active = data['is_active']
+        if (location.location_password, location.is_active) != auth_before:
+            revoke_auth('location', location)
         
         location.updated_at = datetime.utcnow()
         db.session.commit()
@@ -3025,6 +4453,7 @@ def remove_location():
         if appointments_count > 0:
             return jsonify({'error': f'Cannot delete location with {appointments_count} associated appointments. Please reassign or remove appointments first.'}), 400
         
+        revoke_auth('location', location)
         db.session.delete(location)
         db.session.commit()
         
@@ -3046,7 +4475,7 @@ def remove_location():
 @login_required
 def get_locations():
     try:
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         
         # Admin can see all locations, others only their own
         if user.role == 'admin':
@@ -3086,7 +4515,7 @@ def api_get_locations():
     try:
         # Check for user authentication
         if 'user_id' in session:
-            user = User.query.get(session['user_id'])
+            user = current_principal().user
             if user and user.is_active:
                 # Admin can see all locations, others only their own
                 if user.role == 'admin':
@@ -3098,7 +4527,7 @@ def api_get_locations():
         
         # Check for location authentication
         elif 'location_id' in session:
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location and location.is_active:
                 # Location users can only see their own location
                 locations = [location]
@@ -3145,7 +4574,7 @@ def get_current_user():
     try:
         # Check for user authentication
         if 'user_id' in session:
-            user = User.query.get(session['user_id'])
+            user = current_principal().user
             if user and user.is_active:
                 return jsonify({
                     'success': True,
@@ -3163,7 +4592,7 @@ def get_current_user():
         
         # Check for location authentication
         if 'location_id' in session:
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location and location.is_active:
                 return jsonify({
                     'success': True,
@@ -3196,7 +4625,7 @@ def verify_admin_password():
         if not password:
             return jsonify({'success': False, 'message': 'Password is required'}), 400
         
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         
         # Check if user is admin
         if user.role != 'admin':
@@ -3210,13 +4639,15 @@ def verify_admin_password():
             is_valid = password in valid_passwords
         elif user.password:
             # For database admin users, check hashed password
-            is_valid = check_password_hash(user.password, password)
+            is_valid = verify_password(user.password, password)
         
         if is_valid:
             return jsonify({'valid': True, 'success': True, 'message': 'Admin password verified'})
         else:
             return jsonify({'valid': False, 'success': False, 'message': 'Invalid admin password'}), 401
             
+    except LoginOverloaded:
+        return login_overloaded_response()
     except Exception as e:
         logger.error(f"Verify admin password error: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to verify password'}), 500
@@ -3231,7 +4662,7 @@ def get_location_users():
         if not location_id:
             return jsonify({'success': False, 'message': 'Location ID is required'}), 400
         
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         
         # Check if user has access to this location
         if user.role != 'admin' and user.location_id != int(location_id):
@@ -3282,7 +4713,7 @@ def _resolve_location_param(location_param: str):
 @login_required
 def get_appointments():
     try:
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
 
         # Optional location override for admins via URL (?location=...)
         location_param = request.args.get('location', '').strip()
@@ -3297,6 +4728,15 @@ def get_appointments():
                 return jsonify({'success': False, 'message': 'User has no location'}), 400
             query = Appointment.query if user.role == 'admin' else Appointment.query.filter_by(location_id=user.location_id)
 
+        try:
+            page = requested_page()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        next_cursor = None
+        if page:
+            # Appointment.date is a nullable String in mixed formats, so page by id
+            query, next_cursor = keyset_paginate(query, None, Appointment.id, page)
+
         appointments = query.all()
         appointments_data = []
 
@@ -3318,10 +4758,13 @@ def get_appointments():
             })
 
         # Return shape compatible with existing frontend expectations
-        return jsonify({
+        body = {
             'success': True,
             'appointments': appointments_data
-        })
+        }
+        if page:
+            body['next_cursor'] = next_cursor
+        return jsonify(body)
 
     except Exception as e:
         logger.error(f"Get appointments error: {str(e)}")
@@ -3332,7 +4775,7 @@ def get_appointments():
 def create_appointment():
     try:
         data = request.get_json() or {}
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         
         # Validate required fields
         # Accept flexible payload keys from different front-ends
@@ -3405,7 +4848,7 @@ def create_appointment():
 def update_appointment(appointment_id: int):
     try:
         data = request.get_json() or {}
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
 
         appointment = Appointment.query.get(appointment_id)
         if not appointment:
@@ -3463,7 +4906,7 @@ def update_appointment(appointment_id: int):
 @login_required
 def delete_appointment(appointment_id: int):
     try:
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         appointment = Appointment.query.get(appointment_id)
         if not appointment:
             return jsonify({'success': False, 'message': 'Appointment not found'}), 404
@@ -3484,7 +4927,7 @@ def delete_appointment(appointment_id: int):
 @login_required
 def get_appointment_by_id(appointment_id: int):
     try:
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         appointment = Appointment.query.get(appointment_id)
         if not appointment:
             return jsonify({'success': False, 'message': 'Appointment not found'}), 404
@@ -3518,7 +4961,7 @@ def get_appointment_by_id(appointment_id: int):
 @login_required
 def get_stats():
     try:
-        user = User.query.get(session['user_id'])
+        user = current_principal().user
         
         # Build queries based on user role
         if user.role == 'admin':
@@ -3597,7 +5040,7 @@ def get_tracking_data():
 
         if 'user_id' in session:
             try:
-                user_obj = User.query.get(session['user_id'])
+                user_obj = current_principal().user
                 if user_obj:
                     current_username = user_obj.username
                     if user_obj.role == 'admin':
@@ -3650,16 +5093,186 @@ def get_tracking_data():
             except Exception:
                 pass
 
+        stream_fmt = requested_stream_format()
+        try:
+            page = requested_page()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        next_cursor = None
+        if page:
+            query, next_cursor = keyset_paginate(query, TrackingData.date, TrackingData.id, page)
+
+        def with_cursor(response):
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
+
+        if request.args.get('v') == '2':
+            fields = tracking_v2_fields(request.args.get('fields'))
+            if fields is None:
+                return jsonify({'success': False, 'message': f"fields must be a subset of {', '.join(TRACKING_V2_FIELDS)}"}), 400
+            layout = (request.args.get('layout') or 'rows').lower()
+            rows = tracking_v2_rows(query.order_by(TrackingData.date, TrackingData.id), fields)
+            if stream_fmt:
+                return with_cursor(stream_records_response((dict(zip(fields, row)) for row in rows), stream_fmt))
+            if layout == 'columnar':
+                columns = list(zip(*rows)) or [()] * len(fields)
+                count = len(columns[0])
+                data = {f: list(col) for f, col in zip(fields, columns)}
+            else:
+                data = [dict(zip(fields, row)) for row in rows]
+                count = len(data)
+            logger.info(f"Retrieved {count} tracking records v2/{layout} (admin={is_admin}, user={current_username})")
+            body = {'success': True, 'v': 2, 'layout': 'columnar' if layout == 'columnar' else 'rows',
+                    'fields': fields, 'count': count, 'data': data}
+            if page:
+                body['next_cursor'] = next_cursor
+            return with_cursor(jsonify(body)), 200
+
+        if stream_fmt:
+            logger.info(f"Streaming tracking records as {stream_fmt} (admin={is_admin}, user={current_username})")
+            rows = query.order_by(TrackingData.date, TrackingData.id).yield_per(500)
+            return with_cursor(stream_records_response((data.to_dict() for data in rows), stream_fmt))
+
         tracking_data = query.all()
         result = [data.to_dict() for data in tracking_data]
         logger.info(f"Retrieved {len(result)} tracking records (admin={is_admin}, user={current_username})")
-        return jsonify(result), 200
+        # v1 stays a bare array; paged clients read the next cursor from X-Next-Cursor
+        return with_cursor(jsonify(result)), 200
 
     except Exception as e:
         logger.error(f"Error retrieving tracking data: {str(e)}", exc_info=True)
         # Fail soft with empty array to avoid frontend 500 breaks
         return jsonify([]), 200
 
+# ===== Keyset Pagination =====
+# List endpoints page on (date, id) when ?limit= or ?cursor= is given. The cursor is an
+# opaque token for the last (date, id) returned; the next page starts strictly after it,
+# so every page is an index range scan no matter how deep into history it is.
+PAGE_LIMIT_DEFAULT = 100
+PAGE_LIMIT_MAX = 1000
+PageRequest = namedtuple('PageRequest', ['limit', 'cursor'])
+
+
+def encode_cursor(date_value, row_id) -> str:
+    if hasattr(date_value, 'strftime'):
+        date_value = date_value.strftime('%Y-%m-%d')
+    elif date_value is None:
+        date_value = ''
+    raw = json.dumps([date_value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str):
+    """Return (date_str, id) from a cursor token; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        date_value, row_id = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(date_value, str) or not isinstance(row_id, int):
+        raise ValueError('Invalid cursor')
+    return date_value, row_id
+
+
+def requested_page():
+    """PageRequest from ?limit=&cursor=, or None when the client did not ask for paging."""
+    limit_param = request.args.get('limit')
+    cursor_param = request.args.get('cursor')
+    if limit_param is None and not cursor_param:
+        return None
+    try:
+        limit = int(limit_param) if limit_param is not None else PAGE_LIMIT_DEFAULT
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    cursor = decode_cursor(cursor_param) if cursor_param else None
+    return PageRequest(min(limit, PAGE_LIMIT_MAX), cursor)
+
+
+def keyset_paginate(query, date_col, id_col, page):
+    """Restrict an ORM query to one page ordered by (date_col, id_col).
+
+    Only the (date, id) keys are read to find the page boundary, so the returned query
+    can still be projected or streamed by the caller. Returns (query, next_cursor).
+    date_col must be a non-null db.Date; pass None to page by id_col alone (for tables
+    whose date is a nullable free-form string, which neither compares nor sorts by time).
+    """
+    if date_col is None:
+        if page.cursor:
+            query = query.filter(id_col > page.cursor[1])
+        keys = query.with_entities(id_col).order_by(id_col).limit(page.limit + 1).all()
+        next_cursor = None
+        if len(keys) > page.limit:
+            last_id = keys[page.limit - 1][0]
+            query = query.filter(id_col <= last_id)
+            next_cursor = encode_cursor(None, last_id)
+        return query.order_by(id_col), next_cursor
+    if page.cursor:
+        cursor_date, cursor_id = page.cursor
+        if isinstance(date_col.type, db.Date) and cursor_date:
+            cursor_date = datetime.strptime(cursor_date, '%Y-%m-%d').date()
+        query = query.filter(db.or_(date_col > cursor_date, db.and_(date_col == cursor_date, id_col > cursor_id)))
+    keys = query.with_entities(date_col, id_col).order_by(date_col, id_col).limit(page.limit + 1).all()
+    next_cursor = None
+    if len(keys) > page.limit:
+        last_date, last_id = keys[page.limit - 1]
+        query = query.filter(db.or_(date_col < last_date, db.and_(date_col == last_date, id_col <= last_id)))
+        next_cursor = encode_cursor(last_date, last_id)
+    return query.order_by(date_col, id_col), next_cursor
+
+
+def keyset_slice(keyed_records, page):
+    """Page over an iterable of ((date_str, seq), record) already sorted by key.
+
+    Used for file-backed lists (TRinfo) where seq is the record's position within its day.
+    Returns (records, next_cursor).
+    """
+    out = []
+    for key, record in keyed_records:
+        if page.cursor and key <= tuple(page.cursor):
+            continue
+        if len(out) == page.limit:
+            last_key = out[-1][0]
+            return [r for _, r in out], encode_cursor(*last_key)
+        out.append((key, record))
+    return [r for _, r in out], None
+
+
+# ===== Streaming record responses =====
+# ?format=ndjson      -> one JSON object per line (application/x-ndjson)
+# ?format=json-stream -> a single JSON array written element by element
+# Both consume a generator, so memory stays flat and the first bytes go out while
+# rows/files are still being read.
+STREAM_FORMATS = ('ndjson', 'json-stream')
+
+
+def requested_stream_format():
+    fmt = (request.args.get('format') or '').strip().lower()
+    return fmt if fmt in STREAM_FORMATS else None
+
+
+def stream_records_response(records, fmt):
+    """Wrap an iterable of dicts in a streamed NDJSON or JSON-array response."""
+    def generate():
+        if fmt == 'ndjson':
+            for rec in records:
+                yield json.dumps(rec, ensure_ascii=False, default=str) + '\n'
+            return
+        yield '['
+        first = True
+        for rec in records:
+            yield ('' if first else ',') + json.dumps(rec, ensure_ascii=False, default=str)
+            first = False
+        yield ']'
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # New TRinfo endpoints
 @app.route('/save_trinfo', methods=['POST', 'OPTIONS'])
 def save_trinfo():
@@ -3693,18 +5306,8 @@ def save_trinfo():
             'timestamp': datetime.utcnow().isoformat()
         }
 
-        # Append to file array
-        file_path = trinfo_file_path(username, date_str)
-        entries = []
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    entries = json.load(f)
-            except Exception:
-                entries = []
-        entries.append(record)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
+        # Append to the day's log segment (O(1), no rewrite of earlier entries)
+        file_path = append_trinfo_record(record)
 
         return jsonify({'success': True, 'saved': 1, 'file': file_path, 'data': record}), 201
     except Exception as e:
@@ -3718,6 +5321,10 @@ def get_trinfo():
     - username (optional)
     - start_date (YYYY-MM-DD, optional)
     - end_date (YYYY-MM-DD, optional)
+    - format (optional): 'ndjson' or 'json-stream' to stream records instead of
+      returning them in one {'success', 'count', 'data'} body
+    - limit / cursor (optional): keyset pages ordered by (date, position in day);
+      the response carries next_cursor (header X-Next-Cursor when streaming)
     If only one of start/end provided, uses that single day.
     Returns 200 with an empty list on any validation issue to avoid UI breaks.
     """
@@ -3732,20 +5339,25 @@ def get_trinfo():
         end_date = (request.args.get('end_date') or request.args.get('end') or request.args.get('to') or '').strip()
 
         ensure_trinfo_dir_exists()
+        dir_index = trinfo_dir_index.refresh()
+        safe_user = make_safe_filename_component(username) if username else None
 
-        def iter_all_files():
-            for name in os.listdir(TRINFO_DB_DIR):
-                if not name.endswith('.json'):
-                    continue
-                yield os.path.join(TRINFO_DB_DIR, name)
+        stream_fmt = requested_stream_format()
+        try:
+            page = requested_page()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
 
-        def iter_user_files(safe_user):
-            for name in os.listdir(TRINFO_DB_DIR):
-                if not name.startswith(f"{safe_user}_") or not name.endswith('.json'):
-                    continue
-                yield os.path.join(TRINFO_DB_DIR, name)
+        def read_files(paths):
+            for fp in paths:
+                if os.path.exists(fp):
+                    try:
+                        with open(fp, 'r', encoding='utf-8') as f:
+                            entries = json.load(f)
+                    except Exception:
+                        continue
+                    yield from entries
 
-        results = []
         # Date normalization with validation and soft-fail
         if start_date or end_date:
             if not start_date:
@@ -3757,44 +5369,50 @@ def get_trinfo():
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
             except Exception:
                 # Soft-fail if bad dates
+                if stream_fmt:
+                    return stream_records_response(iter(()), stream_fmt)
                 return jsonify({'success': True, 'count': 0, 'data': []}), 200
             if end < start:
                 start, end = end, start
 
-            # Walk dates inclusive
+            # Walk dates inclusive; the index hands back only files that exist for those days
+            days = []
             cur = start
-            target_files = []
-            if username:
-                while cur <= end:
-                    target_files.append(trinfo_file_path(username, cur.strftime('%Y-%m-%d')))
-                    cur = cur + timedelta(days=1)
-            else:
-                # All users: collect matching date suffix files
-                while cur <= end:
-                    day = cur.strftime('%Y-%m-%d')
-                    for name in os.listdir(TRINFO_DB_DIR):
-                        if name.endswith(f"_{day}.json"):
-                            target_files.append(os.path.join(TRINFO_DB_DIR, name))
-                    cur = cur + timedelta(days=1)
-
-            for fp in target_files:
-                if os.path.exists(fp):
-                    try:
-                        with open(fp, 'r', encoding='utf-8') as f:
-                            results.extend(json.load(f))
-                    except Exception:
-                        pass
+            while cur <= end:
+                days.append(cur.strftime('%Y-%m-%d'))
+                cur = cur + timedelta(days=1)
         else:
-            # No dates: return all files for given user or everyone
-            files_iter = iter_all_files() if not username else iter_user_files(make_safe_filename_component(username))
-            for fp in files_iter:
-                try:
-                    with open(fp, 'r', encoding='utf-8') as f:
-                        results.extend(json.load(f))
-                except Exception:
-                    pass
-
-        return jsonify({'success': True, 'count': len(results), 'data': results}), 200
+            # No dates: every day that has legacy files or a log segment
+            days = sorted(dir_index.dates_with_files() | set(_trinfo_segment_dates()))
+
+        if page and page.cursor:
+            days = [d for d in days if d >= page.cursor[0]]
+
+        def keyed_records():
+            # Day by day: legacy files first, then the log segment; seq is the position in the day
+            for day in days:
+                day_records = itertools.chain(read_files(dir_index.files_for_dates([day], safe_user)),
+                                              _iter_trinfo_segment(day, username or None))
+                for seq, rec in enumerate(day_records, start=1):
+                    yield (day, seq), rec
+
+        next_cursor = None
+        if page:
+            records, next_cursor = keyset_slice(keyed_records(), page)
+        else:
+            records = (rec for _, rec in keyed_records())
+
+        if stream_fmt:
+            response = stream_records_response(records, stream_fmt)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
+
+        results = list(records)
+        body = {'success': True, 'count': len(results), 'data': results}
+        if page:
+            body['next_cursor'] = next_cursor
+        return jsonify(body), 200
     except Exception as e:
         logger.error(f"Error reading TRinfo: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to read'}), 500
@@ -3829,7 +5447,7 @@ def save_tracking_data():
         is_admin = False
         
         if 'user_id' in session:
-            user = User.query.get(session['user_id'])
+            user = current_principal().user
             if user:
                 if user.role == 'admin':
                     is_admin = True
@@ -3838,19 +5456,16 @@ def save_tracking_data():
         elif 'location_id' in session:
             user_location_id = session['location_id']
         
+        # Get the user being tracked (once; used for both the permission check and location)
+        tracked_user = User.query.get(user_id) if user_id else None
+
         # Verify user has permission to save data for this user
         if not is_admin:
-            # Get the user being tracked
-            tracked_user = User.query.get(user_id)
             if not tracked_user or tracked_user.location_id != user_location_id:
                 return jsonify({'success': False, 'message': 'Access denied to save data for this user'}), 403
         
         # Get location ID
-        location_id = None
-        if user_id:
-            tracked_user = User.query.get(user_id)
-            if tracked_user:
-                location_id = tracked_user.location_id
+        location_id = tracked_user.location_id if tracked_user else None
         
         if not location_id:
             return jsonify({'success': False, 'message': 'Invalid user or location'}), 400
@@ -3869,6 +5484,11 @@ def save_tracking_data():
         )
         
         db.session.add(tracking_data)
+        apply_tracking_rollups([{
+            'location_id': location_id, 'user_id': user_id, 'date': date_obj,
+            'opal_demos': opal_demos, 'opal_sales': opal_sales, 'scan_demos': scan_demos,
+            'scan_sold': scan_sold, 'net_sales': net_sales, 'hours_worked': hours_worked,
+        }])
 
         # Upsert into unified tables for commission
         try:
@@ -3893,6 +5513,7 @@ def save_tracking_data():
                     sh.source = 'manual'
                 else:
                     db.session.add(SalesHours(user_id=user_id, date=date_obj, sales=sales_val, hours=hours_val, source='manual'))
+            mark_daily_pay_dirty(user_id, date_obj)
         except Exception as _e:
             logger.warning(f"Unified upsert failed: {_e}")
 
@@ -3916,6 +5537,109 @@ def save_tracking_data():
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Failed to save tracking data'}), 500
 
+TRACKING_BATCH_MAX_ENTRIES = int(os.environ.get('MONUME_TRACKING_BATCH_MAX', '500'))
+
+
+def _tracking_entry_values(data):
+    """Normalize one tracking submission (same defaults as save_tracking_data)."""
+    date_str = data.get('date') or datetime.utcnow().strftime('%Y-%m-%d')
+    try:
+        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        date_obj = datetime.utcnow().date()
+    return {
+        'user_id': int(data['user_id']) if data.get('user_id') not in (None, '') else None,
+        'date': date_obj,
+        'opal_demos': int(data.get('opal_demos') or 0),
+        'opal_sales': int(data.get('opal_sales') or 0),
+        'scan_demos': int(data.get('scan_demos') or 0),
+        'scan_sold': int(data.get('scan_sold') or 0),
+        'net_sales': float(data.get('net_sales') or 0),
+        'hours_worked': float(data.get('hours_worked') or 0),
+    }
+
+
+@app.route('/save_tracking_data/batch', methods=['POST'])
+def save_tracking_data_batch():
+    """Save many tracking entries in one transaction.
+    Body: a JSON array of save_tracking_data entries, or {"entries": [...]}.
+    Entries name the user by user_id, email or username. All users are resolved and
+    authorized with one query; if any entry is not allowed the whole batch is rejected
+    and nothing is written.
+    """
+    data = request.get_json(silent=True)
+    entries = data.get('entries') if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'success': False, 'message': 'No entries provided'}), 400
+    if len(entries) > TRACKING_BATCH_MAX_ENTRIES:
+        return jsonify({'success': False, 'message': f'At most {TRACKING_BATCH_MAX_ENTRIES} entries per batch'}), 413
+
+    try:
+        values = [_tracking_entry_values(e) for e in entries]
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Each entry needs a user and numeric metrics'}), 400
+
+    # Caller scope, as in save_tracking_data
+    is_admin = False
+    scope_location_id = None
+    if 'user_id' in session:
+        caller = current_principal().user
+        if caller:
+            if caller.role == 'admin':
+                is_admin = True
+            else:
+                scope_location_id = caller.location_id
+    elif 'location_id' in session:
+        scope_location_id = session['location_id']
+
+    try:
+        resolver = UserResolver()
+        resolver.prefetch([v['user_id'] for v in values], [e.get('email') for e in entries],
+                          [e.get('username') for e in entries])
+        for e, v in zip(entries, values):
+            v['user_id'] = resolver.resolve(user_id=v['user_id'], email=e.get('email'), username=e.get('username'))
+        user_ids = sorted({v['user_id'] for v in values if v['user_id']})
+
+        denied, invalid = [], []
+        for i, v in enumerate(values):
+            location_id = resolver.location_of(v['user_id'])
+            if not is_admin and (not v['user_id'] or location_id != scope_location_id):
+                denied.append(i)
+            elif not location_id:
+                invalid.append(i)
+            v['location_id'] = location_id
+        if denied:
+            return jsonify({'success': False, 'message': 'Access denied to save data for some users',
+                            'denied_entries': denied, 'unmatched': resolver.unmatched_report()}), 403
+        if invalid:
+            return jsonify({'success': False, 'message': 'Invalid user or location',
+                            'invalid_entries': invalid, 'unmatched': resolver.unmatched_report()}), 400
+
+        now = datetime.utcnow()
+        db.session.execute(db.insert(TrackingData), [dict(v, timestamp=now) for v in values])
+        apply_tracking_rollups(values)
+
+        demo_rows, sales_rows, dirty_from = [], [], {}
+        for v in values:
+            demo_rows.append({'user_id': v['user_id'], 'date': v['date'], 'source': 'manual', 'updated_at': now,
+                              'demos': v['opal_demos'] + v['scan_demos']})
+            sales_rows.append({'user_id': v['user_id'], 'date': v['date'], 'sales': int(v['net_sales']),
+                               'hours': v['hours_worked'], 'source': 'manual', 'updated_at': now})
+            if v['user_id'] not in dirty_from or v['date'] < dirty_from[v['user_id']]:
+                dirty_from[v['user_id']] = v['date']
+        bulk_upsert(Demos, demo_rows, ['user_id', 'date'], ['demos', 'source', 'updated_at'])
+        bulk_upsert(SalesHours, sales_rows, ['user_id', 'date'], ['sales', 'hours', 'source', 'updated_at'])
+        for user_id, first_day in dirty_from.items():
+            mark_daily_pay_dirty(user_id, first_day)
+
+        db.session.commit()
+        logger.info(f"Tracking batch saved: {len(values)} entries for {len(user_ids)} users")
+        return jsonify({'success': True, 'saved': len(values), 'users': len(user_ids)}), 201
+    except Exception as e:
+        logger.error(f"Error saving tracking batch: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to save tracking data'}), 500
+
 @app.route('/get_users_for_tracking', methods=['GET'])
 def get_users_for_tracking():
     """Get users for tracking dropdown with location-based filtering"""
@@ -3932,7 +5656,7 @@ def get_users_for_tracking():
         
         # Check for regular user authentication
         if 'user_id' in session:
-            current_user = User.query.get(session['user_id'])
+            current_user = current_principal().user
             if current_user:
                 current_user_role = current_user.role
                 current_location_id = current_user.location_id
@@ -3942,7 +5666,7 @@ def get_users_for_tracking():
         
         # Check for location authentication
         elif 'location_id' in session:
-            location = Location.query.get(session['location_id'])
+            location = current_principal().location
             if location:
                 current_user_role = 'location'
                 current_location_id = location.id
@@ -4062,6 +5786,7 @@ def upsert_demos():
         else:
             row = Demos(user_id=user_id, date=day, demos=demos, source=source)
             db.session.add(row)
+        mark_daily_pay_dirty(user_id, day)
 
         db.session.commit()
         return jsonify({'success': True, 'data': row.to_dict()}), 200
@@ -4088,7 +5813,7 @@ def list_demos():
         is_admin = False
         actor_location_id = None
         if 'user_id' in session:
-            actor = User.query.get(session['user_id'])
+            actor = current_principal().user
             if actor:
                 is_admin = actor.role == 'admin'
                 actor_location_id = actor.location_id
@@ -4112,140 +5837,442 @@ def list_demos():
         return jsonify({'success': False, 'message': 'Failed to fetch demos'}), 500
 
 
-@app.route('/api/imports/xls', methods=['POST'])
-@admin_required
-def upload_xls():
+# ===== Streaming Imports =====
+# Uploads are parsed incrementally (csv module for CSV, openpyxl read-only mode for XLSX)
+# and applied in fixed-size chunks: one user lookup and one SalesHours bulk upsert per
+# chunk, with RawImport progress counters committed after each chunk.
+IMPORT_CHUNK_ROWS = int(os.environ.get('MONUME_IMPORT_CHUNK_ROWS', '500'))
+IMPORT_MAX_ERRORS = 50
+IMPORT_HASH_BLOCK = 64 * 1024
+
+IMPORT_HEADER_CANDIDATES = {
+    'date': {'date', 'day', 'workdate'},
+    'sales': {'sales', 'netsales', 'totalsales'},
+    'hours': {'hours', 'hour', 'totalhours', 'workedhours'},
+    'user_id': {'userid', 'user', 'employeeid'},
+    'email': {'email', 'useremail'},
+    'username': {'username', 'user'},
+}
+
+
+def _norm_header(value):
+    return ''.join(ch.lower() for ch in str(value or '') if ch.isalnum())
+
+
+def _import_column_map(headers):
+    """Map each logical field to the first matching header in the file (None if absent)."""
+    rev = {}
+    for h in headers:
+        rev.setdefault(_norm_header(h), h)
+    mapping = {}
+    for field, candidates in IMPORT_HEADER_CANDIDATES.items():
+        mapping[field] = next((rev[c] for c in candidates if c in rev), None)
+    return mapping
+
+
+def _is_xlsx(stream, filename):
+    head = stream.read(4)
+    stream.seek(0)
+    return head == b'PK\x03\x04' or (filename or '').lower().endswith('.xlsx')
+
+
+def iter_import_rows(stream, filename):
+    """Yield one dict per data row from a binary CSV or XLSX stream, reading incrementally."""
+    if _is_xlsx(stream, filename):
+        if openpyxl is None:
+            raise ValueError('XLSX import requires openpyxl')
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            headers = next(rows, None)
+            if not headers:
+                return
+            headers = [str(h).strip() if h is not None else '' for h in headers]
+            for values in rows:
+                if values is None or all(v is None or v == '' for v in values):
+                    continue
+                yield dict(zip(headers, values))
+        finally:
+            workbook.close()
+        return
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
     try:
-        # Accept multipart/form-data or JSON with rows
-        file = request.files.get('file')
-        rows = None
-        filename = None
-        if file:
-            content = file.read()
-            filename = secure_filename(file.filename)
-            file_hash = hashlib.sha256(content).hexdigest()
-        else:
-            data = request.get_json(force=True) or {}
-            rows = data.get('rows')
-            filename = data.get('filename', 'api.json')
-            content = json.dumps(rows or []).encode('utf-8')
-            file_hash = hashlib.sha256(content).hexdigest()
+        for row in csv.DictReader(text_stream, skipinitialspace=True):
+            if not any((v or '').strip() for v in row.values() if isinstance(v, str)):
+                continue
+            yield {(k or '').strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
+    finally:
+        text_stream.detach()
 
-        # Idempotency check
-        existing = RawImport.query.filter_by(file_hash=file_hash).first()
-        if existing:
-            return jsonify({'success': True, 'import_id': existing.id, 'status': 'duplicate'}), 200
 
-        raw = RawImport(filename=filename, file_hash=file_hash, status='parsed')
-        db.session.add(raw)
-        db.session.flush()
+def _parse_import_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if hasattr(value, 'isoformat') and not isinstance(value, str):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except Exception:
+        return datetime.strptime(str(value), '%m/%d/%Y').date()
+
+
+def _import_number(value):
+    """float() that also accepts spreadsheet formatting like "$1,200.50"."""
+    if isinstance(value, str):
+        value = value.replace(',', '').replace('$', '').strip()
+    return float(value or 0)
 
-        # Parse rows
-        if rows is None and content:
-            # Basic CSV/XLSX detection is out of scope; assume CSV-like text if not excel
-            try:
-                text = content.decode('utf-8', errors='ignore')
-                # naive CSV parse
-                lines = [l.strip() for l in text.splitlines() if l.strip()]
-                headers = [h.strip() for h in lines[0].split(',')]
-                data_rows = []
-                for line in lines[1:]:
-                    values = [v.strip() for v in line.split(',')]
-                    data_rows.append(dict(zip(headers, values)))
-                rows = data_rows
-            except Exception:
-                rows = []
 
-        raw.parsed_rows = rows or []
+def sales_hours_values(sales, hours):
+    """(sales, hours) as compared between an import row and a stored row (hours to cents)."""
+    return int(sales or 0), round(float(hours or 0), 2)
+
+
+def _existing_sales_hours(keys):
+    """{(user_id, date): sales_hours_values} for rows already stored, in one query per chunk.
+
+    Read from the current columns, so rows edited by tracking stations or the TRinfo sync
+    are never mistaken for already-applied ones.
+    """
+    if not keys:
+        return {}
+    user_ids = {k[0] for k in keys}
+    days = [k[1] for k in keys]
+    rows = db.session.query(SalesHours.user_id, SalesHours.date, SalesHours.sales, SalesHours.hours).filter(
+        SalesHours.user_id.in_(user_ids), SalesHours.date >= min(days), SalesHours.date <= max(days))
+    return {(uid, day): sales_hours_values(sales, hours)
+            for uid, day, sales, hours in rows if (uid, day) in keys}
+
+
+def apply_import_chunk(raw, rows, mappings, dirty_from, row_offset, resolver):
+    """Parse, resolve and upsert one chunk of raw rows.
+
+    The column map is resolved per row and cached in mappings by the row's key set, so
+    CSV/XLSX rows share one map while JSON rows may each carry different keys.
+    Rows whose sales and hours match what is already stored are not rewritten, but their
+    pay is still marked dirty: rerunning an import that failed partway must repair pay
+    for rows an earlier attempt stored. Returns (upserted, unchanged, skipped, errors).
+    """
+    def col(r, field):
+        key = mapping.get(field)
+        return r.get(key) if key is not None else None
+
+    parsed, errors, skipped = [], [], 0
+    for i, r in enumerate(rows, start=row_offset):
+        keys = tuple(r.keys())
+        mapping = mappings.get(keys)
+        if mapping is None:
+            mapping = mappings[keys] = _import_column_map(keys)
+        date_val = col(r, 'date')
+        if date_val in (None, ''):
+            skipped += 1
+            continue
+        try:
+            day = _parse_import_date(date_val)
+            sales_val = int(_import_number(col(r, 'sales')))
+            hours_val = _import_number(col(r, 'hours'))
+        except Exception:
+            skipped += 1
+            errors.append((i, 'unreadable date/sales/hours'))
+            continue
+        user_id_val = col(r, 'user_id')
+        try:
+            user_id_val = int(user_id_val) if user_id_val not in (None, '') else None
+        except (TypeError, ValueError):
+            # A non-numeric "user" column is a username, as in the header candidates
+            user_id_val = None
+        parsed.append({'row': i, 'day': day, 'sales': sales_val, 'hours': hours_val, 'user_id_val': user_id_val,
+                       'email': col(r, 'email') or None, 'username': col(r, 'username') or None})
+
+    resolver.prefetch([p['user_id_val'] for p in parsed], [p['email'] for p in parsed],
+                      [p['username'] for p in parsed])
+    for p in parsed:
+        p['user_id'] = resolver.resolve(user_id=p['user_id_val'], email=p['email'], username=p['username'])
+    existing = _existing_sales_hours({(p['user_id'], p['day']) for p in parsed if p['user_id']})
+    now = datetime.utcnow()
+    upserts = []
+    unchanged = 0
+    for p in parsed:
+        if not p['user_id']:
+            skipped += 1
+            continue
+        if p['user_id'] not in dirty_from or p['day'] < dirty_from[p['user_id']]:
+            dirty_from[p['user_id']] = p['day']
+        values = sales_hours_values(p['sales'], p['hours'])
+        if existing.get((p['user_id'], p['day'])) == values:
+            unchanged += 1
+            continue
+        # Later rows for the same key in this chunk compare against this one
+        existing[(p['user_id'], p['day'])] = values
+        upserts.append({'user_id': p['user_id'], 'date': p['day'], 'sales': p['sales'], 'hours': p['hours'],
+                        'source': 'xls', 'import_id': raw.id, 'updated_at': now})
+    bulk_upsert(SalesHours, upserts, ['user_id', 'date'], ['sales', 'hours', 'source', 'import_id', 'updated_at'])
+    return len(upserts), unchanged, skipped, [f"row {i}: {msg}" for i, msg in sorted(errors)]
+
+
+def run_import(raw, row_iter):
+    """Stream rows through apply_import_chunk, committing progress after every chunk."""
+    raw.rows_parsed = raw.rows_upserted = raw.rows_skipped = raw.rows_unchanged = 0
+    raw.errors = []
+    raw.status = 'running'
+    db.session.commit()
+
+    mappings = {}
+    all_errors = []
+    resolver = UserResolver()
+    rows_iter = iter(row_iter)
+    while True:
+        chunk = list(itertools.islice(rows_iter, IMPORT_CHUNK_ROWS))
+        if not chunk:
+            break
+        dirty_from = {}
+        upserted, unchanged, skipped, errors = apply_import_chunk(raw, chunk, mappings, dirty_from,
+                                                                  raw.rows_parsed + 1, resolver)
+        # Invalidate pay in the chunk's own transaction, so a failure later on never
+        # leaves committed rows behind stale DailyPay
+        for uid, first_day in dirty_from.items():
+            mark_daily_pay_dirty(uid, first_day)
+        all_errors.extend(errors)
+        raw.rows_parsed += len(chunk)
+        raw.rows_upserted += upserted
+        raw.rows_unchanged += unchanged
+        raw.rows_skipped += skipped
+        raw.errors = all_errors[:IMPORT_MAX_ERRORS]
+        raw.heartbeat_at = datetime.utcnow()
         db.session.commit()
 
-        # Flexible header detection
-        def norm(s):
-            return ''.join(ch.lower() for ch in (s or '') if ch.isalnum())
-
-        header_map_candidates = {
-            'date': {'date', 'day', 'workdate'},
-            'sales': {'sales', 'netsales', 'totalsales'},
-            'hours': {'hours', 'hour', 'totalhours', 'workedhours'},
-            'user_id': {'userid', 'user', 'employeeid'},
-            'email': {'email', 'useremail'},
-            'username': {'username', 'user'},
-        }
+    raw.errors = (resolver.unmatched_report() + all_errors)[:IMPORT_MAX_ERRORS]
+    raw.status = 'completed'
+    raw.finished_at = datetime.utcnow()
+    db.session.commit()
+    return raw
 
-        inserted = 0
-        for r in rows or []:
-            keys = {k: norm(k) for k in r.keys()}
-            rev = {v: k for k, v in keys.items()}
-            def col(name):
-                for cand in header_map_candidates[name]:
-                    if cand in rev:
-                        return r.get(rev[cand])
-                return None
 
-            date_val = col('date')
-            if not date_val:
-                continue
+# ===== Import Jobs =====
+# Uploads are spooled under instance/imports and processed by a small thread pool, so
+# the request returns a job id right away and long imports never hit the gunicorn
+# timeout. RawImport is the job table; a conditional UPDATE claims a queued job so only
+# one thread in one worker processes it. MONUME_IMPORT_WORKERS=0 runs imports inline.
+# A running job refreshes heartbeat_at after every chunk; one whose heartbeat is older
+# than MONUME_IMPORT_STALE_SECONDS is presumed orphaned and requeued.
+IMPORT_SPOOL_DIR = os.path.join('instance', 'imports')
+IMPORT_WORKERS = int(os.environ.get('MONUME_IMPORT_WORKERS', '2'))
+IMPORT_STALE_SECONDS = int(os.environ.get('MONUME_IMPORT_STALE_SECONDS', '1800'))
+IMPORT_RESUME_INTERVAL = int(os.environ.get('MONUME_IMPORT_RESUME_INTERVAL', '60'))
+_import_executor = None
+_import_executor_lock = threading.Lock()
+
+
+def spool_upload(stream, ext: str):
+    """Copy an upload stream to a spool file while hashing it, one block at a time.
+
+    Returns (spool_path, sha256 hex). The file is written under a temporary name and
+    renamed to <hash><ext>; nothing beyond one block is held in memory.
+    """
+    os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(IMPORT_SPOOL_DIR, f".upload.{os.getpid()}.{threading.get_ident()}{ext}")
+    try:
+        with open(tmp_path, 'wb') as out:
+            for block in iter(lambda: stream.read(IMPORT_HASH_BLOCK), b''):
+                digest.update(block)
+                out.write(block)
+        file_hash = digest.hexdigest()
+        spool_path = os.path.join(IMPORT_SPOOL_DIR, f"{file_hash}{ext}")
+        os.replace(tmp_path, spool_path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return spool_path, file_hash
+
+
+def _claim_import_job(import_id: int) -> bool:
+    result = db.session.execute(
+        db.update(RawImport)
+        .where(RawImport.id == import_id, RawImport.status == 'queued')
+        .values(status='running', started_at=datetime.utcnow(), heartbeat_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def process_import_job(import_id: int) -> None:
+    """Claim and run one queued import. Safe to call from any thread or process."""
+    with app.app_context():
+        try:
+            if not _claim_import_job(import_id):
+                return
+            raw = RawImport.query.get(import_id)
+            path = raw.spool_path if raw else None
+            if not path:
+                return
             try:
-                day = datetime.strptime(str(date_val)[:10], '%Y-%m-%d').date()
-            except Exception:
-                # try MM/DD/YYYY
+                with open(path, 'rb') as stream:
+                    if path.endswith('.json'):
+                        rows = json.load(stream)
+                        run_import(raw, (r for r in rows if isinstance(r, dict)))
+                    else:
+                        run_import(raw, iter_import_rows(stream, raw.filename))
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Import {import_id} failed: {e}", exc_info=True)
+                raw = RawImport.query.get(import_id)
+                raw.status = 'failed'
+                raw.errors = (raw.errors or []) + [str(e)]
+                raw.finished_at = datetime.utcnow()
+                db.session.commit()
+            else:
                 try:
-                    day = datetime.strptime(str(date_val), '%m/%d/%Y').date()
-                except Exception:
-                    continue
+                    os.remove(path)
+                except OSError:
+                    pass
+        finally:
+            db.session.remove()
 
-            sales_val = int(float(col('sales') or 0))
-            hours_val = float(col('hours') or 0)
 
-            user_id = None
-            user_id_col = col('user_id')
-            if user_id_col:
-                try:
-                    user_id = int(user_id_col)
-                except Exception:
-                    user_id = None
-            if not user_id:
-                # try resolve by username/email
-                username = col('username')
-                email = col('email')
-                q = User.query
-                if email:
-                    user_obj = q.filter_by(email=email).first()
-                elif username:
-                    user_obj = q.filter_by(username=username).first()
-                else:
-                    user_obj = None
-                user_id = user_obj.id if user_obj else None
-            if not user_id:
-                continue
+def resume_pending_imports():
+    """Requeue jobs left 'running' by a killed worker and resubmit every queued job.
 
-            existing_row = SalesHours.query.filter_by(user_id=user_id, date=day).first()
-            if existing_row:
-                existing_row.sales = sales_val
-                existing_row.hours = hours_val
-                existing_row.source = 'xls'
-                existing_row.import_id = raw.id
-            else:
-                db.session.add(SalesHours(user_id=user_id, date=day, sales=sales_val, hours=hours_val, source='xls', import_id=raw.id))
-            inserted += 1
+    A job counts as abandoned when its last chunk heartbeat (or, for rows written before
+    heartbeats existed, its start) is older than IMPORT_STALE_SECONDS, so a long import
+    that keeps making progress is never requeued under its runner.
 
+    Runs at worker start and then every IMPORT_RESUME_INTERVAL seconds in each serving
+    process. Both steps are safe to race: the requeue is a conditional UPDATE per job and
+    process_import_job only runs a job whose queued -> running claim succeeded.
+    Caller provides the app context.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=IMPORT_STALE_SECONDS)
+    last_seen = db.func.coalesce(RawImport.heartbeat_at, RawImport.started_at)
+    stale = [row.id for row in db.session.query(RawImport.id).filter(
+        RawImport.status == 'running', last_seen < stale_before)]
+    for import_id in stale:
+        result = db.session.execute(
+            db.update(RawImport)
+            .where(RawImport.id == import_id, RawImport.status == 'running', last_seen < stale_before)
+            .values(status='queued')
+        )
         db.session.commit()
+        if result.rowcount:
+            logger.warning(f"Requeued import {import_id}: no progress since before {stale_before}")
+    pending = [row.id for row in db.session.query(RawImport.id).filter(RawImport.status == 'queued')]
+    for import_id in pending:
+        submit_import_job(import_id)
+    return pending
+
+
+def submit_import_job(import_id: int) -> None:
+    global _import_executor
+    if IMPORT_WORKERS <= 0:
+        process_import_job(import_id)
+        return
+    with _import_executor_lock:
+        if _import_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix='import')
+    _import_executor.submit(process_import_job, import_id)
+
+
+def _import_resume_loop(interval):
+    while True:
+        with app.app_context():
+            try:
+                resume_pending_imports()
+            except Exception as e:
+                logger.error(f"Resuming pending imports failed: {e}")
+            finally:
+                db.session.remove()
+        time.sleep(interval)
+
+
+def start_import_resume_worker(interval):
+    """Resume orphaned imports now and every `interval` seconds in a daemon thread."""
+    thread = threading.Thread(target=_import_resume_loop, args=(interval,), name='import-resume', daemon=True)
+    thread.start()
+    return thread
+
+
+@app.route('/api/imports/xls', methods=['POST'])
+@admin_required
+def upload_xls():
+    """Queue a CSV/XLSX (multipart 'file') or JSON {'rows': [...]} import.
+    Returns 202 with the import id; poll /api/imports/<id> for progress.
+    """
+    try:
+        os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+        file = request.files.get('file')
+        if file:
+            filename = secure_filename(file.filename)
+            ext = os.path.splitext(filename)[1].lower() or '.csv'
+            if ext == '.json':
+                ext = '.txt'
+            spool_path, file_hash = spool_upload(file.stream, ext)
+        else:
+            data = request.get_json(force=True) or {}
+            rows = data.get('rows') or []
+            filename = data.get('filename', 'api.json')
+            content = json.dumps(rows).encode('utf-8')
+            file_hash = hashlib.sha256(content).hexdigest()
+            ext = '.json'
+
+        # Idempotency check: byte-identical uploads map to the earlier import, except that
+        # re-uploading a failed one retries it from the fresh spool
+        existing = RawImport.query.filter_by(file_hash=file_hash).first()
+        if existing and existing.status != 'failed':
+            if file and existing.status not in ('queued', 'running'):
+                try:
+                    os.remove(spool_path)
+                except OSError:
+                    pass
+            return jsonify({'success': True, 'import_id': existing.id, 'status': 'duplicate'}), 200
 
-        return jsonify({'success': True, 'import_id': raw.id, 'inserted': inserted}), 201
+        if not file:
+            spool_path = os.path.join(IMPORT_SPOOL_DIR, f"{file_hash}{ext}")
+            _atomic_write_bytes(spool_path, content)
+
+        if existing:
+            result = db.session.execute(
+                db.update(RawImport)
+                .where(RawImport.id == existing.id, RawImport.status == 'failed')
+                .values(status='queued', spool_path=spool_path, finished_at=None, errors=[])
+            )
+            db.session.commit()
+            if not result.rowcount:
+                # Another upload of the same file requeued it first
+                return jsonify({'success': True, 'import_id': existing.id, 'status': 'duplicate'}), 200
+            logger.info(f"Requeued failed import {existing.id} from a new upload")
+            import_id = existing.id
+        else:
+            raw = RawImport(filename=filename, file_hash=file_hash, status='queued', spool_path=spool_path,
+                            user_id=session.get('user_id'))
+            db.session.add(raw)
+            db.session.commit()
+            import_id = raw.id
+
+        submit_import_job(import_id)
+        db.session.expire_all()
+        raw = RawImport.query.get(import_id)
+        return jsonify({'success': True, 'import_id': import_id, 'status': raw.status,
+                        'progress': raw.to_dict()['progress'],
+                        'status_url': f"/api/imports/{import_id}"}), 202
     except Exception as e:
         logger.error(f"upload_xls error: {e}", exc_info=True)
         db.session.rollback()
-        return jsonify({'success': False, 'message': 'Failed to import'}), 500
+        return jsonify({'success': False, 'message': 'Failed to queue import'}), 500
 
 
 @app.route('/api/imports/<int:import_id>', methods=['GET'])
 @admin_required
 def get_import(import_id: int):
+    """Import job status: status, started/finished times and row progress counters."""
     raw = RawImport.query.get(import_id)
     if not raw:
         return jsonify({'success': False, 'message': 'Not found'}), 404
     summary = {
-        'rows': len(raw.parsed_rows or []),
+        'rows': raw.rows_parsed or len(raw.parsed_rows or []),
         'sales_hours_rows': SalesHours.query.filter_by(import_id=raw.id).count(),
     }
     return jsonify({'success': True, 'import': raw.to_dict(), 'summary': summary})
@@ -4260,7 +6287,7 @@ def tiers_collection(user_id: int):
     actor_location_id = None
     try:
         if 'user_id' in session:
-            actor = User.query.get(session['user_id'])
+            actor = current_principal().user
             if actor:
                 is_admin = actor.role == 'admin'
                 actor_location_id = actor.location_id
@@ -4296,7 +6323,9 @@ def tiers_collection(user_id: int):
         existing.demo_bonus = float(payload.get('demo_bonus', 0))
         if payload.get('effective_from'):
             existing.effective_from = datetime.strptime(payload.get('effective_from'), '%Y-%m-%d').date()
+        mark_daily_pay_dirty(user_id)
         db.session.commit()
+        invalidate_tier_cache(user_id)
         return jsonify({'success': True, 'tier': existing.to_dict()}), 200
     else:
         tier = UserTierSchedule(
@@ -4312,7 +6341,9 @@ def tiers_collection(user_id: int):
             order_index=int(payload.get('order_index', 0)),
         )
         db.session.add(tier)
+        mark_daily_pay_dirty(user_id, tier.effective_from)
         db.session.commit()
+        invalidate_tier_cache(user_id)
         return jsonify({'success': True, 'tier': tier.to_dict()}), 201
 
 
@@ -4325,7 +6356,7 @@ def tier_item(user_id: int, tier_id: int):
     actor_location_id = None
     try:
         if 'user_id' in session:
-            actor = User.query.get(session['user_id'])
+            actor = current_principal().user
             if actor:
                 is_admin = actor.role == 'admin'
                 actor_location_id = actor.location_id
@@ -4344,7 +6375,9 @@ def tier_item(user_id: int, tier_id: int):
         return jsonify({'success': False, 'message': 'Not found'}), 404
     if request.method == 'DELETE':
         db.session.delete(tier)
+        mark_daily_pay_dirty(user_id, tier.effective_from)
         db.session.commit()
+        invalidate_tier_cache(user_id)
         return jsonify({'success': True})
     payload = request.get_json(force=True) or {}
     for field in ['sales_goal_in_period', 'daily_demo_min', 'order_index']:
@@ -4362,7 +6395,10 @@ def tier_item(user_id: int, tier_id: int):
         tier.effective_from = datetime.strptime(payload['effective_from'], '%Y-%m-%d').date()
     if 'active' in payload:
         tier.active = bool(payload['active'])
+    # effective_from may have moved in either direction; invalidate the whole history
+    mark_daily_pay_dirty(user_id)
     db.session.commit()
+    invalidate_tier_cache(user_id)
     return jsonify({'success': True, 'tier': tier.to_dict()})
 
 
@@ -4385,32 +6421,9 @@ def get_daily_metrics():
     if not period:
         period = PayPeriod(start_date=start_day, end_date=end_day, timezone='UTC')
 
-    # Build per-day rows
-    cur = start_day
-    out = []
-    while cur <= end_day:
-        demos_row = Demos.query.filter_by(user_id=user_id, date=cur).first()
-        sh_row = SalesHours.query.filter_by(user_id=user_id, date=cur).first()
-        calc = compute_daily_pay(user_id, cur, period)
-        out.append({
-            'date': cur.strftime('%Y-%m-%d'),
-            'user_id': user_id,
-            'sales': int(sh_row.sales) if sh_row else 0,
-            'hours': float(sh_row.hours) if sh_row else 0.0,
-            'demos': int(demos_row.demos) if demos_row else 0,
-            'unlocked_tier_id': calc['unlocked_tier_id'],
-            'tier_type': calc.get('tier_type', 'hourly'),
-            'hourly_rate': calc['hourly_rate'],
-            'commission_rate_pct': calc.get('commission_rate_pct', 0.0),
-            'demo_bonus': calc['demo_bonus'],
-            'computed_pay': calc['computed_pay'],
-            'notes': None,
-            'source_flags': {
-                'has_sales_hours': bool(sh_row),
-                'has_demos': bool(demos_row),
-            }
-        })
-        cur = cur + timedelta(days=1)
+    # Serve materialized DailyPay rows; missing or dirty days are rebuilt in one batched pass
+    rows = get_daily_pay_rows(user_id, start_day, end_day, period)
+    out = [r.to_metrics_dict() for r in rows]
 
     return jsonify({'success': True, 'data': out})
 
@@ -4425,11 +6438,985 @@ def recompute_period():
     period = PayPeriod.query.get(period_id)
     if not period:
         return jsonify({'success': False, 'message': 'Period not found'}), 404
-    # No materialized cache; respond with summary
-    days = (period.end_date - period.start_date).days + 1
-    return jsonify({'success': True, 'recomputed_days': days})
+    try:
+        rows = rebuild_daily_pay(user_id, period)
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"/api/recompute error: {e}", exc_info=True)
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to recompute'}), 500
+    total_pay = round(sum(float(r.computed_pay or 0) for r in rows), 2)
+    return jsonify({'success': True, 'recomputed_days': len(rows), 'total_pay': total_pay})
 
 
+@app.route('/api/cache-stats', methods=['GET'])
+@admin_required
+def cache_stats():
+    """Per-worker cache counters (hits, misses, invalidations)."""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'tier_schedule': tier_cache_stats(),
+        'trinfo_dir': trinfo_dir_index.stats(),
+        'trinfo_writes': trinfo_writer.stats(),
+        'login_hash': login_hash_stats(),
+        'login_latency': login_latency_stats(),
+        'auth_revocations': {'tracked': len(_auth_revocations), 'last_id': _auth_revocation_state['last_id']},
+    })
+
+
+# ===== Payroll Run =====
+PAYROLL_CSV_COLUMNS = [
+    'user_id', 'username', 'name', 'date', 'sales', 'hours', 'demos', 'tier_type',
+    'unlocked_tier_id', 'hourly_rate', 'commission_rate_pct', 'demo_bonus', 'computed_pay',
+]
+
+
+def compute_location_payroll(location_id: int, pay_period: PayPeriod):
+    """Compute pay for every user at a location across a pay period.
+
+    Inputs for all users are loaded with set-based queries and each user's days are
+    evaluated with the same tier rules as compute_daily_pay. Yields
+    (user, [daily metrics rows]) in username order.
+    """
+    users = (User.query
+             .filter(User.location_id == location_id)
+             .order_by(User.username.asc())
+             .all())
+    inputs_by_user = load_pay_inputs_for_users([u.id for u in users], pay_period.start_date,
+                                               pay_period.end_date, pay_period)
+    for user in users:
+        inputs = inputs_by_user[user.id]
+        daily = compute_period_pay(user.id, pay_period.start_date, pay_period.end_date, pay_period, inputs=inputs)
+        yield user, [_daily_pay_row(user.id, pay_period.id, day, calc, inputs).to_metrics_dict()
+                     for day, calc in daily.items()]
+
+
+def _can_manage_location_payroll(location_id: int) -> bool:
+    """Admins, or the location itself / its location manager."""
+    if 'user_id' in session:
+        actor = current_principal().user
+        if not actor:
+            return False
+        if actor.role == 'admin':
+            return True
+        return actor.role == 'location' and actor.location_id == location_id
+    if 'location_id' in session:
+        return session.get('location_id') == location_id
+    return False
+
+
+@app.route('/api/payroll/run', methods=['GET'])
+@login_required
+def payroll_run():
+    """Compute a whole location's payroll for a pay period in one request.
+    Query params: location_id, period_id, format (json|csv).
+    """
+    location_id = request.args.get('location_id', type=int)
+    period_id = request.args.get('period_id', type=int)
+    output_format = (request.args.get('format') or 'json').strip().lower()
+    if not (location_id and period_id):
+        return jsonify({'success': False, 'message': 'location_id and period_id required'}), 400
+
+    if not _can_manage_location_payroll(location_id):
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    period = PayPeriod.query.get(period_id)
+    if not period:
+        return jsonify({'success': False, 'message': 'Period not found'}), 404
+    if not Location.query.get(location_id):
+        return jsonify({'success': False, 'message': 'Location not found'}), 404
+
+    try:
+        if output_format == 'csv':
+            # Rows are computed per user while streaming so large locations start downloading immediately
+            results = compute_location_payroll(location_id, period)
+
+            def generate():
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(PAYROLL_CSV_COLUMNS)
+                for user, days in results:
+                    for d in days:
+                        writer.writerow([user.id, user.username, user.name or '', d['date'], d['sales'], d['hours'],
+                                         d['demos'], d['tier_type'], d['unlocked_tier_id'] or '', d['hourly_rate'],
+                                         d['commission_rate_pct'], d['demo_bonus'], d['computed_pay']])
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate(0)
+
+            filename = f"payroll_location{location_id}_{period.start_date}_{period.end_date}.csv"
+            return Response(stream_with_context(generate()), mimetype='text/csv',
+                            headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+        users_out = []
+        for user, days in compute_location_payroll(location_id, period):
+            users_out.append({
+                'user_id': user.id,
+                'username': user.username,
+                'name': user.name,
+                'total_pay': round(sum(d['computed_pay'] for d in days), 2),
+                'total_sales': sum(d['sales'] for d in days),
+                'total_hours': round(sum(d['hours'] for d in days), 2),
+                'total_demos': sum(d['demos'] for d in days),
+                'days': days,
+            })
+        return jsonify({
+            'success': True,
+            'location_id': location_id,
+            'period': period.to_dict(),
+            'total_pay': round(sum(u['total_pay'] for u in users_out), 2),
+            'users': users_out,
+        })
+    except Exception as e:
+        logger.error(f"/api/payroll/run error: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': 'Failed to run payroll'}), 500
+
+
+# ===== What-if Pay Simulation =====
+# Evaluates proposed tier schedules for a whole location over a (user x day) grid.
+# With NumPy the unlock masks and pay formulas run over columnar arrays, one pass per
+# tier; without it the scalar engine is used. Both follow _select_best_tier_by_pay:
+# highest base pay, then demo_bonus, then sales goal, and the earliest tier in
+# selection order wins a full tie.
+def _parse_tier_spec(spec: dict, user_id: int, default_from, synthetic_id: int):
+    tier_type = str(spec.get('tier_type', 'hourly'))
+    effective_from = spec.get('effective_from')
+    return TierSnapshot(
+        id=spec.get('id', synthetic_id),
+        user_id=user_id,
+        sales_goal_in_period=int(spec.get('sales_goal_in_period', spec.get('sales_goal_in_day', 0)) or 0),
+        daily_demo_min=int(spec.get('daily_demo_min', 0) or 0),
+        tier_type=tier_type,
+        hourly_rate=float(spec.get('hourly_rate', 0) or 0) if tier_type == 'hourly' else 0.0,
+        commission_rate_pct=float(spec.get('commission_rate_pct', 0) or 0) if tier_type == 'commission' else 0.0,
+        demo_bonus=float(spec.get('demo_bonus', 0) or 0),
+        effective_from=datetime.strptime(effective_from, '%Y-%m-%d').date() if effective_from else default_from,
+        order_index=int(spec.get('order_index', 0) or 0),
+    )
+
+
+def _tier_matches(tier, match: dict) -> bool:
+    for field, value in (match or {}).items():
+        field = 'sales_goal_in_period' if field == 'sales_goal_in_day' else field
+        current = getattr(tier, field, None)
+        try:
+            if float(current or 0) != float(value):
+                return False
+        except (TypeError, ValueError):
+            if str(current) != str(value):
+                return False
+    return True
+
+
+def build_proposed_tiers(current: dict, proposal: dict, start_day):
+    """Apply a simulation proposal to {user_id: [tiers]} and return a new mapping.
+
+    proposal['tiers'] replaces schedules: {user_id or "*": [tier specs]}.
+    proposal['overrides'] edits current tiers: [{"tier_id" or "match": ..., "set": {...}}].
+    """
+    replacements = proposal.get('tiers') or {}
+    overrides = proposal.get('overrides') or []
+    proposed = {}
+    # Tiers added by the proposal sort after existing ids on full ties, in spec order
+    synthetic_id = 10 ** 9
+    for uid, tiers in current.items():
+        specs = replacements.get(str(uid), replacements.get('*'))
+        if specs is not None:
+            new_tiers = []
+            for spec in specs:
+                new_tiers.append(_parse_tier_spec(spec, uid, start_day, synthetic_id))
+                synthetic_id += 1
+        else:
+            new_tiers = list(tiers)
+        for ov in overrides:
+            changes = dict(ov.get('set') or {})
+            if 'sales_goal_in_day' in changes:
+                changes['sales_goal_in_period'] = changes.pop('sales_goal_in_day')
+            for i, t in enumerate(new_tiers):
+                if 'tier_id' in ov and t.id != int(ov['tier_id']):
+                    continue
+                if 'match' in ov and not _tier_matches(t, ov['match']):
+                    continue
+                fields = {}
+                for k, v in changes.items():
+                    if k not in TierSnapshot._fields or k in ('id', 'user_id'):
+                        continue
+                    if k == 'effective_from':
+                        fields[k] = datetime.strptime(v, '%Y-%m-%d').date()
+                    elif k == 'tier_type':
+                        fields[k] = str(v)
+                    elif k in ('sales_goal_in_period', 'daily_demo_min', 'order_index'):
+                        fields[k] = int(v)
+                    else:
+                        fields[k] = float(v)
+                new_tiers[i] = t._replace(**fields)
+        # Keep selection order: order_index, sales goal, id
+        new_tiers.sort(key=lambda t: (int(t.order_index or 0), int(t.sales_goal_in_period or 0), t.id))
+        proposed[uid] = new_tiers
+    return proposed
+
+
+def load_location_pay_grid(user_ids, start_day, end_day):
+    """Load sales, hours and demos for users x days into columnar arrays (NumPy when available)."""
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    pseudo_period = PayPeriod(start_date=start_day, end_date=end_day)
+    inputs = load_pay_inputs_for_users(user_ids, start_day, end_day, pseudo_period)
+    day_pos = {d: i for i, d in enumerate(days)}
+    shape = (len(user_ids), len(days))
+    if np is not None:
+        sales = np.zeros(shape, dtype=np.float64)
+        hours = np.zeros(shape, dtype=np.float64)
+        demos = np.zeros(shape, dtype=np.float64)
+    else:
+        sales = [[0.0] * shape[1] for _ in range(shape[0])]
+        hours = [[0.0] * shape[1] for _ in range(shape[0])]
+        demos = [[0.0] * shape[1] for _ in range(shape[0])]
+    for ui, uid in enumerate(user_ids):
+        for day, (s_val, h_val) in inputs[uid]['sales_hours'].items():
+            if day in day_pos:
+                sales[ui][day_pos[day]] = int(s_val or 0)
+                hours[ui][day_pos[day]] = float(h_val or 0)
+        for day, d_val in inputs[uid]['demos'].items():
+            if day in day_pos:
+                demos[ui][day_pos[day]] = int(d_val or 0)
+    current_tiers = {uid: inputs[uid]['tiers'].all_tiers() for uid in user_ids}
+    return {'days': days, 'sales': sales, 'hours': hours, 'demos': demos, 'tiers': current_tiers}
+
+
+def _tier_slots(user_ids, tiers_by_user):
+    """Pad each user's tiers (already in selection order) into (users x slots) arrays.
+
+    Slot k holds every user's k-th tier; empty slots and tiers without effective_from
+    never unlock.
+    """
+    slots = max((len(tiers_by_user.get(uid) or []) for uid in user_ids), default=0)
+    shape = (len(user_ids), slots)
+    never = np.iinfo(np.int64).max
+    effective = np.full(shape, never, dtype=np.int64)
+    goal = np.zeros(shape)
+    min_demo = np.zeros(shape)
+    bonus = np.zeros(shape)
+    rate = np.zeros(shape)
+    commission = np.zeros(shape, dtype=bool)
+    for ui, uid in enumerate(user_ids):
+        for k, t in enumerate(tiers_by_user.get(uid) or []):
+            if t.effective_from is None:
+                continue
+            effective[ui, k] = t.effective_from.toordinal()
+            goal[ui, k] = int(t.sales_goal_in_period or 0)
+            min_demo[ui, k] = int(t.daily_demo_min or 0)
+            bonus[ui, k] = float(t.demo_bonus or 0)
+            if (t.tier_type or 'hourly') == 'commission':
+                commission[ui, k] = True
+                rate[ui, k] = float(t.commission_rate_pct or 0) / 100.0
+            else:
+                rate[ui, k] = float(t.hourly_rate or 0)
+    return slots, effective, goal, min_demo, bonus, rate, commission
+
+
+def _vectorized_pay(grid, user_ids, tiers_by_user):
+    """Per-day pay over the grid as a (users x days) array.
+
+    Tiers are padded into per-user slots and evaluated one slot at a time across the whole
+    users x days matrix, so the Python loop runs once per tier position (a handful), not
+    once per user or tier.
+    """
+    sales, hours, demos = grid['sales'], grid['hours'], grid['demos']
+    day_ordinals = np.array([d.toordinal() for d in grid['days']], dtype=np.int64)[np.newaxis, :]
+    slots, effective, goal, min_demo, bonus, rate, commission = _tier_slots(user_ids, tiers_by_user)
+    best_base = np.full(sales.shape, -np.inf)
+    best_bonus = np.zeros(sales.shape)
+    best_goal = np.zeros(sales.shape)
+    found = np.zeros(sales.shape, dtype=bool)
+    for k in range(slots):
+        k_goal, k_min_demo, k_bonus = goal[:, k:k + 1], min_demo[:, k:k + 1], bonus[:, k:k + 1]
+        unlocked = ((day_ordinals >= effective[:, k:k + 1]) & (sales >= k_goal)
+                    & ((k_min_demo <= 0) | (demos >= k_min_demo)))
+        base = rate[:, k:k + 1] * np.where(commission[:, k:k + 1], sales, hours)
+        # Strictly better only, so the earliest tier keeps a full tie (stable sort semantics)
+        better = unlocked & (~found | (base > best_base) |
+                             ((base == best_base) & ((k_bonus > best_bonus) |
+                                                     ((k_bonus == best_bonus) & (k_goal > best_goal)))))
+        best_base = np.where(better, base, best_base)
+        best_bonus = np.where(better, k_bonus, best_bonus)
+        best_goal = np.where(better, k_goal, best_goal)
+        found |= better
+    return np.round(np.where(found, best_base + demos * best_bonus, 0.0), 2)
+
+
+def _scalar_pay(grid, user_ids, tiers_by_user):
+    """Fallback when NumPy is unavailable: evaluate each cell with _evaluate_daily_pay."""
+    pay = []
+    for ui, uid in enumerate(user_ids):
+        index = TierIndex(tiers_by_user.get(uid) or [])
+        row = []
+        for di, day in enumerate(grid['days']):
+            calc = _evaluate_daily_pay(index.for_date(day), int(grid['sales'][ui][di]),
+                                       float(grid['hours'][ui][di]), int(grid['demos'][ui][di]), 0)
+            row.append(calc['computed_pay'])
+        pay.append(row)
+    return pay
+
+
+def simulate_location_pay(user_ids, start_day, end_day, proposal: dict):
+    """Return per-user current vs proposed pay totals for a tier proposal."""
+    grid = load_location_pay_grid(user_ids, start_day, end_day)
+    proposed_tiers = build_proposed_tiers(grid['tiers'], proposal, start_day)
+    evaluate = _vectorized_pay if np is not None else _scalar_pay
+    current = evaluate(grid, user_ids, grid['tiers'])
+    proposed = evaluate(grid, user_ids, proposed_tiers)
+    results = []
+    for ui, uid in enumerate(user_ids):
+        cur_row, new_row = current[ui], proposed[ui]
+        current_total = round(float(sum(cur_row)), 2)
+        proposed_total = round(float(sum(new_row)), 2)
+        results.append({
+            'user_id': uid,
+            'current_pay': current_total,
+            'proposed_pay': proposed_total,
+            'delta': round(proposed_total - current_total, 2),
+            'days_changed': int(sum(1 for a, b in zip(cur_row, new_row) if round(float(a) - float(b), 2) != 0)),
+        })
+    return results
+
+
+@app.route('/api/payroll/simulate', methods=['POST'])
+@login_required
+def payroll_simulate():
+    """What-if tier simulation for a location.
+    Body: location_id, start/end or period_id, and a proposal with `tiers` and/or `overrides`.
+    """
+    payload = request.get_json(force=True, silent=True) or {}
+    try:
+        location_id = int(payload.get('location_id') or 0)
+    except (TypeError, ValueError):
+        location_id = 0
+    if not location_id:
+        return jsonify({'success': False, 'message': 'location_id required'}), 400
+    if not _can_manage_location_payroll(location_id):
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    if payload.get('period_id'):
+        period = PayPeriod.query.get(int(payload['period_id']))
+        if not period:
+            return jsonify({'success': False, 'message': 'Period not found'}), 404
+        start_day, end_day = period.start_date, period.end_date
+    else:
+        try:
+            start_day = datetime.strptime(payload.get('start') or '', '%Y-%m-%d').date()
+            end_day = datetime.strptime(payload.get('end') or '', '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'success': False, 'message': 'period_id or start/end required'}), 400
+    if end_day < start_day:
+        return jsonify({'success': False, 'message': 'end must not be before start'}), 400
+
+    try:
+        users = User.query.filter(User.location_id == location_id).order_by(User.username.asc()).all()
+        names = {u.id: u.username for u in users}
+        results = simulate_location_pay([u.id for u in users], start_day, end_day, payload)
+        for r in results:
+            r['username'] = names.get(r['user_id'])
+        return jsonify({
+            'success': True,
+            'location_id': location_id,
+            'start': start_day.strftime('%Y-%m-%d'),
+            'end': end_day.strftime('%Y-%m-%d'),
+            'engine': 'numpy' if np is not None else 'python',
+            'current_total': round(sum(r['current_pay'] for r in results), 2),
+            'proposed_total': round(sum(r['proposed_pay'] for r in results), 2),
+            'delta_total': round(sum(r['delta'] for r in results), 2),
+            'users': results,
+        })
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Invalid proposal: {e}'}), 400
+    except Exception as e:
+        logger.error(f"/api/payroll/simulate error: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': 'Failed to run simulation'}), 500
+
+
+
+# ===== User Identity Resolution =====
+class UserResolver:
+    """Resolve user ids, emails and usernames for an ingestion run.
+
+    Only the users a batch names are loaded: prefetch() fetches {id, username, email,
+    location_id} for a batch's identifiers in one indexed query, plus a case-insensitive
+    query for whatever is still unknown, and resolve() fetches any identifier it has not
+    seen yet. Nothing is queried for an empty batch. Lookups try the exact value first,
+    then a trimmed, case-insensitive match. Misses are counted per identifier so callers
+    can report unmatched rows in bulk instead of row by row.
+    """
+
+    def __init__(self):
+        self.locations = {}
+        self._exact_email, self._exact_username = {}, {}
+        self._norm_email, self._norm_username = {}, {}
+        self._looked_up = set()
+        self.unmatched = {}
+
+    @staticmethod
+    def normalize(value) -> str:
+        return ' '.join(str(value).split()).lower() if value is not None else ''
+
+    @staticmethod
+    def _as_id(value):
+        try:
+            return int(value) if value not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    def _remember(self, query):
+        for uid, username, email, location_id in query.order_by(User.id):
+            self.locations[uid] = location_id
+            if email:
+                self._exact_email.setdefault(email, uid)
+                self._norm_email.setdefault(self.normalize(email), uid)
+            if username:
+                self._exact_username.setdefault(username, uid)
+                self._norm_username.setdefault(self.normalize(username), uid)
+
+    def _find_email(self, email):
+        return self._exact_email.get(email) or self._norm_email.get(self.normalize(email))
+
+    def _find_username(self, username):
+        return self._exact_username.get(username) or self._norm_username.get(self.normalize(username))
+
+    def prefetch(self, user_ids=(), emails=(), usernames=()):
+        """Load the users matching any of the given identifiers that were not looked up yet."""
+        ids = {i for i in map(self._as_id, user_ids) if i is not None and ('id', i) not in self._looked_up}
+        emails = {str(e) for e in emails if e and ('email', self.normalize(e)) not in self._looked_up}
+        usernames = {str(u) for u in usernames if u and ('username', self.normalize(u)) not in self._looked_up}
+        if not (ids or emails or usernames):
+            return
+        columns = (User.id, User.username, User.email, User.location_id)
+        conditions = []
+        if ids:
+            conditions.append(User.id.in_(ids))
+        if emails:
+            conditions.append(User.email.in_(emails | {self.normalize(e) for e in emails}))
+        if usernames:
+            conditions.append(User.username.in_(usernames | {self.normalize(u) for u in usernames}))
+        self._remember(db.session.query(*columns).filter(db.or_(*conditions)))
+
+        # Values stored with other casing or padding need the function match (no index)
+        left_emails = {self.normalize(e) for e in emails if not self._find_email(e)}
+        left_usernames = {self.normalize(u) for u in usernames if not self._find_username(u)}
+        conditions = []
+        if left_emails:
+            conditions.append(db.func.lower(db.func.trim(User.email)).in_(left_emails))
+        if left_usernames:
+            conditions.append(db.func.lower(db.func.trim(User.username)).in_(left_usernames))
+        if conditions:
+            self._remember(db.session.query(*columns).filter(db.or_(*conditions)))
+
+        self._looked_up.update(('id', i) for i in ids)
+        self._looked_up.update(('email', self.normalize(e)) for e in emails)
+        self._looked_up.update(('username', self.normalize(u)) for u in usernames)
+
+    def resolve(self, user_id=None, email=None, username=None):
+        """Return a known user id or None. Tries user_id, then email, then username.
+
+        An unknown id falls through to the email/username given with it; a miss is
+        counted once, under the first identifier the row carried.
+        """
+        self.prefetch([user_id], [email], [username])
+        labels = []
+        if user_id not in (None, ''):
+            uid = self._as_id(user_id)
+            if uid in self.locations:
+                return uid
+            labels.append(f"id {user_id}")
+        if email:
+            uid = self._find_email(email)
+            if uid:
+                return uid
+            labels.append(str(email).strip())
+        if username:
+            uid = self._find_username(username)
+            if uid:
+                return uid
+            labels.append(str(username).strip())
+        self._miss(labels[0] if labels else '(no user given)')
+        return None
+
+    def location_of(self, user_id):
+        return self.locations.get(user_id)
+
+    def _miss(self, label):
+        self.unmatched[label] = self.unmatched.get(label, 0) + 1
+
+    def unmatched_report(self):
+        """["no matching user for <who> (<n> rows)", ...] sorted by identifier."""
+        return [f"no matching user for {label} ({n} row{'s' if n != 1 else ''})"
+                for label, n in sorted(self.unmatched.items())]
+
+
+# ===== Bulk upserts =====
+UPSERT_CHUNK_ROWS = 200
+
+
+def bulk_upsert(model, rows, conflict_cols, update_cols):
+    """INSERT ... ON CONFLICT (conflict_cols) DO UPDATE for a list of row dicts.
+
+    Uses the SQLite/PostgreSQL dialect inserts; other backends fall back to a
+    SELECT-then-write per row. Rows sharing a key keep the last one. Caller commits.
+    """
+    if not rows:
+        return 0
+    deduped = {}
+    for row in rows:
+        deduped[tuple(row[c] for c in conflict_cols)] = row
+    rows = list(deduped.values())
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        for row in rows:
+            existing = model.query.filter_by(**{c: row[c] for c in conflict_cols}).first()
+            if existing:
+                for c in update_cols:
+                    setattr(existing, c, row[c])
+            else:
+                db.session.add(model(**row))
+        db.session.flush()
+        return len(rows)
+
+    table = model.__table__
+    for i in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        stmt = dialect_insert(table).values(rows[i:i + UPSERT_CHUNK_ROWS])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[c] for c in conflict_cols],
+            set_={c: stmt.excluded[c] for c in update_cols},
+        )
+        db.session.execute(stmt)
+    return len(rows)
+
+
+def bulk_increment(model, rows, key_cols, sum_cols):
+    """Add the sum_cols of each row onto the row with the same key (inserting it if absent).
+
+    Rows are pre-aggregated per key so each key is written once. Caller commits.
+    """
+    if not rows:
+        return 0
+    totals = {}
+    for row in rows:
+        key = tuple(row[c] for c in key_cols)
+        if key not in totals:
+            totals[key] = dict(row)
+        else:
+            for c in sum_cols:
+                totals[key][c] = (totals[key][c] or 0) + (row[c] or 0)
+    rows = list(totals.values())
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        for row in rows:
+            existing = model.query.filter_by(**{c: row[c] for c in key_cols}).first()
+            if existing:
+                for c in sum_cols:
+                    setattr(existing, c, (getattr(existing, c) or 0) + (row[c] or 0))
+            else:
+                db.session.add(model(**row))
+        db.session.flush()
+        return len(rows)
+
+    table = model.__table__
+    for i in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        stmt = dialect_insert(table).values(rows[i:i + UPSERT_CHUNK_ROWS])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[c] for c in key_cols],
+            set_={c: table.c[c] + stmt.excluded[c] for c in sum_cols},
+        )
+        db.session.execute(stmt)
+    return len(rows)
+
+
+# ===== Tracking Rollups =====
+# Daily (location, user, day) and weekly (location, ISO week) totals of TrackingData,
+# bumped in the same transaction as each tracking write so dashboards never scan raw rows.
+TRACKING_ROLLUP_SUM_COLS = ('entries',) + TRACKING_ROLLUP_METRICS
+
+
+def _rollup_metric(value, cast):
+    """Coerce a raw tracking value the way save_tracking_data's sales upsert does
+    (int(float(x or 0))), counting anything unreadable as 0 so a rollup never rejects a save."""
+    try:
+        return cast(float(value or 0))
+    except (TypeError, ValueError, OverflowError):
+        return cast(0)
+
+
+def apply_tracking_rollups(entries):
+    """Add tracking entries (dicts with location_id, user_id, date and metrics) to the rollups."""
+    daily, weekly = [], []
+    for e in entries:
+        metrics = {m: _rollup_metric(e.get(m), float if m in ('net_sales', 'hours_worked') else int)
+                   for m in TRACKING_ROLLUP_METRICS}
+        metrics['entries'] = e.get('entries', 1)
+        day = e['date']
+        iso_year, iso_week, iso_weekday = day.isocalendar()
+        daily.append(dict(metrics, location_id=e['location_id'], user_id=e['user_id'], date=day))
+        weekly.append(dict(metrics, location_id=e['location_id'], iso_year=iso_year, iso_week=iso_week,
+                           week_start=day - timedelta(days=iso_weekday - 1)))
+    bulk_increment(TrackingDailyRollup, daily, ['location_id', 'user_id', 'date'], TRACKING_ROLLUP_SUM_COLS)
+    bulk_increment(TrackingWeeklyRollup, weekly, ['location_id', 'iso_year', 'iso_week'], TRACKING_ROLLUP_SUM_COLS)
+
+
+def rebuild_tracking_rollups():
+    """Recompute both rollup tables from TrackingData. Caller commits."""
+    TrackingDailyRollup.query.delete()
+    TrackingWeeklyRollup.query.delete()
+    sums = [db.func.coalesce(db.func.sum(getattr(TrackingData, m)), 0) for m in TRACKING_ROLLUP_METRICS]
+    grouped = db.session.query(
+        TrackingData.location_id, TrackingData.user_id, TrackingData.date, db.func.count(TrackingData.id), *sums
+    ).group_by(TrackingData.location_id, TrackingData.user_id, TrackingData.date).all()
+    batch = []
+    for location_id, user_id, day, count, *totals in grouped:
+        batch.append(dict(zip(TRACKING_ROLLUP_METRICS, totals), location_id=location_id, user_id=user_id,
+                          date=day, entries=count))
+    apply_tracking_rollups(batch)
+    return len(batch)
+
+# Copies TRinfo submissions into Demos/SalesHours. A JSON checkpoint remembers the byte
+# offset reached in each log segment and the mtime of each legacy per-user file, so a run
+# only reads what was appended or changed since the previous one.
+TRINFO_SYNC_CHECKPOINT = os.path.join('instance', 'trinfo_sync.json')
+TRINFO_SYNC_LOCK = os.path.join('instance', 'trinfo_sync.lock')
+TRINFO_SYNC_INTERVAL = int(os.environ.get('MONUME_TRINFO_SYNC_INTERVAL', '0'))
+
+
+def _load_trinfo_checkpoint():
+    try:
+        with open(TRINFO_SYNC_CHECKPOINT, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {'log': dict(data.get('log') or {}), 'legacy': dict(data.get('legacy') or {})}
+    except Exception:
+        return {'log': {}, 'legacy': {}}
+
+
+def _changed_trinfo_entries(checkpoint, full=False):
+    """Yield TRinfo entries added/changed since checkpoint, advancing it in place."""
+    if os.path.isdir(TRINFO_DB_DIR):
+        with os.scandir(TRINFO_DB_DIR) as it:
+            legacy = sorted((e.name, e.stat().st_mtime_ns) for e in it
+                            if e.name.endswith('.json') and e.is_file())
+        for name, mtime in legacy:
+            if not full and checkpoint['legacy'].get(name) == mtime:
+                continue
+            try:
+                with open(os.path.join(TRINFO_DB_DIR, name), 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except Exception:
+                continue
+            yield from entries
+            checkpoint['legacy'][name] = mtime
+
+    if os.path.isdir(TRINFO_LOG_DIR):
+        for name in sorted(os.listdir(TRINFO_LOG_DIR)):
+            if not name.endswith('.ndjson'):
+                continue
+            path = os.path.join(TRINFO_LOG_DIR, name)
+            offset = 0 if full else int(checkpoint['log'].get(name) or 0)
+            if offset > os.path.getsize(path):
+                # Segment was repaired (torn tail dropped) after the last run; re-read it
+                offset = 0
+            with open(path, 'rb') as seg:
+                seg.seek(offset)
+                for raw in seg:
+                    if not raw.endswith(b'\n'):
+                        break  # record still being written; pick it up next run
+                    offset += len(raw)
+                    try:
+                        yield json.loads(raw.decode('utf-8'))
+                    except Exception:
+                        continue
+            checkpoint['log'][name] = offset
+
+
+def purge_trinfo_log_records(should_drop) -> int:
+    """Remove log-store records for which should_drop(record) is true. Returns the count.
+
+    Each affected day segment is rewritten, with a rebuilt index, under its segment lock
+    (both files are removed when nothing is left). The sync checkpoint then forgets those
+    segments so the next sync rereads them from the start instead of from a stale offset.
+    """
+    if not os.path.isdir(TRINFO_LOG_DIR):
+        return 0
+    removed, rewritten = 0, []
+    os.makedirs(os.path.dirname(TRINFO_SYNC_LOCK), exist_ok=True)
+    with open(TRINFO_SYNC_LOCK, 'a') as sync_lock:
+        if fcntl is not None:
+            fcntl.flock(sync_lock.fileno(), fcntl.LOCK_EX)
+        try:
+            for day in list(_trinfo_segment_dates()):
+                segment_path, index_path = trinfo_segment_paths(day)
+                with open(f"{segment_path[:-len('.ndjson')]}.lock", 'a') as lock_file:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                    try:
+                        _repair_trinfo_segment(segment_path, index_path)
+                        with open(segment_path, 'rb') as seg:
+                            lines = seg.readlines()
+                        kept = []
+                        for raw in lines:
+                            try:
+                                drop = should_drop(json.loads(raw.decode('utf-8')))
+                            except ValueError:
+                                drop = False
+                            if not drop:
+                                kept.append(raw)
+                        if len(kept) == len(lines):
+                            continue
+                        removed += len(lines) - len(kept)
+                        rewritten.append(os.path.basename(segment_path))
+                        if kept:
+                            data = b''.join(kept)
+                            _atomic_write_bytes(segment_path, data)
+                            _atomic_write_bytes(index_path, _rebuild_trinfo_index(data))
+                        else:
+                            for path in (segment_path, index_path):
+                                if os.path.exists(path):
+                                    os.remove(path)
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            if rewritten and os.path.exists(TRINFO_SYNC_CHECKPOINT):
+                checkpoint = _load_trinfo_checkpoint()
+                for name in rewritten:
+                    checkpoint['log'].pop(name, None)
+                _atomic_write_bytes(TRINFO_SYNC_CHECKPOINT, json.dumps(checkpoint).encode('utf-8'))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(sync_lock.fileno(), fcntl.LOCK_UN)
+    return removed
+
+
+def _lease_holder() -> str:
+    return f"{os.getpid()}:{threading.get_ident()}"
+
+
+def acquire_worker_lease(name: str, ttl_seconds: float) -> bool:
+    """Take or renew the named WorkerLease with one conditional UPDATE; False if another holder has it."""
+    now = datetime.utcnow()
+    if db.session.get(WorkerLease, name) is None:
+        try:
+            db.session.add(WorkerLease(name=name, holder=None, expires_at=now - timedelta(seconds=1)))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+    result = db.session.execute(
+        db.update(WorkerLease)
+        .where(WorkerLease.name == name,
+               db.or_(WorkerLease.expires_at < now, WorkerLease.holder == _lease_holder()))
+        .values(holder=_lease_holder(), expires_at=now + timedelta(seconds=ttl_seconds)))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def release_worker_lease(name: str) -> None:
+    try:
+        db.session.execute(db.update(WorkerLease).where(WorkerLease.name == name,
+                                                        WorkerLease.holder == _lease_holder())
+                           .values(holder=None, expires_at=datetime.utcnow()))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not release worker lease {name}: {e}")
+
+
+# Without fcntl (e.g. Windows) the sync lock file is advisory only, so a DB lease is used
+TRINFO_SYNC_LEASE_SECONDS = 900
+
+
+def sync_trinfo_to_db(full=False):
+    """Apply new TRinfo entries to Demos and SalesHours. Returns a summary dict.
+
+    Only one process runs a sync at a time; a concurrent call returns {'skipped': True}.
+    """
+    os.makedirs(os.path.dirname(TRINFO_SYNC_LOCK), exist_ok=True)
+    with open(TRINFO_SYNC_LOCK, 'a') as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return {'skipped': True}
+        elif not acquire_worker_lease('trinfo_sync', TRINFO_SYNC_LEASE_SECONDS):
+            return {'skipped': True}
+        try:
+            checkpoint = _load_trinfo_checkpoint()
+            parsed = []
+            for e in _changed_trinfo_entries(checkpoint, full=full):
+                username = (e.get('username') or '').strip()
+                try:
+                    day = datetime.strptime(e.get('date') or '', '%Y-%m-%d').date()
+                except Exception:
+                    continue
+                if username:
+                    parsed.append((username, day, e))
+
+            resolver = UserResolver()
+            resolver.prefetch(usernames=[username for username, _, _ in parsed])
+            now = datetime.utcnow()
+            demo_rows, sales_rows, dirty_from, unmatched = [], [], {}, set()
+            for username, day, e in parsed:
+                user_id = resolver.resolve(username=username)
+                if not user_id:
+                    unmatched.add(username)
+                    continue
+                if user_id not in dirty_from or day < dirty_from[user_id]:
+                    dirty_from[user_id] = day
+                demo_rows.append({'user_id': user_id, 'date': day, 'source': 'manual', 'updated_at': now,
+                                  'demos': int(e.get('opal_demos') or 0) + int(e.get('scan_demos') or 0)})
+                sales_val = int(float(e.get('net_sales') or 0))
+                hours_val = float(e.get('hours_worked') or 0)
+                if sales_val or hours_val:
+                    sales_rows.append({'user_id': user_id, 'date': day, 'sales': sales_val, 'hours': hours_val,
+                                       'source': 'manual', 'updated_at': now})
+
+            demos = bulk_upsert(Demos, demo_rows, ['user_id', 'date'], ['demos', 'source', 'updated_at'])
+            sales_hours = bulk_upsert(SalesHours, sales_rows, ['user_id', 'date'],
+                                      ['sales', 'hours', 'source', 'updated_at'])
+            for user_id, first_day in dirty_from.items():
+                mark_daily_pay_dirty(user_id, first_day)
+            db.session.commit()
+            # Only advance the checkpoint once the rows are committed
+            _atomic_write_bytes(TRINFO_SYNC_CHECKPOINT, json.dumps(checkpoint).encode('utf-8'))
+            return {'entries': len(parsed), 'demos': demos, 'sales_hours': sales_hours,
+                    'users': len(dirty_from), 'unmatched_usernames': sorted(unmatched)}
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                release_worker_lease('trinfo_sync')
+
+
+def _trinfo_sync_loop(interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                result = sync_trinfo_to_db()
+                if result.get('entries'):
+                    logger.info(f"TRinfo sync applied {result['entries']} entries")
+            except Exception as e:
+                logger.error(f"TRinfo sync failed: {str(e)}")
+            finally:
+                db.session.remove()
+
+
+def start_trinfo_sync_worker(interval):
+    """Run sync_trinfo_to_db every `interval` seconds in a daemon thread."""
+    thread = threading.Thread(target=_trinfo_sync_loop, args=(interval,), name='trinfo-sync', daemon=True)
+    thread.start()
+    return thread
+
+
+# ===== Background Workers =====
+# Periodic jobs run only in processes that actually serve requests: they start on the
+# first request a process handles, never at import, so migrate_db.py, the report CLIs,
+# tests and pool children that import this module do not start them.
+_background_workers = {'pid': None}
+_background_workers_lock = threading.Lock()
+
+
+def start_background_workers():
+    """Start this process's periodic jobs once (again after a fork)."""
+    if _background_workers['pid'] == os.getpid():
+        return
+    with _background_workers_lock:
+        if _background_workers['pid'] == os.getpid():
+            return
+        _background_workers['pid'] = os.getpid()
+        if TRINFO_SYNC_INTERVAL > 0:
+            start_trinfo_sync_worker(TRINFO_SYNC_INTERVAL)
+        if IMPORT_RESUME_INTERVAL > 0:
+            start_import_resume_worker(IMPORT_RESUME_INTERVAL)
+
+
+@app.before_request
+def _start_background_workers_on_first_request():
+    start_background_workers()
+
+
+# ===== Tracking Rollup API =====
+@app.route('/api/tracking_rollups', methods=['GET'])
+@login_required
+def get_tracking_rollups():
+    """Pre-aggregated tracking totals for dashboards.
+    Query params: grain=day|week (default day), location_id, user_id (day grain only),
+    start_date, end_date (YYYY-MM-DD, inclusive; week grain filters on week_start).
+    Non-admins are limited to their own location.
+    """
+    grain = (request.args.get('grain') or 'day').lower()
+    if grain not in ('day', 'week'):
+        return jsonify({'success': False, 'message': 'grain must be day or week'}), 400
+    location_id = request.args.get('location_id', type=int)
+    user_id = request.args.get('user_id', type=int)
+    try:
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else None
+        end = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+
+    if 'user_id' in session:
+        caller = current_principal().user
+        if not caller or caller.role != 'admin':
+            scope = caller.location_id if caller else None
+            if scope is None or (location_id and location_id != scope):
+                return jsonify({'success': False, 'message': 'Access denied'}), 403
+            location_id = scope
+    else:
+        scope = session.get('location_id')
+        if location_id and location_id != scope:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+        location_id = scope
+
+    if grain == 'day':
+        model, date_col = TrackingDailyRollup, TrackingDailyRollup.date
+        query = model.query
+        if user_id:
+            query = query.filter(model.user_id == user_id)
+        order = (model.date, model.user_id)
+    else:
+        model, date_col = TrackingWeeklyRollup, TrackingWeeklyRollup.week_start
+        query = model.query
+        order = (model.week_start, model.location_id)
+    if location_id:
+        query = query.filter(model.location_id == location_id)
+    if start:
+        query = query.filter(date_col >= start)
+    if end:
+        query = query.filter(date_col <= end)
+
+    rows = [r.to_dict() for r in query.order_by(*order).all()]
+    return jsonify({'success': True, 'grain': grain, 'count': len(rows), 'data': rows})
+
+
+@app.route('/api/tracking_rollups/rebuild', methods=['POST'])
+@admin_required
+def rebuild_tracking_rollups_api():
+    """Recompute rollups from raw TrackingData (e.g. after manual edits to the table)."""
+    try:
+        groups = rebuild_tracking_rollups()
+        db.session.commit()
+        return jsonify({'success': True, 'user_days': groups})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error rebuilding tracking rollups: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to rebuild rollups'}), 500
+
 
 # Add notification system route
 @app.route('/notification_system.js')
@@ -4450,6 +7437,18 @@ def internal_error(error):
     logger.error(f"Internal server error: {str(error)}")
     return jsonify({'error': 'Internal server error'}), 500
 
+# Bring the schema up to date on startup; with MONUME_MIGRATE_ON_START=0 deployments run
+# `python migrate_db.py` once per release instead of in every worker.
+# Skipped in multiprocessing spawn children, which re-import the launching script as
+# __mp_main__ when the server was started with `python server.py`.
+if __name__ != '__mp_main__' and os.environ.get('MONUME_MIGRATE_ON_START', '1') != '0':
+    try:
+        with app.app_context():
+            migrate_database()
+    except Exception as e:
+        logger.error(f"Database setup failed: {str(e)}")
+        # Server will still start
+
 # Patch the standalone `models` module to reuse the same DB / models
 try:
     import types, sys as _sys
@@ -1,7 +1,23 @@
+import io
+import os
+import sys
+import tempfile
+import threading
 import unittest
 from datetime import date
+from unittest import mock
 
-from server import app, db, User, UserTierSchedule, Demos, SalesHours, PayPeriod, compute_daily_pay
+# Keep the per-process import resume loop out of the tests; they drive jobs directly
+os.environ.setdefault('MONUME_IMPORT_RESUME_INTERVAL', '0')
+
+import server
+
+from server import (app, db, User, UserTierSchedule, Demos, SalesHours, PayPeriod, compute_daily_pay,
+                    compute_period_pay, DailyPay, get_daily_pay_rows, mark_daily_pay_dirty,
+                    Location, compute_location_payroll, invalidate_tier_cache, tier_cache_stats,
+                    simulate_location_pay, append_trinfo_record, iter_trinfo_log_records,
+                    run_schema_migrations, check_hot_query_plans, RawImport, iter_import_rows, run_import,
+                    revoke_auth)
 
 
 class CommissionTests(unittest.TestCase):
@@ -10,6 +26,7 @@ class CommissionTests(unittest.TestCase):
         self.ctx.push()
         db.drop_all()
         db.create_all()
+        invalidate_tier_cache()
 
         self.user = User(name='Test User', email='test@example.com', username='testuser', password='x')
         db.session.add(self.user)
@@ -79,6 +96,631 @@ class CommissionTests(unittest.TestCase):
         self.assertIsNone(calc['unlocked_tier_id'])
         self.assertEqual(calc['computed_pay'], 15.0*6)
 
+    def test_period_engine_matches_daily(self):
+        db.session.add_all([
+            UserTierSchedule(user_id=self.user.id, sales_goal_in_period=0, daily_demo_min=0,
+                             hourly_rate=15.0, demo_bonus=0.0, effective_from=date(2025, 1, 1), active=True),
+            UserTierSchedule(user_id=self.user.id, sales_goal_in_period=500, daily_demo_min=3,
+                             hourly_rate=20.0, demo_bonus=5.0, effective_from=date(2025, 1, 3), active=True),
+            UserTierSchedule(user_id=self.user.id, sales_goal_in_period=800, daily_demo_min=0, tier_type='commission',
+                             commission_rate_pct=10.0, demo_bonus=2.0, effective_from=date(2025, 1, 5), active=True),
+        ])
+        for day, sales, hours, demos in [(1, 300, 6, 1), (3, 600, 8, 4), (4, 900, 7.5, 0), (6, 1200, 8, 5), (7, 0, 0, 2)]:
+            db.session.add(SalesHours(user_id=self.user.id, date=date(2025, 1, day), sales=sales, hours=hours))
+            db.session.add(Demos(user_id=self.user.id, date=date(2025, 1, day), demos=demos))
+        db.session.commit()
+
+        batched = compute_period_pay(self.user.id, date(2025, 1, 2), date(2025, 1, 8), self.period)
+        self.assertEqual(list(batched), [date(2025, 1, d) for d in range(2, 9)])
+        for day, calc in batched.items():
+            self.assertEqual(calc, compute_daily_pay(self.user.id, day, self.period))
+
+    def test_daily_pay_materialization_rebuilds_dirty_days(self):
+        db.session.add(UserTierSchedule(user_id=self.user.id, sales_goal_in_period=0, daily_demo_min=0,
+                                        hourly_rate=15.0, demo_bonus=1.0, effective_from=date(2025, 1, 1), active=True))
+        db.session.add(SalesHours(user_id=self.user.id, date=date(2025, 1, 2), sales=100, hours=4))
+        db.session.commit()
+
+        rows = get_daily_pay_rows(self.user.id, date(2025, 1, 1), date(2025, 1, 3), self.period)
+        self.assertEqual(DailyPay.query.count(), 3)
+        self.assertEqual([float(r.computed_pay) for r in rows], [0.0, 60.0, 0.0])
+
+        sh = SalesHours.query.filter_by(user_id=self.user.id, date=date(2025, 1, 2)).first()
+        sh.hours = 8
+        mark_daily_pay_dirty(self.user.id, date(2025, 1, 2))
+        db.session.commit()
+        self.assertEqual(DailyPay.query.filter_by(dirty=True).count(), 2)
+
+        rows = get_daily_pay_rows(self.user.id, date(2025, 1, 1), date(2025, 1, 3), self.period)
+        self.assertEqual(float(rows[1].computed_pay), 120.0)
+        self.assertEqual(DailyPay.query.filter_by(dirty=True).count(), 0)
+        self.assertEqual(DailyPay.query.count(), 3)
+
+    def test_location_payroll_matches_daily(self):
+        loc = Location(name='Store', location_name='Store')
+        db.session.add(loc)
+        db.session.commit()
+        other = User(name='Other', email='other@example.com', username='other', password='x', location_id=loc.id)
+        self.user.location_id = loc.id
+        db.session.add(other)
+        db.session.commit()
+        for uid, rate in [(self.user.id, 15.0), (other.id, 18.0)]:
+            db.session.add(UserTierSchedule(user_id=uid, sales_goal_in_period=0, daily_demo_min=0,
+                                            hourly_rate=rate, demo_bonus=2.0, effective_from=date(2025, 1, 1), active=True))
+            db.session.add(SalesHours(user_id=uid, date=date(2025, 1, 3), sales=250, hours=6))
+            db.session.add(Demos(user_id=uid, date=date(2025, 1, 3), demos=3))
+        db.session.commit()
+
+        results = dict((u.id, days) for u, days in compute_location_payroll(loc.id, self.period))
+        self.assertEqual(set(results), {self.user.id, other.id})
+        for uid, days in results.items():
+            self.assertEqual(len(days), 15)
+            for d in days:
+                expected = compute_daily_pay(uid, date.fromisoformat(d['date']), self.period)
+                self.assertEqual(d['computed_pay'], expected['computed_pay'])
+                self.assertEqual(d['unlocked_tier_id'], expected['unlocked_tier_id'])
+
+    def test_tier_cache_bisects_effective_dates(self):
+        early = UserTierSchedule(user_id=self.user.id, sales_goal_in_period=0, daily_demo_min=0,
+                                 hourly_rate=15.0, demo_bonus=0.0, effective_from=date(2025, 1, 1), active=True)
+        late = UserTierSchedule(user_id=self.user.id, sales_goal_in_period=0, daily_demo_min=0,
+                                hourly_rate=25.0, demo_bonus=0.0, effective_from=date(2025, 1, 10), active=True)
+        db.session.add_all([early, late])
+        db.session.add(SalesHours(user_id=self.user.id, date=date(2025, 1, 5), sales=0, hours=4))
+        db.session.add(SalesHours(user_id=self.user.id, date=date(2025, 1, 12), sales=0, hours=4))
+        db.session.commit()
+
+        before = tier_cache_stats()
+        self.assertEqual(compute_daily_pay(self.user.id, date(2025, 1, 5), self.period)['computed_pay'], 60.0)
+        self.assertEqual(compute_daily_pay(self.user.id, date(2025, 1, 12), self.period)['computed_pay'], 100.0)
+        after = tier_cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+        late.hourly_rate = 30.0
+        db.session.commit()
+        invalidate_tier_cache(self.user.id)
+        self.assertEqual(compute_daily_pay(self.user.id, date(2025, 1, 12), self.period)['computed_pay'], 120.0)
+
+        # An edit made by another worker leaves this cache stale, but materialization reads the DB
+        late.hourly_rate = 35.0
+        db.session.commit()
+        self.assertEqual(compute_daily_pay(self.user.id, date(2025, 1, 12), self.period)['computed_pay'], 120.0)
+        rows = server.rebuild_daily_pay(self.user.id, self.period, date(2025, 1, 12), date(2025, 1, 12))
+        self.assertEqual(float(rows[0].computed_pay), 140.0)
+
+    def test_simulation_matches_current_pay_and_applies_overrides(self):
+        db.session.add_all([
+            UserTierSchedule(user_id=self.user.id, sales_goal_in_period=0, daily_demo_min=0,
+                             hourly_rate=15.0, demo_bonus=1.0, effective_from=date(2025, 1, 1), active=True),
+            UserTierSchedule(user_id=self.user.id, sales_goal_in_period=1000, daily_demo_min=2,
+                             hourly_rate=20.0, demo_bonus=2.0, effective_from=date(2025, 1, 1), active=True),
+        ])
+        for day, sales in [(2, 950), (3, 1200), (4, 400)]:
+            db.session.add(SalesHours(user_id=self.user.id, date=date(2025, 1, day), sales=sales, hours=8))
+            db.session.add(Demos(user_id=self.user.id, date=date(2025, 1, day), demos=3))
+        db.session.commit()
+
+        expected = sum(compute_daily_pay(self.user.id, date(2025, 1, d), self.period)['computed_pay']
+                       for d in range(1, 16))
+        [unchanged] = simulate_location_pay([self.user.id], date(2025, 1, 1), date(2025, 1, 15), {})
+        self.assertEqual(unchanged['current_pay'], round(expected, 2))
+        self.assertEqual(unchanged['delta'], 0.0)
+
+        proposal = {'overrides': [{'match': {'sales_goal_in_period': 1000}, 'set': {'sales_goal_in_period': 900}}]}
+        [result] = simulate_location_pay([self.user.id], date(2025, 1, 1), date(2025, 1, 15), proposal)
+        # Day 2 (950 sales) now unlocks the 20/h tier: +5/h * 8h and +1 bonus * 3 demos
+        self.assertEqual(result['delta'], 43.0)
+        self.assertEqual(result['days_changed'], 1)
+
+    @unittest.skipIf(server.np is None, 'NumPy not installed')
+    def test_vectorized_pay_matches_scalar_engine(self):
+        import random
+        from datetime import timedelta
+        rng = random.Random(7)
+        np = server.np
+        days = [date(2025, 1, 1) + timedelta(days=i) for i in range(31)]
+        user_ids = list(range(1, 201))
+        shape = (len(user_ids), len(days))
+        grid = {'days': days,
+                'sales': np.array([[rng.choice([0, 400, 900, 1000, 1500]) for _ in days] for _ in user_ids], dtype=float),
+                'hours': np.array([[rng.choice([0, 4, 7.5, 8]) for _ in days] for _ in user_ids], dtype=float),
+                'demos': np.array([[rng.randint(0, 4) for _ in days] for _ in user_ids], dtype=float)}
+        tier_id = 0
+        tiers_by_user = {}
+        for uid in user_ids:
+            tiers = []
+            for _ in range(rng.randint(0, 5)):
+                tier_id += 1
+                tiers.append(server.TierSnapshot(
+                    id=tier_id, user_id=uid, sales_goal_in_period=rng.choice([0, 500, 1000]),
+                    daily_demo_min=rng.choice([0, 0, 2]), tier_type=rng.choice(['hourly', 'commission']),
+                    hourly_rate=rng.choice([15.0, 20.0]), commission_rate_pct=rng.choice([5.0, 10.0]),
+                    demo_bonus=rng.choice([0.0, 1.0, 2.0]),
+                    effective_from=rng.choice([None, days[0], days[10], days[20]]), order_index=rng.randint(0, 1)))
+            tiers.sort(key=lambda t: (t.order_index, t.sales_goal_in_period, t.id))
+            tiers_by_user[uid] = tiers
+
+        vectorized = server._vectorized_pay(grid, user_ids, tiers_by_user)
+        scalar = np.array(server._scalar_pay(grid, user_ids, tiers_by_user))
+        self.assertEqual(vectorized.shape, shape)
+        self.assertTrue(np.array_equal(vectorized, np.round(scalar, 2)))
+
+    def test_trinfo_concurrent_appends_survive_torn_tail(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(server, 'TRINFO_LOG_DIR', tmp):
+            append_trinfo_record({'username': 'amy', 'date': '2025-01-02', 'net_sales': 1})
+            # Simulate a writer that crashed mid-record
+            with open(os.path.join(tmp, '2025-01-02.ndjson'), 'ab') as seg:
+                seg.write(b'{"username":"amy","da')
+
+            def submit(n):
+                for i in range(10):
+                    append_trinfo_record({'username': f'user{n}', 'date': '2025-01-02', 'net_sales': i})
+            threads = [threading.Thread(target=submit, args=(n,)) for n in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            records = list(iter_trinfo_log_records(date(2025, 1, 2), date(2025, 1, 2)))
+            self.assertEqual(len(records), 81)
+            self.assertEqual(len(list(iter_trinfo_log_records(username='user3'))), 10)
+            self.assertEqual(len(list(iter_trinfo_log_records(username='amy'))), 1)
+
+    def test_trinfo_log_purge_rewrites_segments_and_indexes(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(server, 'TRINFO_LOG_DIR', tmp), \
+                mock.patch.object(server, 'TRINFO_SYNC_LOCK', os.path.join(tmp, 'sync.lock')), \
+                mock.patch.object(server, 'TRINFO_SYNC_CHECKPOINT', os.path.join(tmp, 'sync.json')):
+            for day, user in (('2025-01-02', 'testuser'), ('2025-01-02', 'amy'), ('2025-01-03', 'testuser')):
+                append_trinfo_record({'username': user, 'date': day, 'net_sales': 1})
+            removed = server.purge_trinfo_log_records(lambda rec: rec.get('username') == 'testuser')
+
+            self.assertEqual(removed, 2)
+            self.assertEqual([r['username'] for r in iter_trinfo_log_records()], ['amy'])
+            self.assertEqual(list(iter_trinfo_log_records(username='testuser')), [])
+            self.assertEqual(len(list(iter_trinfo_log_records(username='amy'))), 1)
+            self.assertFalse(os.path.exists(os.path.join(tmp, '2025-01-03.ndjson')))
+
+    def test_trinfo_sync_is_incremental_resumable_and_exclusive(self):
+        import json
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(server, 'TRINFO_LOG_DIR', tmp), \
+                mock.patch.object(server, 'TRINFO_DB_DIR', os.path.join(tmp, 'legacy')), \
+                mock.patch.object(server, 'TRINFO_SYNC_LOCK', os.path.join(tmp, 'sync.lock')), \
+                mock.patch.object(server, 'TRINFO_SYNC_CHECKPOINT', os.path.join(tmp, 'sync.json')):
+            segment = os.path.join(tmp, '2025-01-02.ndjson')
+
+            def submit(day, demos):
+                append_trinfo_record({'username': 'testuser', 'date': f'2025-01-0{day}', 'opal_demos': demos,
+                                      'scan_demos': 1, 'net_sales': 100 * day, 'hours_worked': 4})
+
+            def checkpoint():
+                with open(server.TRINFO_SYNC_CHECKPOINT) as f:
+                    return json.load(f)['log']
+
+            submit(2, 2)
+            submit(3, 1)
+            self.assertEqual(server.sync_trinfo_to_db()['entries'], 2)
+            self.assertEqual(checkpoint()['2025-01-02.ndjson'], os.path.getsize(segment))
+            self.assertEqual(server.sync_trinfo_to_db()['entries'], 0)
+
+            # Only the appended record is read; a torn tail waits for the next run
+            submit(2, 5)
+            with open(segment, 'ab') as seg:
+                seg.write(b'{"username":"testuser","da')
+            self.assertEqual(server.sync_trinfo_to_db()['entries'], 1)
+            self.assertEqual(Demos.query.filter_by(date=date(2025, 1, 2)).one().demos, 6)
+
+            # A run that fails before committing leaves the checkpoint where it was
+            before = checkpoint()
+            submit(3, 7)
+            with mock.patch.object(server, 'bulk_upsert', side_effect=RuntimeError('db went away')):
+                with self.assertRaises(RuntimeError):
+                    server.sync_trinfo_to_db()
+            self.assertEqual(checkpoint(), before)
+            self.assertEqual(server.sync_trinfo_to_db()['entries'], 1)
+            self.assertEqual(Demos.query.filter_by(date=date(2025, 1, 3)).one().demos, 8)
+
+            # A second runner is turned away while the lock or the DB lease is held
+            if server.fcntl is not None:
+                with open(server.TRINFO_SYNC_LOCK, 'a') as held:
+                    server.fcntl.flock(held.fileno(), server.fcntl.LOCK_EX)
+                    self.assertEqual(server.sync_trinfo_to_db(), {'skipped': True})
+                    server.fcntl.flock(held.fileno(), server.fcntl.LOCK_UN)
+            with mock.patch.object(server, 'fcntl', None):
+                with mock.patch.object(server, '_lease_holder', return_value='other-worker'):
+                    self.assertTrue(server.acquire_worker_lease('trinfo_sync', 60))
+                self.assertEqual(server.sync_trinfo_to_db(), {'skipped': True})
+                with mock.patch.object(server, '_lease_holder', return_value='other-worker'):
+                    server.release_worker_lease('trinfo_sync')
+                self.assertEqual(server.sync_trinfo_to_db()['entries'], 0)
+
+    def test_hot_queries_use_indexes(self):
+        run_schema_migrations()
+        self.assertEqual(check_hot_query_plans(), [])
+        server.require_hot_query_plans()
+
+    def test_schema_migrations_fresh_legacy_and_rerun(self):
+        # Fresh database: every step runs once and is recorded
+        db.drop_all()
+        self.assertEqual(run_schema_migrations(), server.SCHEMA_VERSION)
+        self.assertEqual(server.current_schema_version(), server.SCHEMA_VERSION)
+        self.assertIsNotNone(User.query.filter_by(username='admin').first())
+
+        # Rerun against a current schema issues no DDL
+        with mock.patch.object(db, 'create_all') as create_all, \
+                mock.patch.object(server, '_add_column_sqlite') as add_column:
+            self.assertEqual(run_schema_migrations(), 0)
+        create_all.assert_not_called()
+        add_column.assert_not_called()
+
+        # An install that predates schema_version and lacks a later column converges
+        db.session.execute(db.text('DROP TABLE schema_version'))
+        db.session.execute(db.text('ALTER TABLE location DROP COLUMN auth_version'))
+        db.session.commit()
+        self.assertEqual(run_schema_migrations(), server.SCHEMA_VERSION)
+        self.assertIn('auth_version', server._table_columns('location'))
+        self.assertEqual(server.migrate_database()['applied'], 0)
+
+    def test_streaming_csv_import_handles_quoting_and_reports_unmatched(self):
+        content = (b'Date,"Net Sales",Hours,Email,Note\n'
+                   b'2025-01-02,"1,250",8,test@example.com,"late, covered"\n'
+                   b'2025-01-03,300,4,missing@example.com,\n')
+        raw = RawImport(filename='pay.csv', file_hash='abc')
+        db.session.add(raw)
+        db.session.commit()
+        run_import(raw, iter_import_rows(io.BytesIO(content), 'pay.csv'))
+
+        self.assertEqual((raw.status, raw.rows_parsed, raw.rows_upserted, raw.rows_skipped), ('completed', 2, 1, 1))
+        self.assertEqual(raw.errors, ['no matching user for missing@example.com (1 row)'])
+        row = SalesHours.query.filter_by(user_id=self.user.id, date=date(2025, 1, 2)).one()
+        self.assertEqual((row.sales, float(row.hours), row.import_id), (1250, 8.0, raw.id))
+
+        # A re-export overlapping the first one only rewrites the changed row
+        overlap = (b'date,sales,hours,email\n'
+                   b'2025-01-02,1250,8.00,test@example.com\n'
+                   b'2025-01-04,90,2,  Test@Example.com \n')
+        again = RawImport(filename='pay2.csv', file_hash='def')
+        db.session.add(again)
+        db.session.commit()
+        run_import(again, iter_import_rows(io.BytesIO(overlap), 'pay2.csv'))
+        self.assertEqual((again.rows_upserted, again.rows_unchanged), (1, 1))
+        self.assertEqual(SalesHours.query.filter_by(date=date(2025, 1, 2)).one().import_id, raw.id)
+
+    def test_failed_import_still_invalidates_committed_chunks(self):
+        db.session.add(UserTierSchedule(user_id=self.user.id, sales_goal_in_period=0, daily_demo_min=0,
+                                        hourly_rate=15.0, demo_bonus=1.0, effective_from=date(2025, 1, 1), active=True))
+        db.session.commit()
+        get_daily_pay_rows(self.user.id, date(2025, 1, 1), date(2025, 1, 3), self.period)
+
+        def rows():
+            yield {'date': '2025-01-02', 'sales': 100, 'hours': 8, 'email': 'test@example.com'}
+            raise RuntimeError('upload went away')
+
+        raw = RawImport(filename='broken.json', file_hash='broken')
+        db.session.add(raw)
+        db.session.commit()
+        with mock.patch.object(server, 'IMPORT_CHUNK_ROWS', 1), self.assertRaises(RuntimeError):
+            run_import(raw, rows())
+        db.session.rollback()
+
+        self.assertEqual(SalesHours.query.count(), 1)
+        self.assertEqual(DailyPay.query.filter_by(dirty=True).count(), 2)
+        pay = get_daily_pay_rows(self.user.id, date(2025, 1, 1), date(2025, 1, 3), self.period)
+        self.assertEqual(float(pay[1].computed_pay), 120.0)
+
+    def test_rerun_import_repairs_pay_for_unchanged_rows(self):
+        db.session.add(UserTierSchedule(user_id=self.user.id, sales_goal_in_period=0, daily_demo_min=0,
+                                        hourly_rate=15.0, demo_bonus=1.0, effective_from=date(2025, 1, 1), active=True))
+        db.session.commit()
+        get_daily_pay_rows(self.user.id, date(2025, 1, 1), date(2025, 1, 3), self.period)
+        # Stored by an earlier attempt that never invalidated pay
+        db.session.add(SalesHours(user_id=self.user.id, date=date(2025, 1, 2), sales=100, hours=8))
+        db.session.commit()
+
+        raw = RawImport(filename='retry.json', file_hash='retry')
+        db.session.add(raw)
+        db.session.commit()
+        run_import(raw, [{'date': '2025-01-02', 'sales': '100', 'hours': '8.00', 'email': 'test@example.com'}])
+
+        self.assertEqual((raw.rows_upserted, raw.rows_unchanged), (0, 1))
+        pay = get_daily_pay_rows(self.user.id, date(2025, 1, 1), date(2025, 1, 3), self.period)
+        self.assertEqual(float(pay[1].computed_pay), 120.0)
+
+    def test_resume_requeues_only_imports_without_recent_heartbeat(self):
+        from datetime import datetime, timedelta
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        busy = RawImport(filename='big.csv', file_hash='big', status='running', started_at=long_ago,
+                         heartbeat_at=datetime.utcnow())
+        orphan = RawImport(filename='dead.csv', file_hash='dead', status='running', started_at=long_ago,
+                           heartbeat_at=long_ago)
+        db.session.add_all([busy, orphan])
+        db.session.commit()
+        with mock.patch.object(server, 'submit_import_job') as submit:
+            self.assertEqual(server.resume_pending_imports(), [orphan.id])
+        submit.assert_called_once_with(orphan.id)
+        self.assertEqual((busy.status, orphan.status), ('running', 'queued'))
+
+    def test_reuploading_a_failed_import_retries_it(self):
+        admin = User(name='Admin', email='boss@example.com', username='boss', password='x', role='admin')
+        db.session.add(admin)
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin.id
+        body = {'rows': [{'date': '2025-01-02', 'sales': 100, 'hours': 4, 'email': 'test@example.com'}]}
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(server, 'IMPORT_SPOOL_DIR', tmp), \
+                mock.patch.object(server, 'IMPORT_WORKERS', 0):
+            with mock.patch.object(server, 'run_import', side_effect=RuntimeError('disk full')):
+                first = client.post('/api/imports/xls', json=body).get_json()
+            self.assertEqual(first['status'], 'failed')
+
+            retry = client.post('/api/imports/xls', json=body).get_json()
+            self.assertEqual((retry['import_id'], retry['status']), (first['import_id'], 'completed'))
+            self.assertEqual(SalesHours.query.filter_by(user_id=self.user.id).count(), 1)
+            again = client.post('/api/imports/xls', json=body).get_json()
+            self.assertEqual((again['import_id'], again['status']), (first['import_id'], 'duplicate'))
+
+    def test_json_import_maps_each_row_and_falls_back_from_unknown_id(self):
+        rows = [{'date': '2025-01-02', 'sales': 100, 'hours': 2, 'user_id': 999, 'email': 'test@example.com'},
+                {'Work Date': '01/03/2025', 'Net Sales': '200', 'Worked Hours': 3, 'User': 'testuser'}]
+        raw = RawImport(filename='api.json', file_hash='json')
+        db.session.add(raw)
+        db.session.commit()
+        run_import(raw, rows)
+
+        self.assertEqual((raw.rows_upserted, raw.rows_skipped, raw.errors), (2, 0, []))
+        stored = {r.date: (r.sales, float(r.hours)) for r in SalesHours.query.filter_by(user_id=self.user.id)}
+        self.assertEqual(stored, {date(2025, 1, 2): (100, 2.0), date(2025, 1, 3): (200, 3.0)})
+
+    def test_user_resolver_loads_only_requested_users(self):
+        other = User(name='Other', email='Other@Example.com', username='Other', password='x')
+        db.session.add(other)
+        db.session.commit()
+        user_id, other_id = self.user.id, other.id
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        db.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            resolver = server.UserResolver()
+            resolver.prefetch()
+            self.assertEqual(statements, [])
+            resolver.prefetch(emails=['other@example.com'], usernames=['testuser'])
+            self.assertEqual(resolver.resolve(email='other@example.com'), other_id)
+            self.assertEqual(resolver.resolve(username='testuser'), user_id)
+            self.assertEqual(len(statements), 2)
+            self.assertIsNone(resolver.resolve(user_id=999))
+            self.assertEqual(len(statements), 3)
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', record)
+
+    def test_tracking_save_tolerates_blank_and_decimal_strings(self):
+        location = Location(name='L', location_name='L', location_username='l', location_password='x')
+        db.session.add(location)
+        db.session.commit()
+        self.user.location_id = location.id
+        self.user.role = 'admin'
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = self.user.id
+        resp = client.post('/save_tracking_data', json={
+            'user_id': self.user.id, 'date': '2025-01-02', 'opal_demos': '3.0', 'opal_sales': '',
+            'scan_demos': None, 'scan_sold': 'n/a', 'net_sales': '120.5', 'hours_worked': None})
+        self.assertEqual(resp.status_code, 201)
+        rollup = server.TrackingDailyRollup.query.one()
+        self.assertEqual((rollup.entries, rollup.opal_demos, rollup.opal_sales, rollup.scan_sold, rollup.net_sales),
+                         (1, 3, 0, 0, 120.5))
+
+    def test_login_cap_leaves_a_request_thread_free(self):
+        with mock.patch.object(sys, 'argv', ['gunicorn', 'server:app', '--threads=2']):
+            self.assertEqual(server.server_thread_count(), 2)
+        self.user.password = server.hash_password('pw')
+        db.session.commit()
+        entered, release = threading.Event(), threading.Event()
+        real_verify = server.login_hashing.verify
+
+        def slow_verify(pwhash, password):
+            entered.set()
+            release.wait(10)
+            return real_verify(pwhash, password)
+
+        results = []
+
+        def first_login():
+            with app.app_context():
+                results.append(app.test_client().post('/api/login', json={'username': 'testuser', 'password': 'pw'}))
+
+        slots = server.LOGIN_MAX_INFLIGHT
+        self.assertEqual(slots, 1)
+        with mock.patch.object(server, 'LOGIN_HASH_WORKERS', 0), \
+                mock.patch.object(server, '_login_slots', threading.BoundedSemaphore(slots)), \
+                mock.patch.object(server.login_hashing, 'verify', slow_verify):
+            worker = threading.Thread(target=first_login)
+            worker.start()
+            self.assertTrue(entered.wait(10))
+            client = app.test_client()
+            overloaded = client.post('/api/login', json={'username': 'testuser', 'password': 'pw'})
+            self.assertEqual(overloaded.status_code, 429)
+            self.assertIn('Retry-After', overloaded.headers)
+            self.assertEqual(client.get('/api/health').status_code, 200)
+            release.set()
+            worker.join(10)
+        self.assertEqual(results[0].status_code, 200)
+
+    def test_tracking_batch_reports_rejected_entries_and_writes_nothing(self):
+        store_a = Location(name='A', location_name='A', location_username='a', location_password='x')
+        store_b = Location(name='B', location_name='B', location_username='b', location_password='x')
+        db.session.add_all([store_a, store_b])
+        db.session.commit()
+        self.user.location_id = store_a.id
+        other = User(name='Other', email='other@example.com', username='other', password='x', location_id=store_b.id)
+        floating = User(name='Floating', email='floating@example.com', username='floating', password='x')
+        admin = User(name='Admin', email='boss@example.com', username='boss', password='x', role='admin')
+        db.session.add_all([other, floating, admin])
+        db.session.commit()
+        day = {'date': '2025-01-02', 'opal_demos': 1, 'net_sales': 10, 'hours_worked': 1}
+        written = lambda: (server.TrackingData.query.count(), server.TrackingDailyRollup.query.count(),
+                           Demos.query.count(), SalesHours.query.count())
+
+        location_client = app.test_client()
+        with location_client.session_transaction() as sess:
+            sess['location_id'] = store_a.id
+        resp = location_client.post('/save_tracking_data/batch', json=[
+            dict(day, user_id=self.user.id), dict(day, username='other'), dict(day, email='missing@example.com')])
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resp.get_json()['denied_entries'], [1, 2])
+        self.assertEqual(resp.get_json()['unmatched'], ['no matching user for missing@example.com (1 row)'])
+        self.assertEqual(written(), (0, 0, 0, 0))
+
+        admin_client = app.test_client()
+        with admin_client.session_transaction() as sess:
+            sess['user_id'] = admin.id
+        resp = admin_client.post('/save_tracking_data/batch', json={'entries': [
+            dict(day, username='other'), dict(day, username='floating'), dict(day, user_id=999)]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json()['invalid_entries'], [1, 2])
+        self.assertEqual(resp.get_json()['unmatched'], ['no matching user for id 999 (1 row)'])
+        self.assertEqual(written(), (0, 0, 0, 0))
+
+        resp = admin_client.post('/save_tracking_data/batch', json=[dict(day, username='other', opal_demos='many')])
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(written(), (0, 0, 0, 0))
+
+        resp = location_client.post('/save_tracking_data/batch', json=[
+            dict(day, user_id=self.user.id), dict(day, email='TEST@example.com', date='2025-01-03')])
+        self.assertEqual((resp.status_code, resp.get_json()['saved']), (201, 2))
+        self.assertEqual(written(), (2, 2, 2, 2))
+
+    def test_keyset_pages_match_unpaginated_lists(self):
+        store = Location(name='A', location_name='A', location_username='a', location_password='x')
+        db.session.add(store)
+        db.session.commit()
+        admin = User(name='Admin', email='boss@example.com', username='boss', password='x', role='admin')
+        db.session.add(admin)
+        db.session.commit()
+        # Ties on date, inserted out of date order
+        for day in (3, 1, 3, 2, 3, 1, 3):
+            db.session.add(server.TrackingData(user_id=self.user.id, location_id=store.id, date=date(2025, 1, day),
+                                               opal_demos=day))
+        for day in ('2025-01-02', None, '01/03/2025', None, '2025-01-01', '', '2025-01-02'):
+            db.session.add(server.Appointment(client_name='c', date=day, location_id=store.id))
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin.id
+
+        def page_all(url, items, cursor_of):
+            seen, cursor = [], None
+            while True:
+                resp = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+                self.assertEqual(resp.status_code, 200)
+                batch = items(resp)
+                self.assertLessEqual(len(batch), 3)
+                seen.extend(batch)
+                cursor = cursor_of(resp)
+                if not cursor:
+                    return seen
+
+        full = client.get('/api/tracking_data').get_json()
+        paged = page_all('/api/tracking_data?limit=3', lambda r: r.get_json(), lambda r: r.headers.get('X-Next-Cursor'))
+        self.assertEqual([r['id'] for r in paged], [r['id'] for r in sorted(full, key=lambda r: (r['date'], r['id']))])
+        self.assertEqual(len(paged), 7)
+
+        full = client.get('/api/appointments').get_json()['appointments']
+        paged = page_all('/api/appointments?limit=3', lambda r: r.get_json()['appointments'],
+                         lambda r: r.get_json()['next_cursor'])
+        self.assertEqual([a['id'] for a in paged], sorted(a['id'] for a in full))
+        self.assertEqual(len(paged), 7)
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(server, 'TRINFO_LOG_DIR', tmp), \
+                mock.patch.object(server, 'TRINFO_DB_DIR', os.path.join(tmp, 'legacy')), \
+                mock.patch.object(server, 'trinfo_dir_index', server.TrinfoDirIndex(os.path.join(tmp, 'legacy'))):
+            for i, day in enumerate(('2025-01-02', '2025-01-01', '2025-01-02', '2025-01-02', '2025-01-01')):
+                append_trinfo_record({'username': 'amy', 'date': day, 'seq': i})
+            full = client.get('/api/trinfo').get_json()['data']
+            paged = page_all('/api/trinfo?limit=2', lambda r: r.get_json()['data'], lambda r: r.get_json()['next_cursor'])
+            self.assertEqual(paged, full)
+            self.assertEqual([r['seq'] for r in paged], [1, 4, 0, 2, 3])
+
+        for url in ('/api/tracking_data', '/api/appointments', '/api/trinfo'):
+            self.assertEqual(client.get(url + '?cursor=not-a-cursor').status_code, 400)
+
+    def test_tracking_v2_projects_rows_without_loading_models(self):
+        import json
+        store = Location(name='A', location_name='A', location_username='a', location_password='x')
+        db.session.add(store)
+        db.session.commit()
+        admin = User(name='Admin', email='boss@example.com', username='boss', password='x', role='admin')
+        db.session.add(admin)
+        for day in (2, 1, 3):
+            db.session.add(server.TrackingData(user_id=self.user.id, location_id=store.id, date=date(2025, 1, day),
+                                               opal_demos=day, net_sales=10.5 * day, hours_worked=4))
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin.id
+        v1 = sorted(client.get('/api/tracking_data').get_json(), key=lambda r: (r['date'], r['id']))
+
+        loaded = []
+        record = lambda target, context: loaded.append(target)
+        db.event.listen(server.TrackingData, 'load', record)
+        try:
+            rows = client.get('/api/tracking_data?v=2')
+            columnar = client.get('/api/tracking_data?v=2&layout=columnar&fields=id,date,net_sales').get_json()
+            streamed = client.get('/api/tracking_data?v=2&fields=id,opal_demos&format=ndjson')
+        finally:
+            db.event.remove(server.TrackingData, 'load', record)
+        self.assertEqual(loaded, [])
+
+        body = rows.get_json()
+        self.assertEqual((body['v'], body['layout'], body['count'], body['fields']),
+                         (2, 'rows', 3, list(server.TRACKING_V2_FIELDS)))
+        self.assertEqual(body['data'], [{f: r[f] for f in server.TRACKING_V2_FIELDS} for r in v1])
+        self.assertLess(len(rows.data), len(json.dumps(v1)))
+        self.assertEqual(columnar['data'], {'id': [r['id'] for r in v1], 'date': [r['date'] for r in v1],
+                                            'net_sales': [r['net_sales'] for r in v1]})
+        self.assertEqual([json.loads(line) for line in streamed.get_data(as_text=True).splitlines()],
+                         [{'id': r['id'], 'opal_demos': r['opal_demos']} for r in v1])
+        self.assertEqual(client.get('/api/tracking_data?v=2&fields=id,password').status_code, 400)
+
+    def test_session_auth_snapshot_until_revoked(self):
+        from werkzeug.security import generate_password_hash
+        server._auth_revocations.clear()
+        server._auth_revocation_state.update(last_id=0, checked_at=None)
+        self.user.password = generate_password_hash('pw')
+        db.session.commit()
+        client = app.test_client()
+        self.assertEqual(client.post('/api/login', json={'username': 'testuser', 'password': 'pw'}).status_code, 200)
+
+        # A revocation that is rolled back leaves the snapshot valid
+        revoke_auth('user', self.user)
+        db.session.rollback()
+        self.assertEqual(client.get('/api/check-auth').status_code, 200)
+
+        self.user.is_active = False
+        revoke_auth('user', self.user)
+        db.session.commit()
+        self.assertEqual(client.get('/api/check-auth').status_code, 401)
+
+        # Recreated tables reuse ids; snapshots issued before them are reloaded, not trusted
+        self.user.is_active = True
+        revoke_auth('user', self.user)
+        db.session.commit()
+        self.assertEqual(client.post('/api/login', json={'username': 'testuser', 'password': 'pw'}).status_code, 200)
+        server._auth_revocation_state['checked_at'] = None
+        self.assertEqual(client.get('/api/check-auth').status_code, 200)
+        self.assertGreater(server._auth_revocation_state['last_id'], 1)
+        user_id = self.user.id
+        with client.session_transaction() as sess:
+            sess['auth']['user']['v'] = 10 ** 6
+        self.assertEqual(client.post('/api/setup').status_code, 200)
+        server._auth_revocations.clear()
+        server._auth_revocation_state['checked_at'] = None
+        self.assertEqual(client.get('/api/check-auth').status_code, 200)
+        self.assertEqual(server._auth_revocation_state['last_id'], 1)
+        with client.session_transaction() as sess:
+            self.assertEqual(sess['auth']['user']['v'], db.session.get(server.User, user_id).auth_version)
+
 
 if __name__ == '__main__':
     unittest.main()